@@ -3,6 +3,8 @@ import os
 import numpy as np
 import pandas as pd
 
+from utils.corpus_store import save_corpus
+from utils.embedding_cache import EmbeddingCache
 from utils.etc_functions import load_env_vars
 from wrappers.openai_wrappers import OpenAI_Embedding
 
@@ -13,6 +15,12 @@ CATEGORY = "cs"
 FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_ROOT = os.path.join(FILE_DIR, "data", CATEGORY)
 DATA_PATH = os.path.join(DATA_ROOT, "arxiv_metadata.pkl")
+CORPUS_DIR = os.path.join(DATA_ROOT, "corpus")
+# Abstracts that were embedded before are taken from here instead of the API
+CACHE_DIR = os.path.join(FILE_DIR, "data", "embedding_cache")
+# Keep a few chunks in flight, but stay below the tokens per minute limit of your OpenAI tier
+MAX_CONCURRENT_REQUESTS = 8
+TOKENS_PER_MINUTE = 1_000_000
 
 if __name__ == "__main__":
     df: pd.DataFrame = pd.read_pickle(DATA_PATH)
@@ -21,6 +29,9 @@ if __name__ == "__main__":
         embedding_model="text-embedding-3-large",
         max_chunks_per_call=2048,
         dim=256,
+        cache=EmbeddingCache(CACHE_DIR),
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        tokens_per_minute=TOKENS_PER_MINUTE,
     )
 
     abstracts = df["abstract"].tolist()
@@ -28,7 +39,6 @@ if __name__ == "__main__":
 
     # Convert embeddings to np.float16 to save space, they should not loose too much information
     # But if you want to be sure, you can use np.float32, but its twice the space requirement
-    embeddings = [np.array(e, dtype=np.float16) for e in embeddings]
-    df["abstract_embedding"] = embeddings
+    embeddings = np.array(embeddings, dtype=np.float16)
 
-    df.to_pickle(os.path.join(DATA_ROOT, "arxiv_metadata_with_embeddings.pkl"))
+    save_corpus(df, CORPUS_DIR, embeddings)
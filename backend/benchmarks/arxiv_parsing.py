@@ -0,0 +1,145 @@
+# Compares the streaming arXiv response parser with the previous xmltodict parser
+# Run from the backend folder with: python -m benchmarks.arxiv_parsing
+import argparse
+import datetime
+import glob
+import os
+import re
+import time
+
+import xmltodict
+
+from utils.arxiv_functions import lint_text, parse_arxiv_response
+
+FILE_DIR = os.path.dirname(os.path.realpath(__file__))
+FIXTURE_DIR = os.path.join(FILE_DIR, "fixtures")
+
+
+def legacy_format_documents(documents: list[dict]) -> list[dict]:
+    # each doc as the following format
+    # url: The URL to the arXiv page, may end with v1, v2, etc. Helps to see if the paper has been updated.
+    # title: The title of the paper.
+    # arxiv_id: The arXiv ID of the paper. without the version number.
+    # published: The date the paper was published.
+    # updated: The date the paper was last updated.
+    # abstact: The abstract of the paper.
+    # main_category: The main category of the paper.
+    # categories: The categories of the paper.
+    # authors: a list of authors of the paper.
+    # journal_ref: The journal reference of the paper if available.
+    # doi: The DOI of the paper if available.
+    # arxiv_Comment: The comment of the paper if available.
+    # arxiv_DOI: The DOI used by DataCite if available.
+    formatted_docs = []
+
+    for document in documents:
+        try:
+            formatted_doc = {}
+            # strip the version number from the id
+            # TODO: Handle revision over 9
+            formatted_doc["title"] = lint_text(document["title"])
+            formatted_doc["arxiv_id"] = document["id"].split("/")[-1].split("v")[0]
+            formatted_doc["abstract"] = lint_text(document["summary"])
+            formatted_doc["main_category"] = document["arxiv:primary_category"]["@term"]
+            formatted_doc["revision"] = int(
+                document["id"].split("/")[-1].split("v")[-1]
+            )
+            formatted_doc["published"] = datetime.datetime.strptime(
+                document["published"],
+                "%Y-%m-%dT%H:%M:%SZ",
+            )
+            formatted_doc["updated"] = datetime.datetime.strptime(
+                document["updated"],
+                "%Y-%m-%dT%H:%M:%SZ",
+            )
+
+            # handle the case where there is only one category
+            cat = document["category"]
+            if type(cat) == dict:
+                cat = [cat]
+
+            formatted_doc["categories"] = [category["@term"] for category in cat]
+
+            # format the author list as First Letter of the first name. Last name
+            if type(document["author"]) == dict:
+                document["author"] = [document["author"]]
+            formatted_doc["authors"] = [author["name"] for author in document["author"]]
+            formatted_doc["authors"] = [
+                author.split(" ")[0][0] + ". " + author.split(" ")[-1]
+                for author in formatted_doc["authors"]
+            ]
+
+            formatted_doc["journal_ref"] = document.get("arxiv:journal_ref", None)
+            if formatted_doc["journal_ref"]:
+                formatted_doc["journal_ref"] = formatted_doc["journal_ref"]["#text"]
+            formatted_doc["doi"] = document.get("arxiv:doi", None)
+            if formatted_doc["doi"]:
+                formatted_doc["doi"] = formatted_doc["doi"]["#text"]
+            formatted_doc["arxiv_comment"] = document.get("arxiv:comment", None)
+            if formatted_doc["arxiv_comment"]:
+                formatted_doc["arxiv_comment"] = formatted_doc["arxiv_comment"]["#text"]
+            formatted_doc["arxiv_DOI"] = document.get("arxiv:doi", None)
+            if formatted_doc["arxiv_DOI"]:
+                formatted_doc["arxiv_DOI"] = formatted_doc["arxiv_DOI"]["#text"]
+
+            formatted_docs.append(formatted_doc)
+        except Exception as e:
+            print(e)
+            continue
+
+    return formatted_docs
+
+
+def legacy_parse_arxiv_response(response: bytes) -> list[dict]:
+    res_dict = xmltodict.parse(response)
+    if "entry" not in res_dict["feed"]:
+        return []
+
+    documents = res_dict["feed"]["entry"]
+    if not isinstance(documents, list):
+        documents = [documents]
+
+    return legacy_format_documents(documents)
+
+
+def scale_response(response: bytes, num_entries: int) -> bytes:
+    # repeat the recorded entries to get a response of the size the crawler requests
+    text = response.decode("utf-8")
+    entries = re.findall(r"<entry>.*?</entry>", text, flags=re.DOTALL)
+    head = text[: text.index("<entry>")]
+    tail = text[text.rindex("</entry>") + len("</entry>") :]
+    body = "".join(entries[i % len(entries)] for i in range(num_entries))
+    return (head + body + tail).encode("utf-8")
+
+
+def time_per_entry(fn, response: bytes, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        num_entries = len(fn(response))
+    return (time.perf_counter() - start) / (repeats * num_entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=400)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'fixture':>28} | {'xmltodict [us/entry]':>20} | {'streaming [us/entry]':>20} | {'speedup':>8}"
+    )
+    for fixture_path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.xml"))):
+        with open(fixture_path, "rb") as f:
+            response = scale_response(f.read(), args.entries)
+
+        # both parsers have to agree before their speed is worth comparing
+        if legacy_parse_arxiv_response(response) != parse_arxiv_response(response):
+            raise ValueError(f"Parsers disagree on {fixture_path}")
+
+        legacy_time = time_per_entry(
+            legacy_parse_arxiv_response, response, args.repeats
+        )
+        streaming_time = time_per_entry(parse_arxiv_response, response, args.repeats)
+        print(
+            f"{os.path.basename(fixture_path):>28} | {legacy_time * 1e6:>20.1f} | {streaming_time * 1e6:>20.1f} | {legacy_time / streaming_time:>7.2f}x"
+        )
@@ -0,0 +1,99 @@
+# Compares fetching all top_k abstracts with fetching ids first and loading only the top_n hits
+# Run from the backend folder with: python -m benchmarks.deferred_hydration
+import argparse
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from utils.chroma_functions import hydrate_candidates, query_chroma_collection
+from utils.query_functions import build_documents, process_results, select_results
+
+DIM = 256
+
+
+def build_collection(chroma_dir: str, num_docs: int) -> chromadb.Collection:
+    client = chromadb.PersistentClient(chroma_dir)
+    collection = client.create_collection("arxiv_bench")
+    rng = np.random.default_rng(42)
+    embeddings = rng.standard_normal((num_docs, DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    for start in range(0, num_docs, 1000):
+        ids = [f"{i:07d}" for i in range(start, min(start + 1000, num_docs))]
+        collection.add(
+            ids=ids,
+            embeddings=embeddings[start : start + len(ids)],
+            # roughly the length of an arXiv abstract
+            documents=[
+                f"Abstract of paper {id}. " + "lorem ipsum " * 100 for id in ids
+            ],
+            metadatas=[
+                {
+                    "title": f"Paper {id}",
+                    "year": 2020,
+                    "month": 1,
+                    "day": 1,
+                    "authors": "A. Author;B. Author;C. Author",
+                    "journal_ref": "-",
+                    "doi": "-",
+                    "categories": "cs.LG;cs.AI",
+                    "main_category": "cs.LG",
+                }
+                for id in ids
+            ],
+        )
+    return collection
+
+
+def full_fetch(collection, query_embeddings, top_k, top_n):
+    candidates = query_chroma_collection([""], collection, top_k, query_embeddings)
+    return process_results(candidates, top_n)
+
+
+def deferred_fetch(collection, query_embeddings, top_k, top_n):
+    candidates = query_chroma_collection(
+        [""], collection, top_k, query_embeddings, include_documents=False
+    )
+    idxs, scores = select_results(candidates, top_n)
+    hydrate_candidates(collection, candidates, idxs)
+    return build_documents(candidates, idxs, scores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-docs", type=int, default=20000)
+    parser.add_argument("--top-k", type=int, default=400)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as chroma_dir:
+        collection = build_collection(chroma_dir, args.num_docs)
+        rng = np.random.default_rng(0)
+        queries = rng.standard_normal((args.repeats, DIM)).astype(np.float32)
+
+        times = {}
+        equal = True
+        for name, fn in [("full", full_fetch), ("deferred", deferred_fetch)]:
+            start = time.perf_counter()
+            results = [
+                fn(collection, [query.tolist()], args.top_k, args.top_n)
+                for query in queries
+            ]
+            times[name] = (time.perf_counter() - start) / args.repeats
+            if name == "full":
+                full_results = results
+            else:
+                equal = all(
+                    [doc.model_dump() for doc in a] == [doc.model_dump() for doc in b]
+                    for a, b in zip(full_results, results)
+                )
+
+    print(
+        f"Docs: {args.num_docs}, top_k: {args.top_k}, top_n: {args.top_n}, repeats: {args.repeats}"
+    )
+    print(f"full fetch:     {times['full'] * 1000:.2f} ms")
+    print(f"deferred fetch: {times['deferred'] * 1000:.2f} ms")
+    print(f"speedup:        {times['full'] / times['deferred']:.1f}x")
+    print(f"equal results:  {equal}")
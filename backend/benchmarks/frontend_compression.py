@@ -0,0 +1,126 @@
+# Compares the compression stage of generate_frontend_files.py with compressing one file after another
+# Run from the backend folder with: python -m benchmarks.frontend_compression
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+import brotli
+import zstandard
+
+from benchmarks.frontend_export import build_corpus, read_bytes
+from benchmarks.map_bundle import build_similarities
+from generate_frontend_files import (
+    COLUMNS,
+    SUBSETS,
+    generate_formatted_data,
+    generate_formatted_similarities,
+    save_data,
+    save_similarities,
+)
+from utils.compression import BROTLI_QUALITY, compress_files
+
+DECOMPRESS = {
+    "br": brotli.decompress,
+    "gz": gzip.decompress,
+    "zst": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+def legacy_compress_file(path: str) -> None:
+    # the function generate_frontend_files.py used before
+    with open(path, "rb") as f:
+        compressed = brotli.compress(f.read(), mode=brotli.MODE_TEXT)
+        with open(path + ".br", "wb") as f2:
+            f2.write(compressed)
+
+
+def build_subsets(data_dir: str, num_papers: int) -> list[str]:
+    # the subsets differ in size like the real ones
+    paths = []
+    for i, subset in enumerate(SUBSETS):
+        subset_papers = num_papers // (i + 1)
+        data = build_corpus(os.path.join(data_dir, subset, "corpus"), subset_papers)
+        values, idxs = build_similarities(subset_papers)
+        tsv_path = os.path.join(data_dir, f"{subset}.tsv")
+        txt_path = os.path.join(data_dir, f"{subset}.txt")
+        save_data(generate_formatted_data(data, COLUMNS), tsv_path, COLUMNS)
+        save_similarities(generate_formatted_similarities(values, idxs), txt_path)
+        paths += [tsv_path, txt_path]
+    return paths
+
+
+def check_variants(paths: list[str]) -> list[str]:
+    errors = []
+    for path in paths:
+        original = read_bytes(path)
+        for encoding, decompress in DECOMPRESS.items():
+            if decompress(read_bytes(f"{path}.{encoding}")) != original:
+                errors.append(f"{os.path.basename(path)}.{encoding}")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-papers", type=int, default=20000)
+    parser.add_argument("--brotli-quality", type=int, default=BROTLI_QUALITY)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = build_subsets(tmp_dir, args.num_papers)
+        total_size = sum(os.path.getsize(path) for path in paths)
+
+        start = time.perf_counter()
+        for path in paths:
+            legacy_compress_file(path)
+        legacy_time = time.perf_counter() - start
+        legacy_br = {path: read_bytes(path + ".br") for path in paths}
+        legacy_size = sum(len(data) for data in legacy_br.values())
+
+        runs = {}
+        start = time.perf_counter()
+        compressed = compress_files(
+            paths, tmp_dir, brotli_quality=args.brotli_quality, workers=args.workers
+        )
+        runs["first run"] = (time.perf_counter() - start, len(compressed))
+        errors = check_variants(paths)
+        same_br = all(read_bytes(path + ".br") == legacy_br[path] for path in paths)
+
+        start = time.perf_counter()
+        compressed = compress_files(
+            paths, tmp_dir, brotli_quality=args.brotli_quality, workers=args.workers
+        )
+        runs["unchanged"] = (time.perf_counter() - start, len(compressed))
+
+        with open(paths[-1], "a") as f:
+            f.write("\n")
+        start = time.perf_counter()
+        compressed = compress_files(
+            paths, tmp_dir, brotli_quality=args.brotli_quality, workers=args.workers
+        )
+        runs["one changed"] = (time.perf_counter() - start, len(compressed))
+        errors += check_variants(paths[-1:])
+
+        sizes = {
+            encoding: sum(os.path.getsize(f"{path}.{encoding}") for path in paths)
+            for encoding in DECOMPRESS
+        }
+
+    print(
+        f"Files: {len(paths)}, {total_size / 1e6:.1f} MB, brotli quality {args.brotli_quality}, "
+        f"workers: {args.workers or os.cpu_count()}"
+    )
+    print(f"{'':>12} | {'time [s]':>8} | {'compressed':>10}")
+    print(f"{'legacy br':>12} | {legacy_time:>8.2f} | {len(paths):>10}")
+    for name, (seconds, count) in runs.items():
+        print(f"{name:>12} | {seconds:>8.2f} | {count:>10}")
+    print(
+        "sizes: "
+        + ", ".join(
+            f"{encoding} {size / 1e6:.2f} MB" for encoding, size in sizes.items()
+        )
+    )
+    print(f"legacy br (quality 11) {legacy_size / 1e6:.2f} MB, identical: {same_br}")
+    print("decompressed variants: " + ("ok" if not errors else ", ".join(errors)))
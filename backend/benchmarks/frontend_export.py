@@ -0,0 +1,140 @@
+# Compares the column-wise TSV export of generate_frontend_files.py with the previous row-wise one
+# Run from the backend folder with: python -m benchmarks.frontend_export
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from generate_frontend_files import COLUMNS, generate_formatted_data, save_data
+from utils.corpus_store import load_metadata, save_metadata
+
+
+def build_corpus(corpus_dir: str, num_papers: int) -> pd.DataFrame:
+    # written and read through the corpus store, so the dtypes are the ones of the real export
+    rng = np.random.default_rng(42)
+    titles = np.array(
+        [
+            "A study of {}",
+            "On the {} with\na line break",
+            "Tabs\tin {}",
+            "N/A",
+            "None",
+            "Ünïcödé {} – résumé",
+        ]
+    )
+    journal_refs = np.array(["Phys. Rev. B 12, 345 (2020)", None, "N/A", "nan", ""])
+    df = pd.DataFrame(
+        {
+            "arxiv_id": [f"2101.{i:05d}" for i in range(num_papers)],
+            "authors": [
+                [f"Author {a}" for a in rng.integers(0, 50000, rng.integers(1, 8))]
+                + ([":. :"] if i % 97 == 0 else [])
+                for i in range(num_papers)
+            ],
+            "title": [
+                template.format(i)
+                for i, template in enumerate(rng.choice(titles, num_papers))
+            ],
+            "main_category": rng.choice(["cs.LG", "cs.AI", "hep-th"], num_papers),
+            "journal_ref": rng.choice(journal_refs, num_papers),
+            "x_umap": rng.random(num_papers).astype(np.float32),
+            "y_umap": rng.random(num_papers),
+        }
+    )
+    save_metadata(df, corpus_dir)
+    return load_metadata(corpus_dir)
+
+
+def legacy_generate_formatted_data(
+    data: pd.DataFrame,
+    columns: list[str],
+) -> list[list]:
+    # this is the implementation generate_frontend_files.py used to have
+    def format_list(l: list) -> str:
+        return (
+            ";".join(l)
+            .replace(":. :;", "")
+            .replace(" ", "")
+            .replace("\n", " ")
+            .replace("\t", " ")
+        )
+
+    def format_string(s: str | None) -> str:
+        if s is None:
+            return "-"
+        fs = s.replace("\n", " ").replace("\t", " ")
+        if fs == "None" or fs == "nan" or fs == "N/A":
+            fs = "-"
+        return fs
+
+    formatted_data = []
+    for _, data_point in data.iterrows():
+
+        formatted_list = []
+
+        for column in columns:
+            value = data_point[column]
+            if isinstance(value, list):
+                formatted_list.append(format_list(value))
+            elif isinstance(value, str):
+                formatted_list.append(format_string(value))
+            else:
+                formatted_list.append(value)
+
+        formatted_list.append(round(data_point["x_umap"], 5))
+        formatted_list.append(round(data_point["y_umap"], 5))
+
+        formatted_data.append(formatted_list)
+    return formatted_data
+
+
+def legacy_save_data(
+    data: list[list],
+    path: str,
+    columns: list[str],
+) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\t".join(columns + ["x", "y"]) + "\n")
+        for line in data:
+            write_str = "\t".join(
+                [str(x).replace("\n", " ").replace("\t", " ") for x in line]
+            )
+            file.write(write_str + "\n")
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-papers", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data = build_corpus(os.path.join(tmp_dir, "corpus"), args.num_papers)
+        legacy_path = os.path.join(tmp_dir, "legacy.tsv")
+        path = os.path.join(tmp_dir, "export.tsv")
+
+        start = time.perf_counter()
+        legacy_save_data(
+            legacy_generate_formatted_data(data, COLUMNS), legacy_path, COLUMNS
+        )
+        legacy_format_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        save_data(generate_formatted_data(data, COLUMNS), path, COLUMNS)
+        format_time = time.perf_counter() - start
+
+        tsv_equal = read_bytes(legacy_path) == read_bytes(path)
+
+    print(f"Papers: {args.num_papers}")
+    print(f"{'':>16} | {'row-wise [s]':>12} | {'column-wise [s]':>15} | {'speedup':>7}")
+    print(
+        f"{'tsv':>16} | {legacy_format_time:>12.2f} | {format_time:>15.2f} | {legacy_format_time / format_time:>6.1f}x"
+    )
+    print(f"identical tsv: {tsv_equal}")
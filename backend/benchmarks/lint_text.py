@@ -0,0 +1,119 @@
+# Checks lint_text against the golden file and compares its speed with the previous implementation
+# Run from the backend folder with: python -m benchmarks.lint_text
+import argparse
+import json
+import os
+import re
+import time
+
+from utils.arxiv_functions import lint_text
+
+FILE_DIR = os.path.dirname(os.path.realpath(__file__))
+GOLDEN_PATH = os.path.join(
+    FILE_DIR, "..", "tests", "fixtures", "lint_text_golden.jsonl"
+)
+
+
+def legacy_lint_text(string: str) -> str:
+    string = string.replace("\r\n", " ")
+    string = string.replace("\xa0", " ")
+    string = string.replace("\n", " ")
+    string = string.replace("—", "-")
+    string = string.replace("–", "-")
+    string = string.replace("…", "...")
+    string = string.replace("’", "'")
+    string = string.replace("”", "'")
+    string = string.replace("“", "'")
+
+    string = re.sub(r"\b([A-Za-z0-9]+) \{\}", r"{\1}", string)
+    string = string.replace("{}", "")
+    string = string.encode("utf-8", "ignore").decode("utf-8")
+    string = string.replace("\\sim", "~")
+    string = string.replace("\\times", "x")
+    string = string.replace(" .", ".")
+    string = string.replace(" ,", ",")
+
+    string = re.sub(r"\\label{.*?}", "", string)
+    string = re.sub(r"\\begin{equation}", "$", string)
+    string = re.sub(r"\\end{equation}", "$", string)
+    string = re.sub(r"\\begin{equation\*}", "$", string)
+    string = re.sub(r"\\end{equation\*}", "$", string)
+    string = re.sub(r"\\FLP", "", string)
+    string = re.sub(r"\\\\\[.*?]", "", string)
+    string = re.sub(r"\\biggl", " ", string)
+    string = re.sub(r"\\biggr", " ", string)
+    string = re.sub(r"\\Biggl", " ", string)
+    string = re.sub(r"\\Biggr", " ", string)
+    string = re.sub(r"\\tfrac", r"\\frac", string)
+    string = re.sub(r"\\notag", "", string)
+    string = re.sub(r"\\\\", " ", string)
+
+    string = re.sub(r"\\;", " ", string)
+    string = re.sub(r"\\,", " ", string)
+    string = re.sub(r"\\:", " ", string)
+    string = re.sub(r"\\!", " ", string)
+    string = re.sub(r"\\quad", " ", string)
+
+    string = re.sub(r"\\([a-zA-Z])op", r"\\hat{\1}", string)
+    string = re.sub(r"\\([a-zA-Z])dotop", r"\\hat{\\dot{\1}}", string)
+
+    string = re.sub(r"\\expval{(.*?)}", r"\\braket{\1}", string)
+    string = re.sub(r"\\av{(.*?)}", r"\\bar{\1}", string)
+    string = re.sub(r"\\abs{(.*?)}", r"|\1|", string)
+
+    string = re.sub(r"\\ketsl{(.*?)}", r"\\ket{\1}", string)
+    string = re.sub(r"\\barsl{(.*?)}", r"\\bar{\1}", string)
+    string = re.sub(r"\\slOne", "1", string)
+    string = re.sub(r"\\slTwo", "2", string)
+
+    # find all \\ddp{SOMETEXT}{TEXT} and replace them with \\frac{\\partial SOMETEXT}{\\partial TEXT}
+    string = re.sub(
+        r"\\ddp{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
+    )
+    string = re.sub(
+        r"\\ddpl{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
+    )
+    string = re.sub(r"\\ddt{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
+    string = re.sub(r"\\ddtl{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
+
+    # condense all whitespace to a single space
+    string = re.sub(r"\s+", " ", string)
+
+    return string
+
+
+def load_golden(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def abstracts_per_second(fn, abstracts: list[str], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for abstract in abstracts:
+            fn(abstract)
+    return repeats * len(abstracts) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    golden = load_golden(GOLDEN_PATH)
+    mismatches = [case for case in golden if lint_text(case["input"]) != case["output"]]
+    if mismatches:
+        raise ValueError(f"{len(mismatches)} of {len(golden)} golden cases differ")
+    print(f"All {len(golden)} golden cases match")
+
+    abstracts = [case["input"] for case in golden]
+    plain_abstracts = [abstract for abstract in abstracts if "\\" not in abstract]
+    print(
+        f"{'corpus':>10} | {'previous [1/s]':>14} | {'compiled [1/s]':>14} | {'speedup':>8}"
+    )
+    for name, corpus in [("golden", abstracts), ("no LaTeX", plain_abstracts)]:
+        legacy_rate = abstracts_per_second(legacy_lint_text, corpus, args.repeats)
+        compiled_rate = abstracts_per_second(lint_text, corpus, args.repeats)
+        print(
+            f"{name:>10} | {legacy_rate:>14.0f} | {compiled_rate:>14.0f} | {compiled_rate / legacy_rate:>7.1f}x"
+        )
@@ -0,0 +1,295 @@
+# Load tests the /query endpoint against local stub servers for the OpenAI and Cohere APIs
+# Run from the backend folder with: python -m benchmarks.load_test_query
+# No API keys are needed and all data is written to a temporary directory
+import argparse
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+STUB_DIM = 256
+STUB_HOST = "127.0.0.1"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((STUB_HOST, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 120.0) -> None:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            socket.create_connection((STUB_HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Server on port {port} did not start in {timeout}s")
+
+
+def stub_app(latency: float):
+    # mimics the two upstream endpoints with a fixed latency
+    from fastapi import FastAPI, Request
+
+    app = FastAPI()
+    calls = {"embeddings": 0, "embedded_texts": 0, "rerank": 0}
+
+    @app.get("/calls")
+    async def get_calls():
+        return calls
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        calls["embeddings"] += 1
+        calls["embedded_texts"] += len(body["input"])
+        await asyncio.sleep(latency)
+        data = []
+        for i, text in enumerate(body["input"]):
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(STUB_DIM)
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": (vector / np.linalg.norm(vector)).tolist(),
+                }
+            )
+        return {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.post("/v1/rerank")
+    async def rerank(request: Request):
+        body = await request.json()
+        calls["rerank"] += 1
+        await asyncio.sleep(latency)
+        scores = np.random.default_rng().random(len(body["documents"]))
+        return {
+            "id": "stub",
+            "results": [
+                {"index": int(i), "relevance_score": float(scores[i])}
+                for i in np.argsort(-scores)
+            ],
+            "meta": {},
+        }
+
+    return app
+
+
+def legacy_app(main):
+    # the previous sync handler, it holds a threadpool worker for the whole request
+    from fastapi import FastAPI
+
+    from utils.app_dataclasses import Query
+    from utils.chroma_functions import query_chroma_collection
+    from utils.query_functions import process_results, rerank_results
+
+    app = FastAPI()
+
+    @app.post("/query")
+    def run_query(query: Query):
+        collection = main.collection_registry.chroma_client.get_collection(
+            name="arxiv_" + query.category,
+            embedding_function=main.embedding_fn,
+        )
+        candidates = query_chroma_collection(
+            collection=collection,
+            queries=[query.query],
+            top_k=query.top_k,
+        )
+        if query.use_rerank:
+            candidates = rerank_results(
+                query=query.query,
+                candidates=candidates,
+                reranker=main.reranker,
+            )
+        return process_results(
+            candidates=candidates,
+            top_n=query.top_n,
+            rerank_score_threshold=query.rerank_score_threshold,
+        )
+
+    return app
+
+
+def run_stub_server(port: int, latency: float) -> None:
+    import uvicorn
+
+    uvicorn.run(stub_app(latency), host=STUB_HOST, port=port, log_level="warning")
+
+
+def run_query_server(endpoint: str, port: int, stub_port: int, num_docs: int) -> None:
+    # every server gets its own process and data folder, so they never share the GIL or a database
+    import uvicorn
+
+    # both SDKs read their base URL from the environment when the clients are created
+    os.environ["OPENAI_BASE_URL"] = f"http://{STUB_HOST}:{stub_port}/v1"
+    os.environ["CO_API_URL"] = f"http://{STUB_HOST}:{stub_port}"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["COHERE_API_KEY"] = "stub"
+
+    # the stub servers do not need the keys from the .env file
+    import utils.etc_functions
+
+    utils.etc_functions.load_env_vars = lambda: None
+
+    import main
+
+    fill_collection(main.collection_registry.chroma_client, main.embedding_fn, num_docs)
+    app = main.app if endpoint == "async" else legacy_app(main)
+    uvicorn.run(app, host=STUB_HOST, port=port, log_level="warning")
+
+
+def fill_collection(chroma_client, embedding_fn, num_docs: int) -> None:
+    collection = chroma_client.get_or_create_collection(
+        name="arxiv_stub",
+        embedding_function=embedding_fn,
+    )
+    rng = np.random.default_rng(42)
+    embeddings = rng.standard_normal((num_docs, STUB_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    for start in range(0, num_docs, 1000):
+        ids = [f"{i:07d}" for i in range(start, min(start + 1000, num_docs))]
+        collection.upsert(
+            ids=ids,
+            embeddings=embeddings[start : start + len(ids)],
+            documents=[f"Abstract of paper {id}" for id in ids],
+            metadatas=[
+                {
+                    "title": f"Paper {id}",
+                    "year": 2020,
+                    "month": 1,
+                    "day": 1,
+                    "authors": "A. Author;B. Author",
+                    "journal_ref": "-",
+                    "doi": "-",
+                    "categories": "cs.LG",
+                    "main_category": "cs.LG",
+                }
+                for id in ids
+            ],
+        )
+
+
+async def run_load(
+    url: str,
+    num_requests: int,
+    concurrency: int,
+    use_rerank: bool,
+    top_k: int,
+) -> tuple[np.ndarray, float, int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(client: httpx.AsyncClient, i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            # every query is unique, so the embedding cache never helps
+            response = await client.post(
+                url,
+                json={
+                    "query": f"load test query {i} {time.time_ns()}",
+                    "category": "stub",
+                    "top_k": top_k,
+                    "use_rerank": use_rerank,
+                },
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[send(client, i) for i in range(num_requests)])
+        duration = time.perf_counter() - start
+    return np.array(latencies), duration, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--upstream-latency", type=float, default=0.3)
+    parser.add_argument("--num-docs", type=int, default=20000)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--no-rerank", action="store_true")
+    parser.add_argument(
+        "--endpoint", choices=["async", "legacy", "both"], default="both"
+    )
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    stub_port = free_port()
+    stub_process = context.Process(
+        target=run_stub_server,
+        args=(stub_port, args.upstream_latency),
+        daemon=True,
+    )
+    stub_process.start()
+    processes = [stub_process]
+    wait_for_port(stub_port)
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    endpoints = ["async", "legacy"] if args.endpoint == "both" else [args.endpoint]
+    urls = {}
+    for endpoint in endpoints:
+        port = free_port()
+        urls[endpoint] = f"http://{STUB_HOST}:{port}/query"
+        # main reads DATA_PATH on import, the child processes inherit it
+        os.environ["DATA_PATH"] = os.path.join(tmp_dir.name, endpoint)
+        process = context.Process(
+            target=run_query_server,
+            args=(endpoint, port, stub_port, args.num_docs),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+        wait_for_port(port)
+
+    print(
+        f"Docs: {args.num_docs}, top_k: {args.top_k}, rerank: {not args.no_rerank}, "
+        f"upstream latency: {args.upstream_latency * 1000:.0f} ms, requests: {args.requests}"
+    )
+    print(
+        f"{'endpoint':>8} | {'conc.':>5} | {'p50 [ms]':>9} | {'p99 [ms]':>9} | {'req/s':>7} | {'errors':>6} | {'embedding calls':>15}"
+    )
+    calls_url = f"http://{STUB_HOST}:{stub_port}/calls"
+    try:
+        for concurrency in args.concurrency:
+            for endpoint in endpoints:
+                # concurrent queries share embedding calls if they are batched
+                embedding_calls = httpx.get(calls_url).json()["embeddings"]
+                latencies, duration, errors = asyncio.run(
+                    run_load(
+                        urls[endpoint],
+                        args.requests,
+                        concurrency,
+                        not args.no_rerank,
+                        args.top_k,
+                    )
+                )
+                embedding_calls = (
+                    httpx.get(calls_url).json()["embeddings"] - embedding_calls
+                )
+                p50, p99 = np.percentile(latencies * 1000, [50, 99])
+                print(
+                    f"{endpoint:>8} | {concurrency:>5} | {p50:>9.1f} | {p99:>9.1f} | {args.requests / duration:>7.1f} | {errors:>6} | {embedding_calls:>15}"
+                )
+    finally:
+        for process in processes:
+            process.terminate()
+        tmp_dir.cleanup()
@@ -0,0 +1,146 @@
+# Checks that a map bundle round-trips the TSV and the similarity list of generate_frontend_files.py
+# and compares their sizes and load times
+# Run from the backend folder with: python -m benchmarks.map_bundle
+import argparse
+import os
+import tempfile
+import time
+
+import brotli
+import numpy as np
+
+from benchmarks.frontend_export import build_corpus, read_bytes
+from generate_frontend_files import (
+    BUNDLE_STRING_COLUMNS,
+    COLUMNS,
+    NUM_BEST_SIMS,
+    generate_formatted_data,
+    generate_formatted_similarities,
+    save_data,
+    save_map_bundle,
+    save_similarities,
+)
+from utils.map_bundle import MapBundle
+
+
+def build_similarities(num_papers: int) -> tuple[np.ndarray, np.ndarray]:
+    # the first column is the paper itself, like in best_idxs.npy
+    rng = np.random.default_rng(7)
+    idxs = rng.integers(0, num_papers, (num_papers, NUM_BEST_SIMS + 1))
+    idxs[:, 0] = np.arange(num_papers)
+    values = rng.uniform(-0.1, 1.0, (num_papers, NUM_BEST_SIMS + 1))
+    values[:, 0] = 1.0
+    values[::101, 1] = -0.0
+    return values.astype(np.float16), idxs
+
+
+def parse_tsv(path: str) -> dict[str, list[str]]:
+    # the way parseData of the frontend reads the TSV
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    header = lines[0].split("\t")
+    rows = [line.split("\t") for line in lines[1:] if line]
+    return {column: [row[i] for row in rows] for i, column in enumerate(header)}
+
+
+def parse_similarities(path: str) -> tuple[np.ndarray, np.ndarray]:
+    # the way parseConnectivityList of the frontend reads the similarities
+    with open(path, "r") as f:
+        lines = f.read().split("\n")
+    pairs = [[pair.split(",") for pair in line.split(";")] for line in lines]
+    idxs = np.array([[int(idx) for idx, _ in row] for row in pairs])
+    scores = np.array([[int(score) for _, score in row] for row in pairs])
+    return idxs, scores
+
+
+def check_round_trip(bundle: MapBundle, tsv: dict, idxs, scores) -> list[str]:
+    errors = []
+    for column in BUNDLE_STRING_COLUMNS:
+        if bundle.strings(column) != tsv[column]:
+            errors.append(f"{column} differs")
+    # a range in the middle, like a lazy load of the client
+    start, stop = len(bundle) // 3, len(bundle) // 3 + 100
+    if bundle.strings("title", start, stop) != tsv["title"][start:stop]:
+        errors.append("title range differs")
+    if bundle.main_categories() != tsv["main_category"]:
+        errors.append("main_category differs")
+
+    # half a quantization step plus the rounding of the TSV to 5 decimals
+    coordinates = bundle.coordinates()
+    tolerance = np.array(bundle.manifest["coordinate_span"]) / 65535 / 2 + 5e-6 + 1e-9
+    for i, column in enumerate(["x", "y"]):
+        error = np.abs(coordinates[:, i] - np.array(tsv[column], dtype=np.float64))
+        if np.any(error > tolerance[i]):
+            errors.append(f"{column} is off by {error.max():.2e}")
+
+    bundle_idxs, bundle_scores = bundle.neighbours()
+    if not np.array_equal(bundle_idxs, idxs):
+        errors.append("neighbour indices differ")
+    if not np.array_equal(bundle_scores, np.clip(scores, 0, 255)):
+        errors.append("neighbour scores differ")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-papers", type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data = build_corpus(os.path.join(tmp_dir, "corpus"), args.num_papers)
+        similarity_values, similarity_idxs = build_similarities(args.num_papers)
+        tsv_path = os.path.join(tmp_dir, "subset.tsv")
+        txt_path = os.path.join(tmp_dir, "subset.txt")
+        bundle_path = os.path.join(tmp_dir, "subset")
+
+        save_data(generate_formatted_data(data, COLUMNS), tsv_path, COLUMNS)
+        save_similarities(
+            generate_formatted_similarities(similarity_values, similarity_idxs),
+            txt_path,
+        )
+        start = time.perf_counter()
+        save_map_bundle(
+            data,
+            similarity_values,
+            similarity_idxs,
+            bundle_path,
+            BUNDLE_STRING_COLUMNS,
+        )
+        write_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tsv = parse_tsv(tsv_path)
+        idxs, scores = parse_similarities(txt_path)
+        text_time = time.perf_counter() - start
+
+        # what the map needs for the first render
+        start = time.perf_counter()
+        bundle = MapBundle(bundle_path)
+        bundle.coordinates()
+        bundle.section("main_category")
+        bundle.neighbours()[0].copy()
+        first_render_time = time.perf_counter() - start
+        sections = bundle.manifest["sections"]
+        first_render_bytes = sum(
+            sections[name]["length"]
+            for name in ["coordinates", "main_category", "neighbour_idxs"]
+        )
+
+        errors = check_round_trip(bundle, tsv, idxs, scores)
+
+        text_bytes = read_bytes(tsv_path) + read_bytes(txt_path)
+        bundle_bytes = read_bytes(bundle_path + ".bin")
+        sizes = {
+            "tsv + txt": (len(text_bytes), len(brotli.compress(text_bytes))),
+            "bundle": (len(bundle_bytes), len(brotli.compress(bundle_bytes))),
+        }
+
+    print(f"Papers: {args.num_papers}, bundle written in {write_time:.2f} s")
+    print(f"{'':>10} | {'raw [MB]':>8} | {'brotli [MB]':>11}")
+    for name, (raw, compressed) in sizes.items():
+        print(f"{name:>10} | {raw / 1e6:>8.2f} | {compressed / 1e6:>11.2f}")
+    print(
+        f"parse tsv + txt: {text_time * 1000:.0f} ms, "
+        f"bundle first render: {first_render_time * 1000:.1f} ms from {first_render_bytes / 1e6:.2f} MB"
+    )
+    print("round trip: " + ("ok" if not errors else ", ".join(errors)))
@@ -0,0 +1,111 @@
+# Checks the tile pyramid of generate_frontend_files.py and compares the first paint with loading all points
+# Run from the backend folder with: python -m benchmarks.map_tiles
+import argparse
+import os
+import tempfile
+import time
+
+import brotli
+import numpy as np
+
+from utils.map_bundle import normalize_coordinates
+from utils.map_tiles import (
+    TILE_QUALITY,
+    encode_tile,
+    load_tile_index,
+    read_tile,
+    tile_indices,
+    write_tiles,
+)
+
+CATEGORIES = ["cs.LG", "cs.AI", "cs.CV", "cs.CL", "stat.ML", "math.OC", "cs.RO"]
+
+
+def build_map(num_papers: int) -> tuple[np.ndarray, list[str]]:
+    # clusters of very different size and spread, like a UMAP of the papers
+    rng = np.random.default_rng(42)
+    num_clusters = 60
+    centers = rng.uniform(0, 1, (num_clusters, 2))
+    spreads = rng.uniform(0.002, 0.05, num_clusters)
+    weights = rng.pareto(1.2, num_clusters) + 0.05
+    clusters = rng.choice(num_clusters, num_papers, p=weights / weights.sum())
+    coordinates = (
+        centers[clusters]
+        + rng.standard_normal((num_papers, 2)) * spreads[clusters, None]
+    )
+    categories = np.array(CATEGORIES)[clusters % len(CATEGORIES)]
+    return coordinates, categories.tolist()
+
+
+def check_tiles(tile_dir: str, coordinates: np.ndarray, categories: list[str]):
+    index = load_tile_index(tile_dir)
+    codes = {name: code for code, name in enumerate(index["categories"])}
+    category_codes = np.array([codes[name] for name in categories])
+    normalized, _, span = normalize_coordinates(coordinates)
+
+    errors = []
+    seen = np.zeros(len(coordinates), dtype=np.int64)
+    levels = np.zeros(len(coordinates), dtype=np.int64)
+    for tile in index["tiles"]:
+        rows, tile_coordinates, tile_codes = read_tile(tile_dir, index, tile)
+        seen[rows] += 1
+        levels[rows] = tile["z"]
+        tolerance = np.array(span) / 2 ** tile["z"] / 65535 / 2 + 1e-12
+        if np.any(np.abs(tile_coordinates - coordinates[rows]) > tolerance):
+            errors.append(f"coordinates of tile {tile['z']}/{tile['x']}/{tile['y']}")
+        if not np.array_equal(tile_codes, category_codes[rows]):
+            errors.append(f"categories of tile {tile['z']}/{tile['x']}/{tile['y']}")
+    if np.any(seen != 1):
+        errors.append(f"{int(np.sum(seen != 1))} papers are not in exactly one tile")
+
+    # the papers shown at a level, the ones of all coarser levels included, fit into the tiles
+    for level in range(index["levels"] - 1):
+        tiles = tile_indices(normalized[levels <= level], level)
+        _, counts = np.unique(tiles, axis=0, return_counts=True)
+        if counts.max() > index["points_per_tile"]:
+            errors.append(f"level {level} has a tile with {counts.max()} papers")
+    return index, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-papers", type=int, default=200000)
+    parser.add_argument("--first-paint-level", type=int, default=2)
+    args = parser.parse_args()
+
+    coordinates, categories = build_map(args.num_papers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tile_dir = os.path.join(tmp_dir, "tiles")
+        start = time.perf_counter()
+        write_tiles(tile_dir, coordinates, categories)
+        write_time = time.perf_counter() - start
+        index, errors = check_tiles(tile_dir, coordinates, categories)
+
+    # the same encoding for all papers in one file, what the client needs without tiles
+    normalized, _, _ = normalize_coordinates(coordinates)
+    _, category_codes = np.unique(np.array(categories), return_inverse=True)
+    single_file = len(
+        brotli.compress(
+            encode_tile(np.arange(args.num_papers), normalized, category_codes),
+            quality=TILE_QUALITY,
+        )
+    )
+
+    print(
+        f"Papers: {args.num_papers}, {len(index['tiles'])} tiles on {index['levels']} levels, written in {write_time:.2f} s"
+    )
+    print(f"{'level':>5} | {'tiles':>5} | {'papers':>8} | {'size [KB]':>9}")
+    for level in range(index["levels"]):
+        tiles = [tile for tile in index["tiles"] if tile["z"] == level]
+        papers = sum(tile["count"] for tile in tiles)
+        size = sum(tile["bytes"] for tile in tiles)
+        print(f"{level:>5} | {len(tiles):>5} | {papers:>8} | {size / 1e3:>9.1f}")
+    first_paint = sum(
+        tile["bytes"] for tile in index["tiles"] if tile["z"] <= args.first_paint_level
+    )
+    total = sum(tile["bytes"] for tile in index["tiles"])
+    print(
+        f"first paint (levels 0-{args.first_paint_level}): {first_paint / 1e3:.1f} KB, "
+        f"all tiles: {total / 1e3:.1f} KB, all papers in one file: {single_file / 1e3:.1f} KB"
+    )
+    print("check: " + ("ok" if not errors else ", ".join(errors)))
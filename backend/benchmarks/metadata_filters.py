@@ -0,0 +1,139 @@
+# Compares filters pushed into the vector search with over-fetching top_k hits and filtering them afterwards
+# and with query_filtered_collection, which picks one of the two by the number of matching papers
+# Run from the backend folder with: python -m benchmarks.metadata_filters
+import argparse
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from utils.app_dataclasses import Query
+from utils.chroma_functions import query_chroma_collection, query_filtered_collection
+from utils.metadata_filter import FilterIndex
+from utils.vector_store import LocalVectorStore, write_collection
+
+DIM = 256
+CATEGORIES = ["cs.LG", "cs.AI", "cs.CV", "cs.CL", "stat.ML", "math.OC", "cs.RO"]
+
+FILTERS = {
+    "years 2023-2024": {"year_from": 2023},
+    "main cs.CV": {"main_category": "cs.CV"},
+    "stat.ML, 2020": {"categories": ["stat.ML"], "year_from": 2020, "year_to": 2020},
+    "author": {"author": "author 17"},
+    "since 2012": {"year_from": 2012},
+}
+
+
+def build_collections(tmp_dir: str, num_docs: int):
+    rng = np.random.default_rng(42)
+    embeddings = rng.standard_normal((num_docs, DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"{i:07d}" for i in range(num_docs)]
+    metadatas = []
+    for i in range(num_docs):
+        categories = rng.choice(CATEGORIES, rng.integers(1, 4), replace=False)
+        authors = rng.integers(0, 5000, rng.integers(1, 6))
+        metadatas.append(
+            {
+                "title": f"Paper {i}",
+                "year": int(rng.integers(2010, 2025)),
+                "month": int(rng.integers(1, 13)),
+                "day": 1,
+                "authors": ";".join(f"Author {a}" for a in authors),
+                "journal_ref": "-",
+                "doi": "-",
+                "categories": ";".join(categories),
+                "main_category": categories[0],
+            }
+        )
+    documents = [""] * num_docs
+
+    write_collection(
+        f"{tmp_dir}/store/arxiv_bench", ids, embeddings, documents, metadatas
+    )
+    local = LocalVectorStore(f"{tmp_dir}/store").get_collection("arxiv_bench")
+
+    chroma = chromadb.PersistentClient(f"{tmp_dir}/chroma").create_collection(
+        "arxiv_bench"
+    )
+    embeddings = embeddings.astype(np.float16).astype(np.float32)
+    for start in range(0, num_docs, 5000):
+        chroma.add(
+            ids=ids[start : start + 5000],
+            embeddings=embeddings[start : start + 5000],
+            metadatas=metadatas[start : start + 5000],
+        )
+    return {"chroma": chroma, "local": local}, FilterIndex(ids, metadatas)
+
+
+def over_fetch(collection, filter_index, query, embedding, top_k):
+    # the way users filter today: fetch top_k hits and drop the ones that do not match
+    candidates = query_chroma_collection(
+        [""], collection, top_k, [embedding], include_documents=False
+    )
+    matching = set(filter_index.matching_ids(query))
+    return [id for id in candidates.ids if id in matching][: query.top_n]
+
+
+def push_down(collection, filter_index, query, embedding, top_k):
+    candidates = query_chroma_collection(
+        [""],
+        collection,
+        query.top_n,
+        [embedding],
+        include_documents=False,
+        ids=filter_index.matching_ids(query),
+    )
+    return candidates.ids
+
+
+def filtered(collection, filter_index, query, embedding, top_k):
+    candidates = query_filtered_collection(
+        [""],
+        collection,
+        filter_index,
+        filter_index.mask(query),
+        query.top_n,
+        [embedding],
+        include_documents=False,
+    )
+    return candidates.ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-docs", type=int, default=50000)
+    parser.add_argument("--top-k", type=int, default=400)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        collections, filter_index = build_collections(tmp_dir, args.num_docs)
+        rng = np.random.default_rng(0)
+        embeddings = rng.standard_normal((args.repeats, DIM)).astype(np.float32)
+
+        print(
+            f"Docs: {args.num_docs}, over-fetch top_k: {args.top_k}, top_n: {args.top_n}"
+        )
+        print(
+            f"{'filter':>16} | {'matches':>7} | {'backend':>7} | {'over-fetch [ms]':>15} | {'hits':>5} | {'push-down [ms]':>14} | {'hits':>5} | {'filtered [ms]':>13} | {'hits':>5}"
+        )
+        for name, filters in FILTERS.items():
+            query = Query(query="", category="bench", top_n=args.top_n, **filters)
+            matches = int(filter_index.mask(query).sum())
+            for backend, collection in collections.items():
+                row = []
+                for fn in [over_fetch, push_down, filtered]:
+                    start = time.perf_counter()
+                    hits = [
+                        fn(collection, filter_index, query, e.tolist(), args.top_k)
+                        for e in embeddings
+                    ]
+                    row.append((time.perf_counter() - start) / args.repeats)
+                    # the average number of the top_n hits that were found
+                    row.append(np.mean([len(h) for h in hits]))
+                print(
+                    f"{name:>16} | {matches:>7} | {backend:>7} | {row[0] * 1000:>15.2f} | {row[1]:>5.1f} | {row[2] * 1000:>14.2f} | {row[3]:>5.1f} | {row[4] * 1000:>13.2f} | {row[5]:>5.1f}"
+                )
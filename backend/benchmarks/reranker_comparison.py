@@ -0,0 +1,210 @@
+# Compares the local cross-encoder with the Cohere reranker on a recorded set of queries
+# First record the candidates and Cohere scores once, this needs the API keys and a built database:
+#   python -m benchmarks.reranker_comparison record --category cs
+# Then compare any cross-encoder export against the recording, this runs offline:
+#   python -m benchmarks.reranker_comparison compare --model-dir data/models/cross_encoder
+# or measure how much of the Cohere top 10 survives the prefilter of the rerank cascade:
+#   python -m benchmarks.reranker_comparison cascade --max-candidates 25 50 100
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+FILE_DIR = os.path.dirname(os.path.realpath(__file__))
+QUERIES_PATH = os.path.join(FILE_DIR, "fixtures", "rerank_queries.txt")
+RECORDING_PATH = os.path.join(
+    FILE_DIR, "..", "data", "benchmarks", "rerank_recording.jsonl"
+)
+
+
+def record(category: str, top_k: int, recording_path: str) -> None:
+    import chromadb
+
+    from utils.chroma_functions import query_chroma_collection
+    from utils.etc_functions import load_env_vars
+    from wrappers.cohere_wrappers import Cohere_Reranker
+    from wrappers.openai_wrappers import OpenAI_Embedding
+
+    load_env_vars()
+    embedding_fn = OpenAI_Embedding(dim=256, verbose=False)
+    reranker = Cohere_Reranker()
+    chroma_client = chromadb.PersistentClient(
+        os.path.join(FILE_DIR, "..", "data", "chroma")
+    )
+    collection = chroma_client.get_collection(
+        "arxiv_" + category, embedding_function=embedding_fn
+    )
+
+    with open(QUERIES_PATH, "r") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    os.makedirs(os.path.dirname(recording_path), exist_ok=True)
+    with open(recording_path, "w") as f:
+        for query in queries:
+            candidates = query_chroma_collection([query], collection, top_k)
+            start = time.perf_counter()
+            scores = reranker(query, candidates.contents)
+            latency = time.perf_counter() - start
+            record = {
+                "query": query,
+                "ids": candidates.ids,
+                "documents": candidates.contents,
+                "distances": candidates.distances.tolist(),
+                "titles": [metadata["title"] for metadata in candidates.metadatas],
+                "cohere_scores": scores,
+                "cohere_latency": latency,
+            }
+            f.write(json.dumps(record) + "\n")
+            print(f"{query}: {latency * 1000:.0f} ms")
+
+
+def top_overlap(reference: np.ndarray, scores: np.ndarray, k: int) -> float:
+    # share of the reference top k that is also in the top k of the scores
+    top_reference = set(np.argsort(-reference, kind="stable")[:k])
+    top_scores = set(np.argsort(-scores, kind="stable")[:k])
+    return len(top_reference & top_scores) / k
+
+
+def spearman(reference: np.ndarray, scores: np.ndarray) -> float:
+    reference_ranks = np.argsort(np.argsort(reference))
+    score_ranks = np.argsort(np.argsort(scores))
+    return float(np.corrcoef(reference_ranks, score_ranks)[0, 1])
+
+
+def compare(
+    model_dir: str,
+    recording_path: str,
+    max_tokens: int,
+    batch_size: int,
+    num_workers: int,
+) -> None:
+    from wrappers.onnx_wrappers import CrossEncoder_Reranker
+
+    with open(recording_path, "r") as f:
+        records = [json.loads(line) for line in f]
+
+    reranker = CrossEncoder_Reranker(
+        model_dir,
+        max_tokens=max_tokens,
+        batch_size=batch_size,
+        num_workers=num_workers,
+    )
+    # the first call starts the workers and loads the model
+    reranker(records[0]["query"], records[0]["documents"][:2])
+
+    latencies, cached_latencies = [], []
+    overlaps = {k: [] for k in [1, 5, 10]}
+    correlations = []
+    for record in records:
+        start = time.perf_counter()
+        scores = reranker(record["query"], record["documents"], record["ids"])
+        latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        reranker(record["query"], record["documents"], record["ids"])
+        cached_latencies.append(time.perf_counter() - start)
+
+        reference = np.asarray(record["cohere_scores"])
+        scores = np.asarray(scores)
+        for k in overlaps:
+            overlaps[k].append(top_overlap(reference, scores, k))
+        correlations.append(spearman(reference, scores))
+    reranker.close()
+
+    cohere_latencies = np.array([record["cohere_latency"] for record in records])
+    num_documents = np.mean([len(record["documents"]) for record in records])
+    print(f"Queries: {len(records)}, documents per query: {num_documents:.0f}")
+    print(f"{'reranker':>20} | {'p50 [ms]':>9} | {'p99 [ms]':>9}")
+    for name, values in [
+        ("cohere (recorded)", cohere_latencies),
+        ("cross-encoder", np.array(latencies)),
+        ("cross-encoder cached", np.array(cached_latencies)),
+    ]:
+        p50, p99 = np.percentile(values * 1000, [50, 99])
+        print(f"{name:>20} | {p50:>9.1f} | {p99:>9.1f}")
+
+    print("Agreement with the Cohere ordering:")
+    for k, values in overlaps.items():
+        print(f"  top-{k} overlap: {np.mean(values):.3f}")
+    print(f"  spearman:      {np.mean(correlations):.3f}")
+
+
+def cascade(
+    recording_path: str,
+    max_candidates: list[int],
+    lexical_weight: float,
+    top_n: int,
+) -> None:
+    from utils.app_dataclasses import CandidateSet
+    from utils.query_functions import prefilter_candidates
+
+    with open(recording_path, "r") as f:
+        records = [json.loads(line) for line in f]
+
+    print(f"Queries: {len(records)}, lexical weight: {lexical_weight}")
+    print(f"{'M':>5} | {'top-' + str(top_n) + ' recall':>12} | {'prefilter [ms]':>14}")
+    for m in max_candidates:
+        recalls, durations = [], []
+        for record in records:
+            candidates = CandidateSet(
+                ids=record["ids"],
+                distances=np.asarray(record["distances"]),
+                contents=record["documents"],
+                metadatas=[{"title": title} for title in record["titles"]],
+                rerank_scores=np.asarray(record["cohere_scores"]),
+            )
+            start = time.perf_counter()
+            survivors = prefilter_candidates(
+                record["query"], candidates, m, lexical_weight
+            )
+            durations.append(time.perf_counter() - start)
+
+            # Cohere scores every pair on its own, so the recorded scores stay valid for the survivors
+            best = np.argsort(-candidates.rerank_scores, kind="stable")[:top_n]
+            recalls.append(
+                len({candidates.ids[i] for i in best} & set(survivors.ids)) / len(best)
+            )
+        print(
+            f"{m:>5} | {np.mean(recalls):>12.3f} | {np.mean(durations) * 1000:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("--category", default="cs")
+    record_parser.add_argument("--top-k", type=int, default=200)
+    record_parser.add_argument("--recording", default=RECORDING_PATH)
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("--model-dir", required=True)
+    compare_parser.add_argument("--recording", default=RECORDING_PATH)
+    compare_parser.add_argument("--max-tokens", type=int, default=256)
+    compare_parser.add_argument("--batch-size", type=int, default=32)
+    compare_parser.add_argument("--num-workers", type=int, default=2)
+
+    cascade_parser = subparsers.add_parser("cascade")
+    cascade_parser.add_argument("--recording", default=RECORDING_PATH)
+    cascade_parser.add_argument(
+        "--max-candidates", type=int, nargs="+", default=[25, 50, 100, 150]
+    )
+    cascade_parser.add_argument("--lexical-weight", type=float, default=0.3)
+    cascade_parser.add_argument("--top-n", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.category, args.top_k, args.recording)
+    elif args.command == "cascade":
+        cascade(args.recording, args.max_candidates, args.lexical_weight, args.top_n)
+    else:
+        compare(
+            args.model_dir,
+            args.recording,
+            args.max_tokens,
+            args.batch_size,
+            args.num_workers,
+        )
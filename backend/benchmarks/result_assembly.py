@@ -0,0 +1,168 @@
+# Compares the array based result assembly with the previous pandas path
+# Run from the backend folder with: python -m benchmarks.result_assembly
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.app_dataclasses import Document
+from utils.chroma_functions import query_chroma_collection
+from utils.query_functions import process_results, rerank_results
+
+
+class FakeCollection:
+    # returns a fixed Chroma result, so only the assembly of the results is measured
+    def __init__(self, top_k: int, seed: int = 42) -> None:
+        rng = np.random.default_rng(seed)
+        self.results = {
+            "ids": [[f"2101.{i:05d}" for i in range(top_k)]],
+            "distances": [np.sort(rng.random(top_k) * 2).tolist()],
+            "documents": [[f"Abstract {i} " * 80 for i in range(top_k)]],
+            "metadatas": [
+                [
+                    {
+                        "title": f"Paper {i}",
+                        "year": 2021,
+                        "month": 1,
+                        "day": 1 + i % 28,
+                        "authors": "A. Author;B. Author;C. Author",
+                        "journal_ref": "-",
+                        "doi": "-",
+                        "categories": "cs.LG;cs.AI",
+                        "main_category": "cs.LG",
+                    }
+                    for i in range(top_k)
+                ]
+            ],
+        }
+        self.rerank_scores = rng.random(top_k).tolist()
+
+    def query(self, **kwargs) -> dict:
+        return self.results
+
+
+class FakeReranker:
+    def __init__(self, scores: list[float]) -> None:
+        self.scores = scores
+
+    def __call__(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]:
+        return self.scores
+
+
+def legacy_query_chroma_collection(
+    collection: FakeCollection,
+    top_k: int,
+) -> pd.DataFrame:
+    # this is the implementation utils/chroma_functions.py used to have
+    rows = []
+    results = collection.query(n_results=top_k)
+    for (
+        query_ids,
+        query_metadatas,
+        query_documents,
+        query_distances,
+    ) in zip(
+        results["ids"],
+        results["metadatas"],
+        results["documents"],
+        results["distances"],
+    ):
+        for result_idx in range(top_k):
+            row = {
+                "id": query_ids[result_idx],
+                "score": query_distances[result_idx],
+                "content": query_documents[result_idx],
+            }
+            row.update(query_metadatas[result_idx])
+            rows.append(row)
+
+    final_df = pd.DataFrame(rows)
+    final_df = final_df.drop_duplicates(subset=["id"])
+    return final_df
+
+
+def legacy_process_results(
+    documents: pd.DataFrame,
+    top_n: int,
+    rerank_score_threshold: float,
+) -> list[Document]:
+    # this is the implementation utils/query_functions.py used to have
+    documents = documents.rename(columns={"score": "distance"})
+    if "rerank_score" in documents.columns:
+        documents = (
+            documents.sort_values(by=["rerank_score"], ascending=False)
+            .query(f"rerank_score > {rerank_score_threshold}")
+            .reset_index(drop=True)
+            .head(top_n)
+        )
+        documents = documents.rename(columns={"rerank_score": "score"})
+    else:
+        documents = (
+            documents.sort_values(by=["distance"], ascending=True)
+            .reset_index(drop=True)
+            .sort_values(by=["distance"], ascending=True)
+            .head(top_n)
+        )
+        documents["score"] = documents["distance"].apply(lambda x: 1 / (1 + x))
+    return [Document(**doc) for doc in documents.to_dict(orient="records")]
+
+
+def legacy_pipeline(collection, reranker, top_k, top_n, threshold, use_rerank):
+    documents = legacy_query_chroma_collection(collection, top_k)
+    if use_rerank:
+        documents["rerank_score"] = reranker("query", documents["content"].tolist())
+    return legacy_process_results(documents, top_n, threshold)
+
+
+def array_pipeline(collection, reranker, top_k, top_n, threshold, use_rerank):
+    candidates = query_chroma_collection(["query"], collection, top_k)
+    if use_rerank:
+        candidates = rerank_results("query", candidates, reranker)
+    return process_results(candidates, top_n, threshold)
+
+
+def timed(fn, repeats: int, *args) -> tuple[float, list[Document]]:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn(*args)
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=400)
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    collection = FakeCollection(args.top_k)
+    reranker = FakeReranker(collection.rerank_scores)
+
+    print(f"top_k: {args.top_k}, top_n: {args.top_n}, repeats: {args.repeats}")
+    print(
+        f"{'rerank':>6} | {'pandas [ms]':>11} | {'arrays [ms]':>11} | {'speedup':>8} | {'equal':>5}"
+    )
+    for use_rerank in [False, True]:
+        pipeline_args = (
+            collection,
+            reranker,
+            args.top_k,
+            args.top_n,
+            args.threshold,
+            use_rerank,
+        )
+        legacy_time, legacy_docs = timed(legacy_pipeline, args.repeats, *pipeline_args)
+        array_time, array_docs = timed(array_pipeline, args.repeats, *pipeline_args)
+        equal = [doc.model_dump() for doc in legacy_docs] == [
+            doc.model_dump() for doc in array_docs
+        ]
+        print(
+            f"{str(use_rerank):>6} | {legacy_time * 1000:>11.3f} | {array_time * 1000:>11.3f} | {legacy_time / array_time:>7.1f}x | {str(equal):>5}"
+        )
@@ -0,0 +1,186 @@
+# Compares the latency, memory and results of Chroma with the local vector store
+# Run from the backend folder with: python -m benchmarks.search_backends
+# The collections of create_chroma_collection.py and build_vector_store.py are compared for every subset,
+# with --synthetic N both backends are built from N random embeddings in a temporary folder instead
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from build_vector_store import SUBSETS
+from utils.chroma_functions import query_chroma_collection
+from utils.vector_store import LocalVectorStore, write_collection
+
+FILE_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CHROMA_ROOT = os.path.join(FILE_PATH, "data", "chroma")
+VECTOR_STORE_ROOT = os.path.join(FILE_PATH, "data", "vector_store")
+SYNTHETIC_DIM = 256
+
+
+def rss_mib() -> tuple[float, float]:
+    # the current and the peak resident memory of this process
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key in ["VmRSS", "VmHWM"]:
+                values[key] = int(value.split()[0]) / 1024
+    return values["VmRSS"], values["VmHWM"]
+
+
+def open_collection(backend: str, chroma_dir: str, store_dir: str, name: str):
+    if backend == "chroma":
+        return chromadb.PersistentClient(chroma_dir).get_collection(name)
+    collection = LocalVectorStore(store_dir).get_collection(name)
+    if backend == "local-exact" and collection.ivf is not None:
+        # probing every list is the exact search
+        collection.nprobe = len(collection.ivf["centroids"])
+    return collection
+
+
+def measure_backend(
+    backend: str,
+    chroma_dir: str,
+    store_dir: str,
+    name: str,
+    queries: np.ndarray,
+    top_k: int,
+    results: dict,
+) -> None:
+    # runs in its own process, so the memory of one backend is not counted for the other
+    start = time.perf_counter()
+    collection = open_collection(backend, chroma_dir, store_dir, name)
+    # the first query loads the index of Chroma and touches the pages of the memory map
+    query_chroma_collection(
+        [""], collection, top_k, [queries[0].tolist()], include_documents=False
+    )
+    load_time = time.perf_counter() - start
+
+    latencies, ids = [], []
+    for query in queries:
+        start = time.perf_counter()
+        candidates = query_chroma_collection(
+            [""], collection, top_k, [query.tolist()], include_documents=False
+        )
+        latencies.append(time.perf_counter() - start)
+        ids.append(candidates.ids)
+
+    rss, peak_rss = rss_mib()
+    results[backend] = {
+        "load_time": load_time,
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "rss": rss,
+        "peak_rss": peak_rss,
+        "ids": ids,
+    }
+
+
+def sample_queries(store_dir: str, name: str, num_queries: int) -> np.ndarray:
+    # papers of the collection with some noise, which is close to real search strings
+    embeddings = LocalVectorStore(store_dir).get_collection(name).embeddings
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(len(embeddings), num_queries, replace=False))
+    queries = np.asarray(embeddings[rows], dtype=np.float32)
+    queries += rng.standard_normal(queries.shape).astype(np.float32) * 0.05
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def build_synthetic(chroma_dir: str, store_dir: str, num_docs: int) -> str:
+    name = "arxiv_synthetic"
+    rng = np.random.default_rng(42)
+    # clustered embeddings, uniformly random ones have no structure for an index to exploit
+    centers = rng.standard_normal((256, SYNTHETIC_DIM)).astype(np.float32)
+    embeddings = centers[rng.integers(0, len(centers), num_docs)]
+    embeddings += rng.standard_normal(embeddings.shape).astype(np.float32) * 0.5
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"{i:07d}" for i in range(num_docs)]
+    documents = [f"Abstract of paper {id}. " + "lorem ipsum " * 100 for id in ids]
+    metadatas = [{"title": f"Paper {id}"} for id in ids]
+
+    print(f"Building {num_docs} synthetic papers...")
+    write_collection(
+        os.path.join(store_dir, name),
+        ids,
+        embeddings,
+        documents,
+        metadatas,
+        num_lists=max(num_docs // 1000, 1),
+    )
+    # Chroma gets the same float16 values as the local store
+    embeddings = embeddings.astype(np.float16).astype(np.float32)
+    collection = chromadb.PersistentClient(chroma_dir).create_collection(name)
+    for start in range(0, num_docs, 5000):
+        collection.add(
+            ids=ids[start : start + 5000],
+            embeddings=embeddings[start : start + 5000],
+            documents=documents[start : start + 5000],
+            metadatas=metadatas[start : start + 5000],
+        )
+    return name
+
+
+def compare(
+    chroma_dir: str,
+    store_dir: str,
+    name: str,
+    num_queries: int,
+    top_k: int,
+) -> None:
+    queries = sample_queries(store_dir, name, num_queries)
+    backends = ["chroma", "local-exact"]
+    if LocalVectorStore(store_dir).get_collection(name).ivf is not None:
+        backends.append("local-ivf")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Manager().dict()
+    for backend in backends:
+        process = ctx.Process(
+            target=measure_backend,
+            args=(backend, chroma_dir, store_dir, name, queries, top_k, results),
+        )
+        process.start()
+        process.join()
+
+    # the overlap with the exact search is the recall of the approximate indexes
+    exact_ids = results["local-exact"]["ids"]
+    print(f"\n{name}, queries: {num_queries}, top_k: {top_k}")
+    print(
+        f"{'backend':>12} | {'load [s]':>8} | {'p50 [ms]':>8} | {'p99 [ms]':>8} | {'rss [MiB]':>9} | {'peak [MiB]':>10} | {'overlap':>7}"
+    )
+    for backend in backends:
+        result = results[backend]
+        overlap = np.mean(
+            [len(set(a) & set(b)) / len(b) for a, b in zip(result["ids"], exact_ids)]
+        )
+        print(
+            f"{backend:>12} | {result['load_time']:>8.2f} | {result['p50'] * 1000:>8.2f} | {result['p99'] * 1000:>8.2f} | {result['rss']:>9.0f} | {result['peak_rss']:>10.0f} | {overlap:>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=int, default=None)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=400)
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            chroma_dir = os.path.join(tmp_dir, "chroma")
+            store_dir = os.path.join(tmp_dir, "vector_store")
+            name = build_synthetic(chroma_dir, store_dir, args.synthetic)
+            compare(chroma_dir, store_dir, name, args.num_queries, args.top_k)
+    else:
+        for subset in SUBSETS:
+            compare(
+                CHROMA_ROOT,
+                VECTOR_STORE_ROOT,
+                "arxiv_" + subset,
+                args.num_queries,
+                args.top_k,
+            )
@@ -0,0 +1,123 @@
+# Compares the encodings of the similarity list of generate_frontend_files.py with the previous per-neighbour f-strings
+# Run from the backend folder with: python -m benchmarks.similarity_encoding
+import argparse
+import os
+import tempfile
+import time
+
+import brotli
+import numpy as np
+
+from benchmarks.frontend_export import read_bytes
+from benchmarks.map_bundle import build_similarities, parse_similarities
+from generate_frontend_files import (
+    NUM_BEST_SIMS,
+    generate_formatted_similarities,
+    save_similarities,
+)
+from utils.similarity_encoding import (
+    load_neighbours,
+    save_neighbours,
+    similarity_integers,
+)
+
+
+def legacy_generate_formatted_similarities(
+    similarity_values: np.ndarray,
+    similarity_idxs: np.ndarray,
+) -> str:
+    # this is the implementation generate_frontend_files.py used to have
+    out_strs = []
+    for node_idx in range(similarity_idxs.shape[0]):
+        node_vals = similarity_values[node_idx][1 : NUM_BEST_SIMS + 1]
+        node_conns = similarity_idxs[node_idx][1 : NUM_BEST_SIMS + 1]
+        out_strs.append(
+            ";".join(
+                [
+                    f"{node_conn},{round(node_val,2) * 100:.0f}"
+                    for node_val, node_conn in zip(node_vals, node_conns)
+                ]
+            )
+        )
+    return "\n".join(out_strs)
+
+
+def check_all_float16() -> int:
+    # every float16 a cosine similarity can be, against the f-string
+    values = np.arange(2**16, dtype=np.uint16).view(np.float16)
+    values = values[np.isfinite(values) & (np.abs(values) <= 2)]
+    integers, negative_zeros = similarity_integers(values)
+    expected = [f"{round(value,2) * 100:.0f}" for value in values]
+    formatted = [
+        "-0" if negative_zero else str(integer)
+        for integer, negative_zero in zip(integers.tolist(), negative_zeros)
+    ]
+    return sum(a != b for a, b in zip(expected, formatted))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-papers", type=int, default=200000)
+    args = parser.parse_args()
+
+    similarity_values, similarity_idxs = build_similarities(args.num_papers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = os.path.join(tmp_dir, "legacy.txt")
+        text_path = os.path.join(tmp_dir, "subset.txt")
+        binary_path = os.path.join(tmp_dir, "subset.neighbours.bin")
+
+        start = time.perf_counter()
+        save_similarities(
+            [
+                legacy_generate_formatted_similarities(
+                    similarity_values, similarity_idxs
+                )
+            ],
+            legacy_path,
+        )
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        save_similarities(
+            generate_formatted_similarities(similarity_values, similarity_idxs),
+            text_path,
+        )
+        text_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        save_neighbours(
+            binary_path,
+            similarity_values[:, 1 : NUM_BEST_SIMS + 1],
+            similarity_idxs[:, 1 : NUM_BEST_SIMS + 1],
+        )
+        binary_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        idxs, scores = load_neighbours(binary_path)
+        decode_time = time.perf_counter() - start
+
+        text_idxs, text_scores = parse_similarities(legacy_path)
+        text_equal = read_bytes(legacy_path) == read_bytes(text_path)
+        binary_equal = np.array_equal(idxs, text_idxs) and np.array_equal(
+            scores, text_scores
+        )
+        sizes = {
+            name: (len(data), len(brotli.compress(data)))
+            for name, data in [
+                ("text", read_bytes(text_path)),
+                ("binary", read_bytes(binary_path)),
+            ]
+        }
+
+    print(f"Papers: {args.num_papers}, neighbours: {NUM_BEST_SIMS}")
+    print(f"{'':>16} | {'time [s]':>8} | {'raw [MB]':>8} | {'brotli [MB]':>11}")
+    print(f"{'legacy text':>16} | {legacy_time:>8.2f} | {'':>8} | {'':>11}")
+    for name, seconds in [("text", text_time), ("binary", binary_time)]:
+        raw, compressed = sizes[name]
+        print(
+            f"{name:>16} | {seconds:>8.2f} | {raw / 1e6:>8.2f} | {compressed / 1e6:>11.2f}"
+        )
+    print(f"{'binary decode':>16} | {decode_time:>8.2f} | {'':>8} | {'':>11}")
+    print(f"binary bytes per paper: {sizes['binary'][0] / args.num_papers:.1f}")
+    print(f"identical text: {text_equal}, binary matches text: {binary_equal}")
+    print(f"float16 values formatted differently: {check_all_float16()}")
@@ -0,0 +1,74 @@
+# Compares the blocked top-k engine with the original per-row argsort loop
+# Run from the backend folder with: python -m benchmarks.similarity_list
+import argparse
+import time
+
+import torch
+
+from utils.similarity_functions import top_k_neighbors
+
+DIM = 256
+NEIGHBORS = 100
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def loop_top_k_neighbors(
+    embeddings: torch.Tensor,
+    k: int,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    # this is the implementation generate_similarity_list.py used to have
+    best_idxs = torch.zeros((embeddings.shape[0], k), dtype=torch.int32).to(DEVICE)
+    best_scores = torch.zeros((embeddings.shape[0], k), dtype=embeddings.dtype).to(
+        DEVICE
+    )
+    for i in range(embeddings.shape[0]):
+        scores = torch.matmul(embeddings, embeddings[i])
+        idxs = torch.argsort(scores, descending=True, dim=0)
+        best_idxs[i] = idxs[1 : k + 1]
+        best_scores[i] = scores[idxs[1 : k + 1]]
+    return best_idxs, best_scores
+
+
+def random_embeddings(num_rows: int, dtype: torch.dtype) -> torch.Tensor:
+    generator = torch.Generator().manual_seed(42)
+    embeddings = torch.randn((num_rows, DIM), generator=generator).to(dtype)
+    embeddings = embeddings.to(DEVICE)
+    return embeddings / torch.norm(embeddings, dim=1).reshape(-1, 1)
+
+
+def timed(fn, *args, **kwargs):
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    args = parser.parse_args()
+    dtype = getattr(torch, args.dtype)
+
+    print(f"Device: {DEVICE}, dtype: {args.dtype}, dim: {DIM}, k: {NEIGHBORS}")
+    print(
+        f"{'N':>8} | {'loop [s]':>10} | {'blocked [s]':>11} | {'speedup':>8} | {'scores equal':>12} | {'idx equal':>9}"
+    )
+    for num_rows in args.sizes:
+        embeddings = random_embeddings(num_rows, dtype)
+        k = min(NEIGHBORS, num_rows - 1)
+
+        loop_time, (loop_idxs, loop_scores) = timed(loop_top_k_neighbors, embeddings, k)
+        blocked_time, (blocked_idxs, blocked_scores) = timed(
+            top_k_neighbors, embeddings, k, verbose=False
+        )
+
+        # argsort is not stable, so only the order of exactly tied scores may differ
+        scores_equal = torch.equal(loop_scores, blocked_scores)
+        idx_equal = (loop_idxs == blocked_idxs).float().mean().item()
+        print(
+            f"{num_rows:>8} | {loop_time:>10.2f} | {blocked_time:>11.2f} | {loop_time / blocked_time:>7.1f}x | {str(scores_equal):>12} | {idx_equal:>9.4%}"
+        )
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.chroma_functions import build_metadatas, mark_collection_rebuilt
+from utils.corpus_store import load_embeddings, load_metadata
+from utils.vector_store import write_collection
+
+SUBSETS = [
+    "cond-mat",
+    "hep",
+    "astro-ph",
+    "quant-ph",
+    "cs",
+    "physics",
+]
+
+# subsets with at least IVF_MIN_ROWS papers get an IVF index with one list per ROWS_PER_LIST papers,
+# smaller ones are searched exactly, which is fast enough and never misses a hit
+IVF_MIN_ROWS = 200_000
+ROWS_PER_LIST = 1000
+# float16 halves the memory of the store, float32 skips converting every block and searches about 5x faster
+EMBEDDING_DTYPE = np.float16
+FILE_PATH = os.path.dirname(os.path.realpath(__file__))
+VECTOR_STORE_ROOT = os.path.join(FILE_PATH, "data", "vector_store")
+
+if __name__ == "__main__":
+    for subset in SUBSETS:
+        corpus_dir = os.path.join(FILE_PATH, "data", subset, "corpus")
+        name = "arxiv_" + subset
+
+        df: pd.DataFrame = load_metadata(corpus_dir)
+        unique_rows = ~df.duplicated(subset=["arxiv_id"]).to_numpy()
+        df = df[unique_rows]
+        embeddings = np.array(
+            load_embeddings(corpus_dir)[unique_rows], dtype=np.float32
+        )
+
+        # the same metadata as in create_chroma_collection.py
+        metadatas = build_metadatas(df)
+
+        num_lists = len(df) // ROWS_PER_LIST if len(df) >= IVF_MIN_ROWS else None
+        print(
+            f"Writing {len(df)} papers to {name}"
+            + (f" with {num_lists} IVF lists..." if num_lists else "...")
+        )
+        write_collection(
+            os.path.join(VECTOR_STORE_ROOT, name),
+            ids=df["arxiv_id"].tolist(),
+            embeddings=embeddings,
+            documents=df["abstract"].tolist(),
+            metadatas=metadatas,
+            num_lists=num_lists,
+            dtype=EMBEDDING_DTYPE,
+        )
+        # lets a running server know that it has to reload this collection
+        mark_collection_rebuilt(VECTOR_STORE_ROOT, name)
@@ -0,0 +1,32 @@
+import os
+
+import pandas as pd
+
+from utils.corpus_store import save_corpus
+
+SUBSETS = [
+    "cond-mat",
+    "hep",
+    "astro-ph",
+    "quant-ph",
+    "cs",
+    "physics",
+]
+FILE_DIR = os.path.dirname(os.path.realpath(__file__))
+DATA_ROOT = os.path.join(FILE_DIR, "data")
+
+# Converts the old arxiv_metadata_with_embeddings.pkl files to the corpus store
+if __name__ == "__main__":
+    for subset in SUBSETS:
+        data_path = os.path.join(
+            DATA_ROOT,
+            subset,
+            "arxiv_metadata_with_embeddings.pkl",
+        )
+        if not os.path.exists(data_path):
+            print(f"Skipping {subset}, {data_path} does not exist")
+            continue
+
+        print(f"Converting {subset}...")
+        df: pd.DataFrame = pd.read_pickle(data_path)
+        save_corpus(df, os.path.join(DATA_ROOT, subset, "corpus"))
@@ -1,217 +1,184 @@
-import datetime
+import asyncio
+import json
 import os
-import re
-import time
+import random
+from concurrent.futures import Executor, ProcessPoolExecutor
 
+import httpx
 import pandas as pd
-import requests
-import xmltodict
-
-
-def lint_text(string: str) -> str:
-    string = string.replace("\r\n", " ")
-    string = string.replace("\xa0", " ")
-    string = string.replace("\n", " ")
-    string = string.replace("—", "-")
-    string = string.replace("–", "-")
-    string = string.replace("…", "...")
-    string = string.replace("’", "'")
-    string = string.replace("”", "'")
-    string = string.replace("“", "'")
-
-    string = re.sub(r"\b([A-Za-z0-9]+) \{\}", r"{\1}", string)
-    string = string.replace("{}", "")
-    string = string.encode("utf-8", "ignore").decode("utf-8")
-    string = string.replace("\\sim", "~")
-    string = string.replace("\\times", "x")
-    string = string.replace(" .", ".")
-    string = string.replace(" ,", ",")
-
-    string = re.sub(r"\\label{.*?}", "", string)
-    string = re.sub(r"\\begin{equation}", "$", string)
-    string = re.sub(r"\\end{equation}", "$", string)
-    string = re.sub(r"\\begin{equation\*}", "$", string)
-    string = re.sub(r"\\end{equation\*}", "$", string)
-    string = re.sub(r"\\FLP", "", string)
-    string = re.sub(r"\\\\\[.*?]", "", string)
-    string = re.sub(r"\\biggl", " ", string)
-    string = re.sub(r"\\biggr", " ", string)
-    string = re.sub(r"\\Biggl", " ", string)
-    string = re.sub(r"\\Biggr", " ", string)
-    string = re.sub(r"\\tfrac", r"\\frac", string)
-    string = re.sub(r"\\notag", "", string)
-    string = re.sub(r"\\\\", " ", string)
-
-    string = re.sub(r"\\;", " ", string)
-    string = re.sub(r"\\,", " ", string)
-    string = re.sub(r"\\:", " ", string)
-    string = re.sub(r"\\!", " ", string)
-    string = re.sub(r"\\quad", " ", string)
-
-    string = re.sub(r"\\([a-zA-Z])op", r"\\hat{\1}", string)
-    string = re.sub(r"\\([a-zA-Z])dotop", r"\\hat{\\dot{\1}}", string)
-
-    string = re.sub(r"\\expval{(.*?)}", r"\\braket{\1}", string)
-    string = re.sub(r"\\av{(.*?)}", r"\\bar{\1}", string)
-    string = re.sub(r"\\abs{(.*?)}", r"|\1|", string)
-
-    string = re.sub(r"\\ketsl{(.*?)}", r"\\ket{\1}", string)
-    string = re.sub(r"\\barsl{(.*?)}", r"\\bar{\1}", string)
-    string = re.sub(r"\\slOne", "1", string)
-    string = re.sub(r"\\slTwo", "2", string)
-
-    # find all \\ddp{SOMETEXT}{TEXT} and replace them with \\frac{\\partial SOMETEXT}{\\partial TEXT}
-    string = re.sub(
-        r"\\ddp{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
-    )
-    string = re.sub(
-        r"\\ddpl{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
-    )
-    string = re.sub(r"\\ddt{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
-    string = re.sub(r"\\ddtl{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
-
-    # condense all whitespace to a single space
-    string = re.sub(r"\s+", " ", string)
-
-    return string
-
-
-def format_response(documents: list[dict]) -> pd.DataFrame:
-    # each doc as the following format
-    # url: The URL to the arXiv page, may end with v1, v2, etc. Helps to see if the paper has been updated.
-    # title: The title of the paper.
-    # arxiv_id: The arXiv ID of the paper. without the version number.
-    # published: The date the paper was published.
-    # updated: The date the paper was last updated.
-    # abstact: The abstract of the paper.
-    # main_category: The main category of the paper.
-    # categories: The categories of the paper.
-    # authors: a list of authors of the paper.
-    # journal_ref: The journal reference of the paper if available.
-    # doi: The DOI of the paper if available.
-    # arxiv_Comment: The comment of the paper if available.
-    # arxiv_DOI: The DOI used by DataCite if available.
-    formatted_docs = []
-
-    for document in documents:
-        try:
-            formatted_doc = {}
-            # strip the version number from the id
-            # TODO: Handle revision over 9
-            formatted_doc["title"] = lint_text(document["title"])
-            formatted_doc["arxiv_id"] = document["id"].split("/")[-1].split("v")[0]
-            formatted_doc["abstract"] = lint_text(document["summary"])
-            formatted_doc["main_category"] = document["arxiv:primary_category"]["@term"]
-            formatted_doc["revision"] = int(
-                document["id"].split("/")[-1].split("v")[-1]
-            )
-            formatted_doc["published"] = datetime.datetime.strptime(
-                document["published"],
-                "%Y-%m-%dT%H:%M:%SZ",
-            )
-            formatted_doc["updated"] = datetime.datetime.strptime(
-                document["updated"],
-                "%Y-%m-%dT%H:%M:%SZ",
-            )
-
-            # handle the case where there is only one category
-            cat = document["category"]
-            if type(cat) == dict:
-                cat = [cat]
-
-            formatted_doc["categories"] = [category["@term"] for category in cat]
-
-            # format the author list as First Letter of the first name. Last name
-            if type(document["author"]) == dict:
-                document["author"] = [document["author"]]
-            formatted_doc["authors"] = [author["name"] for author in document["author"]]
-            formatted_doc["authors"] = [
-                author.split(" ")[0][0] + ". " + author.split(" ")[-1]
-                for author in formatted_doc["authors"]
-            ]
-
-            formatted_doc["journal_ref"] = document.get("arxiv:journal_ref", None)
-            if formatted_doc["journal_ref"]:
-                formatted_doc["journal_ref"] = formatted_doc["journal_ref"]["#text"]
-            formatted_doc["doi"] = document.get("arxiv:doi", None)
-            if formatted_doc["doi"]:
-                formatted_doc["doi"] = formatted_doc["doi"]["#text"]
-            formatted_doc["arxiv_comment"] = document.get("arxiv:comment", None)
-            if formatted_doc["arxiv_comment"]:
-                formatted_doc["arxiv_comment"] = formatted_doc["arxiv_comment"]["#text"]
-            formatted_doc["arxiv_DOI"] = document.get("arxiv:doi", None)
-            if formatted_doc["arxiv_DOI"]:
-                formatted_doc["arxiv_DOI"] = formatted_doc["arxiv_DOI"]["#text"]
-
-            formatted_docs.append(formatted_doc)
-        except Exception as e:
-            print(e)
-            continue
-
-    df = pd.DataFrame(formatted_docs)
-    return df
 
-
-def query_arxiv_with_id_chunk(
-    id_chunk: list,
-    arxiv_template: str,
-) -> pd.DataFrame | None:
-    get_url = arxiv_template.format(
+from utils.arxiv_functions import parse_arxiv_response
+from utils.rate_limiter import TokenBucket
+
+# the columns of the crawled metadata, also of an empty result
+COLUMNS = [
+    "title",
+    "arxiv_id",
+    "abstract",
+    "main_category",
+    "revision",
+    "published",
+    "updated",
+    "categories",
+    "authors",
+    "journal_ref",
+    "doi",
+    "arxiv_comment",
+    "arxiv_DOI",
+]
+
+
+def load_checkpoint(checkpoint_path: str) -> tuple[list[dict], set[str]]:
+    # the checkpoint is an append-only JSON lines file with one line per finished chunk
+    records = []
+    done_ids = set()
+    if not os.path.exists(checkpoint_path):
+        return records, done_ids
+
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be cut off if the crawler was killed while writing
+                continue
+            records.extend(chunk["records"])
+            done_ids.update(chunk["ids"])
+    return records, done_ids
+
+
+def append_checkpoint(
+    checkpoint_file,
+    id_chunk: list[str],
+    records: list[dict],
+) -> None:
+    line = json.dumps({"ids": id_chunk, "records": records}, default=str)
+    checkpoint_file.write(line + "\n")
+    checkpoint_file.flush()
+
+
+async def fetch_id_chunk(
+    client: httpx.AsyncClient,
+    id_chunk: list[str],
+    link_template: str,
+    rate_limiter: TokenBucket,
+    max_retries: int = 5,
+    backoff_base: float = 5.0,
+) -> bytes:
+    get_url = link_template.format(
         id_list=",".join(id_chunk), max_results=len(id_chunk)
     )
-    res = requests.get(get_url)
-    res_dict = xmltodict.parse(res.text)
-    if "entry" not in res_dict["feed"]:
-        return None
-
-    documents = res_dict["feed"]["entry"]
-    if not isinstance(documents, list):
-        documents = [documents]
-
-    return format_response(documents)
+    for attempt in range(max_retries + 1):
+        await rate_limiter.acquire_async()
+        try:
+            res = await client.get(get_url)
+            res.raise_for_status()
+            return res.content
+        except httpx.HTTPError as e:
+            if attempt == max_retries:
+                raise
+            # exponential backoff with jitter, so retries of parallel chunks do not line up
+            wait_time = backoff_base * 2**attempt * (1 + random.random())
+            print(f"\nRequest failed ({e}), retrying in {wait_time:.0f}s")
+            await asyncio.sleep(wait_time)
+
+
+async def query_arxiv_with_ids_async(
+    arxiv_ids: list,
+    checkpoint_path: str,
+    chunk_size: int = 400,
+    link_template: str = "https://export.arxiv.org/api/query?id_list={id_list}&max_results={max_results}",
+    requests_per_second: float = 1 / 3,
+    max_concurrent_requests: int = 1,
+    max_retries: int = 5,
+    parse_executor: Executor | None = None,
+) -> pd.DataFrame:
+    # The arXiv API asks for no more than one request every three seconds
+    # Play nice and keep requests_per_second at 1/3 or lower
+    rate_limiter = TokenBucket(rate=requests_per_second)
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    loop = asyncio.get_running_loop()
+
+    records, done_ids = load_checkpoint(checkpoint_path)
+    # a checkpoint left by another or a larger ID list must not leak its papers into the output
+    # the records carry the ID the way parse_arxiv_response writes it, without prefix and version
+    wanted_ids = set(arxiv_ids)
+    wanted_records = {arxiv_id.split("/")[-1].split("v")[0] for arxiv_id in wanted_ids}
+    records = [record for record in records if record["arxiv_id"] in wanted_records]
+    done_ids &= wanted_ids
+    remaining_ids = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id not in done_ids]
+    id_chunks = [
+        remaining_ids[idx : idx + chunk_size]
+        for idx in range(0, len(remaining_ids), chunk_size)
+    ]
+    print(f"Resuming with {len(records)} entries, {len(id_chunks)} chunks left")
+
+    failed_chunks = 0
+    finished_chunks = 0
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file:
+
+            async def process_chunk(id_chunk: list[str]) -> None:
+                nonlocal failed_chunks, finished_chunks
+                try:
+                    async with semaphore:
+                        response = await fetch_id_chunk(
+                            client,
+                            id_chunk,
+                            link_template,
+                            rate_limiter,
+                            max_retries,
+                        )
+                    # parse outside of the event loop, so the next requests are not blocked
+                    chunk_records = await loop.run_in_executor(
+                        parse_executor,
+                        parse_arxiv_response,
+                        response,
+                    )
+                except Exception as e:
+                    # the chunk is not checkpointed and will be fetched on the next run
+                    print(f"\nGiving up on chunk starting with {id_chunk[0]}: {e}")
+                    failed_chunks += 1
+                    return
+
+                append_checkpoint(checkpoint_file, id_chunk, chunk_records)
+                records.extend(chunk_records)
+                finished_chunks += 1
+                print(
+                    f"Queried {finished_chunks:5} out of {len(id_chunks):5} chunks | {len(records)} entries found",
+                    end="\r",
+                )
+
+            await asyncio.gather(*[process_chunk(id_chunk) for id_chunk in id_chunks])
+
+    if failed_chunks > 0:
+        print(f"\n{failed_chunks} chunks failed, rerun the crawler to retry them")
+
+    # without records pandas would not know any column, filtering by them would fail
+    df = pd.DataFrame(records) if records else pd.DataFrame(columns=COLUMNS)
+
+    # the checkpoint stores the dates as strings
+    df["published"] = pd.to_datetime(df["published"])
+    df["updated"] = pd.to_datetime(df["updated"])
+    df = df.drop_duplicates(subset=["arxiv_id"]).reset_index(drop=True)
+    return df
 
 
 def query_arxiv_with_ids(
     arxiv_ids: list,
+    checkpoint_path: str,
     chunk_size: int = 400,
-    link_template: str = "https://export.arxiv.org/api/query?id_list={id_list}&max_results={max_results}",
+    **kwargs,
 ) -> pd.DataFrame:
-    df = pd.DataFrame(
-        columns=[
-            "title",
-            "arxiv_id",
-            "published",
-            "updated",
-            "abstract",
-            "main_category",
-            "categories",
-            "authors",
-            "journal_ref",
-            "doi",
-            "arxiv_comment",
-            "arxiv_DOI",
-        ]
+    return asyncio.run(
+        query_arxiv_with_ids_async(
+            arxiv_ids,
+            checkpoint_path,
+            chunk_size=chunk_size,
+            **kwargs,
+        )
     )
-    try:
-        for idx in range(0, len(arxiv_ids), chunk_size):
-            time.sleep(3)
-            print(
-                f"Querying arXiv for {idx:7} to {idx+chunk_size:7} out of {len(arxiv_ids):7} | {len(df)} entries found",
-                end="\r",
-            )
-            id_chunk = arxiv_ids[idx : idx + chunk_size]
-            id_df = query_arxiv_with_id_chunk(id_chunk, link_template)
-            if id_df is not None:
-                if len(df) == 0:
-                    df = id_df
-                else:
-                    df = pd.concat([df, id_df])
-                df = df.drop_duplicates(subset=["arxiv_id"])
-    except Exception as e:
-        print(e)
-        df.to_pickle("error.pkl")
-    finally:
-        return df
 
 
 CATEGORY = "cs"
@@ -219,13 +186,23 @@ FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_ROOT = os.path.join(FILE_DIR, "data", CATEGORY)
 FULL_SAVE_PATH = os.path.join(DATA_ROOT, "arxiv_metadata_with_crosspostings.pkl")
 SAVE_PATH = os.path.join(DATA_ROOT, "arxiv_metadata.pkl")
+CHECKPOINT_PATH = os.path.join(DATA_ROOT, "arxiv_metadata_checkpoint.jsonl")
+# Number of processes that parse and lint the responses during a backfill
+PARSE_WORKERS = 4
 
 if __name__ == "__main__":
     with open(os.path.join(DATA_ROOT, "arxiv_ids.txt"), "r") as f:
         arxiv_ids = f.readlines()
         arxiv_ids = [id.strip() for id in arxiv_ids]
 
-    df = query_arxiv_with_ids(arxiv_ids, chunk_size=400)
+    # finished chunks are appended to the checkpoint, rerunning after a crash resumes from there
+    with ProcessPoolExecutor(PARSE_WORKERS) as parse_executor:
+        df = query_arxiv_with_ids(
+            arxiv_ids,
+            CHECKPOINT_PATH,
+            chunk_size=400,
+            parse_executor=parse_executor,
+        )
     df.to_pickle(FULL_SAVE_PATH)
 
     # Filter out papers that are not in the desired category
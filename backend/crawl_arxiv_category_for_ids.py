@@ -1,12 +1,23 @@
+import asyncio
+import datetime
+import json
 import os
-import time
 
-import bs4
-import numpy as np
-import requests
+import httpx
+import lxml.html
 
+from utils.rate_limiter import HostRateLimiter
 
-def fetch_arxiv_ids(
+
+def parse_listing_ids(html: bytes) -> list[str]:
+    # the abstract links of a listing page carry the arXiv ID as their id
+    tree = lxml.html.fromstring(html)
+    return tree.xpath('//a[@title="Abstract"]/@id')
+
+
+async def fetch_arxiv_ids(
+    client: httpx.AsyncClient,
+    rate_limiter: HostRateLimiter,
     category: str,
     year: int,
     month: int,
@@ -21,77 +32,204 @@ def fetch_arxiv_ids(
         skip=curr_page * entries_per_page,
         show=entries_per_page,
     )
-    response = requests.get(link)
-    soup = bs4.BeautifulSoup(response.text, "html.parser")
-    anchors = soup.find_all("a", title="Abstract")
-    return [a["id"] for a in anchors]
+    await rate_limiter.acquire_async(link)
+    response = await client.get(link)
+    response.raise_for_status()
+    return parse_listing_ids(response.content)
+
+
+def is_open_month(year: int, month: int, today: datetime.date | None = None) -> bool:
+    # the current month still grows and late listings can still appear in the previous one
+    today = today or datetime.date.today()
+    previous = (today.year * 12 + today.month - 1) - 1
+    return year * 12 + month - 1 >= previous
+
+
+class CrawlState:
+    """Tracks the finished pages of every month of a category in a small JSON file.
+
+    The IDs of a page are appended to the file of its month before the page is marked
+    as finished, so an interrupted crawl can resume without refetching anything.
+    Only full pages count as done, the last page of a month that is not complete is fetched again.
+    """
+
+    def __init__(self, save_dir: str) -> None:
+        self.save_dir = save_dir
+        self.ids_dir = os.path.join(save_dir, "ids")
+        self.state_path = os.path.join(save_dir, "crawl_state.json")
+        os.makedirs(self.ids_dir, exist_ok=True)
+
+        self.months = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                self.months = json.load(f)
+
+    def month_state(self, year: int, month: int) -> dict:
+        return self.months.get(
+            f"{year}-{str(month).zfill(2)}",
+            {"pages_done": 0, "complete": False},
+        )
+
+    def add_page(
+        self,
+        year: int,
+        month: int,
+        ids: list[str],
+        pages_done: int,
+        complete: bool,
+    ) -> None:
+        # a page that is fetched again appends its IDs again, merge_ids drops the duplicates
+        key = f"{year}-{str(month).zfill(2)}"
+        with open(os.path.join(self.ids_dir, f"{key}.txt"), "a") as f:
+            f.writelines(id + "\n" for id in ids)
+
+        self.months[key] = {
+            "pages_done": pages_done,
+            "complete": complete,
+        }
+        self.save()
+
+    def save(self) -> None:
+        # write to a temporary file first, so a crash never leaves a broken state file
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.months, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def merge_ids(self, save_path: str) -> int:
+        # months are sorted by name, which is chronological for YYYY-MM
+        arxiv_ids = {}
+        for fname in sorted(os.listdir(self.ids_dir)):
+            with open(os.path.join(self.ids_dir, fname), "r") as f:
+                arxiv_ids.update((line.strip(), None) for line in f if line.strip())
+
+        with open(save_path, "w") as f:
+            f.writelines(id + "\n" for id in arxiv_ids)
+        return len(arxiv_ids)
+
+
+async def crawl_month(
+    client: httpx.AsyncClient,
+    rate_limiter: HostRateLimiter,
+    state: CrawlState,
+    category: str,
+    year: int,
+    month: int,
+    link_template: str,
+    entries_per_page: int,
+) -> None:
+    month_state = state.month_state(year, month)
+    curr_page = month_state["pages_done"]
+    if month_state["complete"]:
+        if not is_open_month(year, month):
+            return
+        # older crawls marked open months complete and counted their last page as done
+        curr_page = max(curr_page - 1, 0)
+    while True:
+        ids = await fetch_arxiv_ids(
+            client,
+            rate_limiter,
+            category,
+            year,
+            month,
+            link_template,
+            curr_page,
+            entries_per_page,
+        )
+        if len(ids) == 0 and curr_page == 0:
+            # months without listings (e.g. in the future) are tried again on the next run
+            print(f"{category} {year}-{str(month).zfill(2)}: no entries")
+            return
+
+        # we check if there are more pages to fetch from
+        # this a very crude way to do this, but it works
+        last_page = len(ids) < entries_per_page
+        # the current and the previous month are crawled again on every run
+        state.add_page(
+            year,
+            month,
+            ids,
+            pages_done=curr_page if last_page else curr_page + 1,
+            complete=last_page and not is_open_month(year, month),
+        )
+        print(f"{category} {year}-{str(month).zfill(2)} page {curr_page}: {len(ids)}")
+
+        if last_page:
+            return
+        curr_page += 1
+
+
+async def crawl_categories(
+    categories: list[str],
+    start_year: int,
+    end_year: int,
+    data_root: str,
+    link_template: str,
+    entries_per_page: int = 2000,
+    seconds_per_request: float = 5.0,
+    max_concurrent_months: int = 4,
+) -> None:
+    # always wait a few seconds between requests to the same host to avoid getting blocked
+    # Play nice and keep this at 5 seconds or higher
+    # The ArXiv Team is working hard to provide this service for free
+    rate_limiter = HostRateLimiter(rate=1 / seconds_per_request)
+    semaphore = asyncio.Semaphore(max_concurrent_months)
+    states = {
+        category: CrawlState(os.path.join(data_root, category))
+        for category in categories
+    }
+
+    async def crawl_unit(category: str, year: int, month: int) -> None:
+        async with semaphore:
+            try:
+                await crawl_month(
+                    client,
+                    rate_limiter,
+                    states[category],
+                    category,
+                    year,
+                    month,
+                    link_template,
+                    entries_per_page,
+                )
+            except Exception as e:
+                # the month stays unfinished and is resumed on the next run
+                print(f"{category} {year}-{str(month).zfill(2)} failed: {e}")
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        await asyncio.gather(
+            *[
+                crawl_unit(category, year, month)
+                for category in categories
+                for year in range(start_year, end_year + 1)
+                for month in range(1, 13)
+            ]
+        )
+
+    for category, state in states.items():
+        num_ids = state.merge_ids(os.path.join(state.save_dir, "arxiv_ids.txt"))
+        print(f"{category}: {num_ids} IDs")
 
 
 FILE_DIR = os.path.dirname(os.path.abspath(__file__))
 # For an overview of the arXiv categories, see https://arxiv.org/archive
-CATEGORY = "cs"
+CATEGORIES = ["cs"]
 ENTRIES_PER_PAGE = 2000
 START_YEAR = 2013
 END_YEAR = 2021
 LINK_TEMPLATE = (
     "https://arxiv.org/list/{category}/{year}-{month}?skip={skip}&show={show}"
 )
-SAVE_DIR = os.path.join(FILE_DIR, "data", CATEGORY)
+DATA_ROOT = os.path.join(FILE_DIR, "data")
 
 if __name__ == "__main__":
-    os.makedirs(SAVE_DIR, exist_ok=True)
-
-    arxiv_ids = []
-    try:
-        for year in range(START_YEAR, END_YEAR + 1):
-            for month in range(1, 13):
-                curr_page = 0
-
-                # always sleep for a few seconds to avoid getting blocked
-                # Play nice and keep this at 5 seconds or higher
-                # The ArXiv Team is working hard to provide this service for free
-                time.sleep(5)
-                ids = fetch_arxiv_ids(
-                    CATEGORY,
-                    year,
-                    month,
-                    LINK_TEMPLATE,
-                    curr_page,
-                    ENTRIES_PER_PAGE,
-                )
-                arxiv_ids.extend(ids)
-
-                print(f"{year}-{str(month).zfill(2)}: {len(ids)}")
-
-                if len(ids) == 0:
-                    break
-
-                # we check if there are more pages to fetch from
-                # this a very crude way to do this, but it works
-                while len(ids) == ENTRIES_PER_PAGE:
-                    curr_page += 1
-
-                    time.sleep(5)
-                    ids = fetch_arxiv_ids(
-                        CATEGORY,
-                        year,
-                        month,
-                        LINK_TEMPLATE,
-                        curr_page,
-                        ENTRIES_PER_PAGE,
-                    )
-                    arxiv_ids.extend(ids)
-
-                    print(f"{year}-{str(month).zfill(2)}: {len(ids)}")
-
-    except Exception as e:
-        print(e)
-    finally:
-        np.savetxt(
-            os.path.join(
-                SAVE_DIR,
-                "arxiv_ids.txt",
-            ),
-            arxiv_ids,
-            fmt="%s",
+    asyncio.run(
+        crawl_categories(
+            CATEGORIES,
+            START_YEAR,
+            END_YEAR,
+            DATA_ROOT,
+            LINK_TEMPLATE,
+            ENTRIES_PER_PAGE,
         )
+    )
@@ -4,6 +4,8 @@ import chromadb
 import numpy as np
 import pandas as pd
 
+from utils.chroma_functions import build_metadatas, mark_collection_rebuilt
+from utils.corpus_store import load_embeddings, load_metadata
 from utils.etc_functions import load_env_vars
 from wrappers.openai_wrappers import OpenAI_Embedding
 
@@ -27,42 +29,24 @@ if __name__ == "__main__":
     CHROMA_CLIENT = chromadb.PersistentClient(CHROMA_ROOT)
 
     for subset in SUBSETS:
-        data_path = os.path.join(
-            FILE_PATH,
-            "data",
-            subset,
-            "arxiv_metadata_with_embeddings.pkl",
-        )
+        corpus_dir = os.path.join(FILE_PATH, "data", subset, "corpus")
 
         paper_context_collection = CHROMA_CLIENT.get_or_create_collection(
             name="arxiv_" + subset,
             embedding_function=EMBEDDING_FN,
         )
 
-        df: pd.DataFrame = pd.read_pickle(data_path)
-        df = df.drop_duplicates(subset=["arxiv_id"])
-        embeddings = np.array(df["abstract_embedding"].tolist(), dtype=np.float16)
+        df: pd.DataFrame = load_metadata(corpus_dir)
+        unique_rows = ~df.duplicated(subset=["arxiv_id"]).to_numpy()
+        df = df[unique_rows]
+        embeddings = np.array(
+            load_embeddings(corpus_dir)[unique_rows], dtype=np.float16
+        )
 
         # normalize embeddings, as we are using the cosine similarity under the hood
         embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
 
-        metadatas = []
-        for i, row in df.iterrows():
-            metadatas.append(
-                {
-                    "title": row["title"],
-                    "year": row["published"].year,
-                    "month": row["published"].month,
-                    "day": row["published"].day,
-                    "authors": ";".join(row["authors"]),
-                    "journal_ref": (
-                        row["journal_ref"] if str(row["journal_ref"]) != "<NA>" else "-"
-                    ),
-                    "doi": row["doi"] if str(row["doi"]) != "<NA>" else "-",
-                    "categories": ";".join(row["categories"]),
-                    "main_category": row["main_category"],
-                }
-            )
+        metadatas = build_metadatas(df)
 
         ids = df["arxiv_id"].tolist()
         documents = df["abstract"].tolist()
@@ -90,3 +74,5 @@ if __name__ == "__main__":
             )
 
         print(f"Collection count: {paper_context_collection.count()}")
+        # lets a running server know that it has to reload this collection
+        mark_collection_rebuilt(CHROMA_ROOT, "arxiv_" + subset)
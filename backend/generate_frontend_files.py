@@ -1,9 +1,17 @@
+import argparse
 import os
+from itertools import chain
+from typing import Iterable, Iterator
 
-import brotli
 import numpy as np
 import pandas as pd
 
+from utils.compression import BROTLI_QUALITY, ENCODINGS, compress_files
+from utils.corpus_store import load_metadata
+from utils.map_bundle import write_map_bundle
+from utils.map_tiles import write_tiles
+from utils.similarity_encoding import save_neighbours, similarity_integers
+
 
 def normalize_embeddings(embeddings):
     x_trafo = embeddings[:, 0]
@@ -13,6 +21,51 @@ def normalize_embeddings(embeddings):
     return np.array([x_trafo, y_trafo]).T
 
 
+# strings that stand for a missing value in the metadata, they are shown as "-"
+MISSING_STRINGS = ["None", "nan", "N/A"]
+
+
+def is_list_column(values: pd.Series) -> bool:
+    first = values.first_valid_index()
+    return first is not None and isinstance(values.loc[first], list)
+
+
+def print_cells(values: pd.Series) -> pd.Series:
+    """Every cell as str(value) prints it."""
+    if isinstance(values.dtype, pd.StringDtype):
+        # only the missing cells are not strings already
+        return values.fillna(str(values.dtype.na_value))
+    return pd.Series(values.to_numpy(dtype=object).astype(str), index=values.index)
+
+
+def format_column(values: pd.Series) -> list[str]:
+    """Formats a whole column at once, lists are joined by ";" and missing strings become "-".
+
+    Missing values and numbers are written as they are printed, like str(value).
+    """
+    list_column = is_list_column(values)
+    if list_column:
+        formatted = (
+            values.str.join(";")
+            .astype("string")
+            .str.replace(":. :;", "", regex=False)
+            .str.replace(" ", "", regex=False)
+        )
+        # None and nan cells of a list column are not joined
+        not_joined = formatted.isna()
+        formatted[not_joined] = print_cells(values[not_joined])
+    else:
+        formatted = print_cells(values)
+    formatted = formatted.str.replace("\n", " ", regex=False).str.replace(
+        "\t", " ", regex=False
+    )
+    if not list_column:
+        formatted = formatted.mask(
+            values.notna() & formatted.isin(MISSING_STRINGS), "-"
+        )
+    return formatted.tolist()
+
+
 def generate_formatted_data(
     data: pd.DataFrame,
     columns: list[str] = [
@@ -22,88 +75,93 @@ def generate_formatted_data(
         "main_category",
         "journal_ref",
     ],
-) -> list[list]:
-    def format_list(l: list) -> str:
-        return (
-            ";".join(l)
-            .replace(":. :;", "")
-            .replace(" ", "")
-            .replace("\n", " ")
-            .replace("\t", " ")
-        )
+    chunk_size: int = 50000,
+) -> Iterator[str]:
+    """Yields the rows of the TSV in chunks of chunk_size rows, each chunk as a single string.
 
-    def format_string(s: str | None) -> str:
-        if s is None:
-            return "-"
-        fs = s.replace("\n", " ").replace("\t", " ")
-        if fs == "None" or fs == "nan" or fs == "N/A":
-            fs = "-"
-        return fs
+    Every column of a chunk is formatted at once and the rows are joined in one go,
+    so only one chunk is ever held in memory as text.
+    """
+    for start in range(0, len(data), chunk_size):
+        chunk = data.iloc[start : start + chunk_size]
+        formatted_columns = [format_column(chunk[column]) for column in columns]
+        for column in ["x_umap", "y_umap"]:
+            formatted_columns.append(
+                [str(round(value, 5)) for value in chunk[column].tolist()]
+            )
+        yield "".join("\t".join(row) + "\n" for row in zip(*formatted_columns))
 
-    formatted_data = []
-    for _, data_point in data.iterrows():
 
-        formatted_list = []
+def generate_formatted_similarities(
+    similarity_values: np.ndarray,
+    similarity_idxs: np.ndarray,
+    chunk_size: int = 50000,
+) -> Iterator[str]:
+    """Yields the similarity list in chunks of chunk_size rows, each row as "idx,score;idx,score;...".
 
-        for column in columns:
-            value = data_point[column]
-            if isinstance(value, list):
-                formatted_list.append(format_list(value))
-            elif isinstance(value, str):
-                formatted_list.append(format_string(value))
-            else:
-                formatted_list.append(value)
+    The scores of a chunk are computed at once with the same rounding as f"{round(value,2) * 100:.0f}",
+    so only the row strings are built in Python.
+    """
+    for start in range(0, similarity_idxs.shape[0], chunk_size):
+        idxs = similarity_idxs[start : start + chunk_size, 1 : NUM_BEST_SIMS + 1]
+        values = similarity_values[start : start + chunk_size, 1 : NUM_BEST_SIMS + 1]
+        scores, negative_zeros = similarity_integers(values)
+        template = ";".join(["%d,%d"] * idxs.shape[1])
+        pairs = np.stack([idxs, scores], axis=2).reshape(len(idxs), -1).tolist()
+        lines = [template % tuple(row) for row in pairs]
+        # rounding a negative similarity to 0 prints "-0", these rows are formatted one by one like before
+        for row in np.flatnonzero(negative_zeros.any(axis=1)):
+            lines[row] = ";".join(
+                f"{idx},-0" if negative_zero else f"{idx},{score}"
+                for idx, score, negative_zero in zip(
+                    idxs[row], scores[row].tolist(), negative_zeros[row]
+                )
+            )
+        yield ("\n" if start > 0 else "") + "\n".join(lines)
 
-        formatted_list.append(round(data_point["x_umap"], 5))
-        formatted_list.append(round(data_point["y_umap"], 5))
 
-        formatted_data.append(formatted_list)
-    return formatted_data
+def similarity_scores(similarity_values: np.ndarray) -> np.ndarray:
+    # the same integers the text file holds, negative similarities are stored as 0
+    scores, _ = similarity_integers(similarity_values[:, 1 : NUM_BEST_SIMS + 1])
+    return np.clip(scores, 0, 255).astype(np.uint8)
 
 
-def generate_formatted_similarities(
+def save_map_bundle(
+    data: pd.DataFrame,
     similarity_values: np.ndarray,
     similarity_idxs: np.ndarray,
-) -> str:
-    out_strs = []
-    for node_idx in range(similarity_idxs.shape[0]):
-        node_vals = similarity_values[node_idx][1 : NUM_BEST_SIMS + 1]
-        node_conns = similarity_idxs[node_idx][1 : NUM_BEST_SIMS + 1]
-        out_strs.append(
-            ";".join(
-                [
-                    f"{node_conn},{round(node_val,2) * 100:.0f}"
-                    for node_val, node_conn in zip(node_vals, node_conns)
-                ]
-            )
-        )
-    return "\n".join(out_strs)
+    path_prefix: str,
+    string_columns: list[str],
+) -> None:
+    """Writes the TSV and the similarities as one binary map bundle, see utils/map_bundle.py.
+
+    The strings are formatted exactly like the TSV columns.
+    """
+    write_map_bundle(
+        path_prefix,
+        data[["x_umap", "y_umap"]].to_numpy(dtype=np.float64),
+        format_column(data["main_category"]),
+        similarity_idxs[:, 1 : NUM_BEST_SIMS + 1],
+        similarity_scores(similarity_values),
+        {column: format_column(data[column]) for column in string_columns},
+    )
 
 
 def save_data(
-    data: list[list],
+    data: Iterable[str],
     path: str,
     columns: list[str],
 ) -> None:
+    """Writes the header and the chunks of generate_formatted_data to path."""
     with open(path, "w", encoding="utf-8") as file:
-        file.write("\t".join(columns + ["x", "y"]) + "\n")
-        for line in data:
-            write_str = "\t".join(
-                [str(x).replace("\n", " ").replace("\t", " ") for x in line]
-            )
-            file.write(write_str + "\n")
+        for text in chain(["\t".join(columns + ["x", "y"]) + "\n"], data):
+            file.write(text)
 
 
-def save_similarities(similarities, path):
+def save_similarities(similarities: Iterable[str], path: str) -> None:
     with open(path, "w") as f:
-        f.write(similarities)
-
-
-def compress_file(path):
-    with open(path, "rb") as f:
-        compressed = brotli.compress(f.read(), mode=brotli.MODE_TEXT)
-        with open(path + ".br", "wb") as f2:
-            f2.write(compressed)
+        for text in similarities:
+            f.write(text)
 
 
 SUBSETS = [
@@ -124,20 +182,36 @@ COLUMNS = [
     "main_category",
     "journal_ref",
 ]
+# main_category is stored as codes, so it is not part of the string table of the bundle
+BUNDLE_STRING_COLUMNS = [
+    "arxiv_id",
+    "authors",
+    "title",
+    "journal_ref",
+]
 
 if __name__ == "__main__":
-    for subset in SUBSETS:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subsets", nargs="+", default=SUBSETS)
+    parser.add_argument("--encodings", nargs="+", default=ENCODINGS)
+    parser.add_argument("--brotli-quality", type=int, default=BROTLI_QUALITY)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    compress_paths = []
+    for subset in args.subsets:
         print(f"Processing {subset}...")
-        data_path = os.path.join(
-            DATA_ROOT, subset, "arxiv_metadata_with_embeddings.pkl"
-        )
+        corpus_dir = os.path.join(DATA_ROOT, subset, "corpus")
         sim_val = os.path.join(DATA_ROOT, subset, "best_scores.npy")
         sim_idx = os.path.join(DATA_ROOT, subset, "best_idxs.npy")
         data_save_path = os.path.join(DATA_ROOT, f"{subset}.tsv")
         sim_save_path = os.path.join(DATA_ROOT, f"{subset}.txt")
+        neighbours_save_path = os.path.join(DATA_ROOT, f"{subset}.neighbours.bin")
+        bundle_save_path = os.path.join(DATA_ROOT, subset)
+        tile_save_dir = os.path.join(DATA_ROOT, f"{subset}_tiles")
 
         print("Loading data...")
-        data = pd.read_pickle(data_path)
+        data = load_metadata(corpus_dir, columns=COLUMNS + ["x_umap", "y_umap"])
         similarity_values = np.load(sim_val)
         similarity_idxs = np.load(sim_idx)
 
@@ -166,6 +240,39 @@ if __name__ == "__main__":
             sim_save_path,
         )
 
-        print("Compressing files...")
-        compress_file(data_save_path)
-        compress_file(sim_save_path)
+        print("Saving binary similarities...")
+        save_neighbours(
+            neighbours_save_path,
+            similarity_values[:, 1 : NUM_BEST_SIMS + 1],
+            similarity_idxs[:, 1 : NUM_BEST_SIMS + 1],
+        )
+
+        compress_paths += [data_save_path, sim_save_path, neighbours_save_path]
+
+        # not compressed, the client fetches the sections of the bundle by range
+        print("Saving map bundle...")
+        save_map_bundle(
+            data,
+            similarity_values,
+            similarity_idxs,
+            bundle_save_path,
+            BUNDLE_STRING_COLUMNS,
+        )
+
+        print("Saving map tiles...")
+        write_tiles(
+            tile_save_dir,
+            data[["x_umap", "y_umap"]].to_numpy(dtype=np.float64),
+            format_column(data["main_category"]),
+        )
+
+    # all files of all subsets at once, files that did not change since the last run are skipped
+    print("Compressing files...")
+    compressed = compress_files(
+        compress_paths,
+        DATA_ROOT,
+        args.encodings,
+        args.brotli_quality,
+        args.workers,
+    )
+    print(f"Compressed {len(compressed)} of {len(compress_paths)} files")
@@ -1,10 +1,19 @@
+import argparse
+import json
 import os
-import time
 
 import numpy as np
-import pandas as pd
 import torch
 
+from utils.corpus_store import load_embeddings, load_metadata
+from utils.similarity_functions import (
+    build_hnsw_index,
+    hnsw_top_k_neighbors,
+    merge_new_neighbors,
+    top_k_neighbors,
+    tune_hnsw_ef,
+)
+
 SUBSETS = [
     "cond-mat",
     "hep",
@@ -17,28 +26,155 @@ FILE_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_ROOT = os.path.join(FILE_DIR, "data")
 
 NEIGHBORS = 100
+# Maximum size of the intermediate score matrix in bytes
+MEMORY_BUDGET = 2**30
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-if __name__ == "__main__":
-    for subset in SUBSETS:
-        dataframe_path = os.path.join(
-            DATA_ROOT,
-            subset,
-            "arxiv_metadata_with_embeddings.pkl",
+
+def hnsw_similarity_list(
+    embeddings: torch.Tensor,
+    index_dir: str,
+    recall_target: float,
+    recall_sample: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    embeddings_np = embeddings.cpu().numpy().astype(np.float32)
+    index = build_hnsw_index(embeddings_np, index_dir, recall_target)
+
+    # compare against the exact neighbours of a random sample to pick the search depth
+    rng = np.random.default_rng(42)
+    sample_rows = rng.choice(
+        embeddings_np.shape[0],
+        min(recall_sample, embeddings_np.shape[0]),
+        replace=False,
+    )
+    exact_idxs, _ = top_k_neighbors(
+        embeddings,
+        NEIGHBORS,
+        rows=torch.from_numpy(sample_rows).to(DEVICE),
+        memory_budget=MEMORY_BUDGET,
+        verbose=False,
+    )
+    ef, recall = tune_hnsw_ef(
+        index,
+        embeddings_np,
+        exact_idxs.cpu().numpy(),
+        sample_rows,
+        NEIGHBORS,
+        recall_target,
+    )
+    print(f"Recall@10 on {len(sample_rows)} sampled papers: {recall:.4f} (ef={ef})")
+
+    index.set_ef(ef)
+    return hnsw_top_k_neighbors(index, embeddings_np, NEIGHBORS)
+
+
+def list_settings(args: argparse.Namespace) -> dict:
+    # how the lists were computed, saved next to their row order in best_lists.json
+    settings = {"backend": args.backend, "neighbors": NEIGHBORS}
+    if args.backend == "hnsw":
+        settings["recall_target"] = args.recall_target
+    return settings
+
+
+def incremental_similarity_list(
+    embeddings: torch.Tensor,
+    arxiv_ids: np.ndarray,
+    subset_dir: str,
+    settings: dict,
+) -> tuple[np.ndarray, np.ndarray]:
+    ids_path = os.path.join(subset_dir, "best_arxiv_ids.npy")
+    settings_path = os.path.join(subset_dir, "best_lists.json")
+    if not os.path.exists(ids_path) or not os.path.exists(settings_path):
+        raise FileNotFoundError(
+            f"{ids_path} or {settings_path} does not exist, "
+            "run a full build without --incremental first"
         )
-        df = pd.read_pickle(dataframe_path)
 
-        embeddings = np.array(
-            df["abstract_embedding"].tolist(),
-            dtype=np.float16,
+    # exact neighbours merged into approximate lists would be neither exact nor of the measured recall
+    with open(settings_path, "r") as f:
+        old_settings = json.load(f)
+    if old_settings != settings:
+        raise ValueError(
+            f"The lists were computed with {old_settings}, not with {settings}, "
+            "run a full build without --incremental"
         )
-        arxiv_ids = np.array(
-            df["arxiv_id"].tolist(),
-            dtype=str,
+
+    old_ids = np.load(ids_path)
+    num_old = len(old_ids)
+    # the indices in the lists point to rows, so old papers must keep their position
+    if num_old > len(arxiv_ids) or not np.array_equal(old_ids, arxiv_ids[:num_old]):
+        raise ValueError(
+            "The papers of the last run are not a prefix of the current papers, "
+            "run a full build without --incremental"
         )
 
-        # remove the dataframe to save memory
-        del df
+    best_idxs = np.load(os.path.join(subset_dir, "best_idxs.npy"))
+    best_scores = np.load(os.path.join(subset_dir, "best_scores.npy"))
+    num_new = len(arxiv_ids) - num_old
+    print(f"Adding {num_new} new papers to {num_old} existing lists")
+    if num_new == 0:
+        return best_idxs, best_scores
+
+    # the neighbours of the new papers are computed against the whole corpus
+    new_idxs, new_scores = top_k_neighbors(
+        embeddings,
+        NEIGHBORS,
+        rows=torch.arange(num_old, len(arxiv_ids), device=DEVICE),
+        memory_budget=MEMORY_BUDGET,
+    )
+
+    # the lists of the old papers only need to be compared against the new papers
+    old_idxs, old_scores = merge_new_neighbors(
+        embeddings,
+        torch.from_numpy(best_idxs).to(DEVICE),
+        torch.from_numpy(best_scores).to(DEVICE),
+        memory_budget=MEMORY_BUDGET,
+    )
+
+    best_idxs = torch.cat([old_idxs, new_idxs]).cpu().numpy()
+    best_scores = torch.cat([old_scores, new_scores]).cpu().numpy()
+    return best_idxs, best_scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backend",
+        choices=["exact", "hnsw"],
+        default="exact",
+        help="exact blocked search or an approximate HNSW index",
+    )
+    parser.add_argument(
+        "--recall-target",
+        type=float,
+        default=0.95,
+        help="recall@10 the HNSW backend has to reach, lower values build faster",
+    )
+    parser.add_argument(
+        "--recall-sample",
+        type=int,
+        default=1000,
+        help="number of papers used to measure the recall of the HNSW backend",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only add the papers appended since the last run to the existing lists",
+    )
+    parser.add_argument("--subsets", nargs="+", default=SUBSETS)
+    args = parser.parse_args()
+
+    if args.incremental and args.backend != "exact":
+        parser.error("--incremental is only supported by the exact backend")
+
+    for subset in args.subsets:
+        corpus_dir = os.path.join(DATA_ROOT, subset, "corpus")
+
+        # only the ids are read from the metadata, the abstracts are never loaded
+        embeddings = load_embeddings(corpus_dir)
+        arxiv_ids = load_metadata(corpus_dir, columns=["arxiv_id"])[
+            "arxiv_id"
+        ].to_numpy(dtype=str)
 
         embeddings = torch.tensor(embeddings, dtype=torch.float16).to(DEVICE)
 
@@ -46,34 +182,37 @@ if __name__ == "__main__":
         # redo this just in case
         embeddings = embeddings / torch.norm(embeddings, dim=1).reshape(-1, 1)
 
-        best_idxs = torch.zeros(
-            (embeddings.shape[0], NEIGHBORS),
-            dtype=torch.int32,
-        ).to(DEVICE)
-        best_scores = torch.zeros(
-            (embeddings.shape[0], NEIGHBORS),
-            dtype=torch.float16,
-        ).to(DEVICE)
-
-        start = time.time()
-        print("Start")
-
-        for i in range(embeddings.shape[0]):
-            print(f"{i / embeddings.shape[0]:.4%}", end="\r")
-            # compute the cosine similarity between the current embedding and all other embeddings
-            # as the embeddings are normalized, this is equivalent to the dot product
-            # if you are really dareing you can use torch.matmul(embeddings, embeddings.T) to compute all similarities at once
-            # But this will quite literally eat all your memory and, if your kernel has a bad day, crash your system
-            scores = torch.matmul(embeddings, embeddings[i])
-            idxs = torch.argsort(scores, descending=True, dim=0)
-            best_idxs[i] = idxs[1 : NEIGHBORS + 1]
-            best_scores[i] = scores[idxs[1 : NEIGHBORS + 1]]
-
-        end = time.time()
-        print("Time taken:", end - start)
-
-        best_idxs = best_idxs.cpu().numpy().astype(np.int32)
-        best_scores = best_scores.cpu().numpy().astype(np.float16)
+        if args.incremental:
+            best_idxs, best_scores = incremental_similarity_list(
+                embeddings,
+                arxiv_ids,
+                os.path.join(DATA_ROOT, subset),
+                list_settings(args),
+            )
+        elif args.backend == "exact":
+            # score blocks of rows against the whole corpus at once
+            # MEMORY_BUDGET bounds the size of the intermediate score matrix
+            best_idxs, best_scores = top_k_neighbors(
+                embeddings,
+                NEIGHBORS,
+                memory_budget=MEMORY_BUDGET,
+            )
+            best_idxs = best_idxs.cpu().numpy()
+            best_scores = best_scores.cpu().numpy()
+        else:
+            best_idxs, best_scores = hnsw_similarity_list(
+                embeddings,
+                os.path.join(DATA_ROOT, subset),
+                args.recall_target,
+                args.recall_sample,
+            )
+
+        best_idxs = best_idxs.astype(np.int32)
+        best_scores = best_scores.astype(np.float16)
 
         np.save(os.path.join(DATA_ROOT, subset, "best_idxs.npy"), best_idxs)
         np.save(os.path.join(DATA_ROOT, subset, "best_scores.npy"), best_scores)
+        # the row order of the lists, needed to append new papers with --incremental
+        np.save(os.path.join(DATA_ROOT, subset, "best_arxiv_ids.npy"), arxiv_ids)
+        with open(os.path.join(DATA_ROOT, subset, "best_lists.json"), "w") as f:
+            json.dump(list_settings(args), f, indent=2)
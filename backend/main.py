@@ -1,84 +1,355 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
 
 import chromadb
-import pandas as pd
-from fastapi import FastAPI, HTTPException
+import httpx
+import numpy as np
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from utils.app_dataclasses import Document, Query
-from utils.chroma_functions import query_chroma_collection
-from utils.etc_functions import load_env_vars
-from utils.query_functions import process_results, rerank_results
+from utils.app_dataclasses import CandidateSet, Document, Query
+from utils.chroma_functions import (
+    CollectionRegistry,
+    hydrate_candidates,
+    new_chroma_client,
+    query_chroma_collection,
+    query_filtered_collection,
+)
+from utils.embedding_batcher import EmbeddingBatcher
+from utils.embedding_cache import EmbeddingCache
+from utils.etc_functions import ServerTiming, load_env_vars
+from utils.metadata_filter import FilterIndex, has_filters
+from utils.query_cache import QueryResultCache
+from utils.query_functions import (
+    build_documents,
+    prefilter_candidates,
+    rerank_results_async,
+    select_results,
+)
+from utils.vector_store import LocalVectorStore
+from wrappers.base_wrappers import Reranker
 from wrappers.cohere_wrappers import Cohere_Reranker
+from wrappers.onnx_wrappers import CrossEncoder_Reranker
 from wrappers.openai_wrappers import OpenAI_Embedding
 
 load_env_vars()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = asyncio.create_task(watch_collections())
+    yield
+    watcher.cancel()
+    await http_client.aclose()
+    reranker.close()
+    chroma_executor.shutdown(wait=False)
+
+
+FRONTEND_ORIGIN = "https://atlas.uslu.tech"
+
 # Apply CORS to all routes
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["https://atlas.uslu.tech"],
+    allow_origins=[FRONTEND_ORIGIN],
     allow_credentials=True,
     allow_methods=["POST"],
     allow_headers=["*"],
 )
 
 FILE_PATH = os.path.dirname(os.path.realpath(__file__))
-CHROMA_PATH = os.path.join(FILE_PATH, "data", "chroma")
+# the data folder can be moved, e.g. to serve a copy of the database
+DATA_PATH = os.environ.get("DATA_PATH", os.path.join(FILE_PATH, "data"))
+CHROMA_PATH = os.path.join(DATA_PATH, "chroma")
+# "chroma" or "local", the local engine serves the memory mapped collections of build_vector_store.py
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "chroma")
+VECTOR_STORE_PATH = os.path.join(DATA_PATH, "vector_store")
+EMBEDDING_CACHE_PATH = os.path.join(DATA_PATH, "embedding_cache")
+# "cohere" or "cross-encoder", the local cross-encoder needs an ONNX export in CROSS_ENCODER_PATH
+RERANKER_BACKEND = os.environ.get("RERANKER_BACKEND", "cohere")
+CROSS_ENCODER_PATH = os.path.join(DATA_PATH, "models", "cross_encoder")
 
-reranker = Cohere_Reranker()
-embedding_fn = OpenAI_Embedding(dim=256, verbose=False)
-chroma_client = chromadb.PersistentClient(CHROMA_PATH)
+# Chroma is not async, its calls run on a small dedicated pool
+# so a slow query can never occupy more than CHROMA_WORKERS threads
+CHROMA_WORKERS = 8
+# timeouts in seconds for the single stages of a query
+EMBEDDING_TIMEOUT = 10.0
+CHROMA_TIMEOUT = 10.0
+RERANK_TIMEOUT = 15.0
+# the query cache holds final results and candidate sets for up to an hour
+QUERY_CACHE_BYTES = 256 * 2**20
+QUERY_CACHE_TTL = 3600.0
+# only the best RERANK_CANDIDATES of the top_k candidates are sent to the reranker,
+# the prefilter ranks them by vector distance and to LEXICAL_WEIGHT by the query terms in title and abstract
+# a request can set its own rerank_candidates, RERANK_CANDIDATES=400 reranks all top_k candidates
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 100))
+LEXICAL_WEIGHT = 0.3
+# the reranker sees the candidates in stages of RERANK_STAGE_SIZE,
+# after a stage without a score above rerank_score_threshold the rest is not reranked
+RERANK_STAGE_SIZE = 25
+# seconds between two checks for collections rebuilt by create_chroma_collection.py or build_vector_store.py
+RELOAD_INTERVAL = 30.0
+# rounds of hydrating the hits, hits deleted from the collection are replaced in the next round
+HYDRATE_ATTEMPTS = 3
 
+# concurrent queries are embedded together, a batch waits at most EMBEDDING_BATCH_WINDOW seconds
+EMBEDDING_BATCH_WINDOW = 0.005
+EMBEDDING_MAX_BATCH_SIZE = 64
 
-@app.post("/query")
-def run_query(query: Query):
+# one connection pool shared by the OpenAI and Cohere clients
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+chroma_executor = ThreadPoolExecutor(CHROMA_WORKERS)
+
+reranker: Reranker
+if RERANKER_BACKEND == "cross-encoder":
+    reranker = CrossEncoder_Reranker(CROSS_ENCODER_PATH)
+else:
+    reranker = Cohere_Reranker(http_client=http_client)
+# popular search strings are served from the in-memory tier of the cache
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, memory_size=10000)
+embedding_fn = OpenAI_Embedding(
+    dim=256,
+    verbose=False,
+    cache=embedding_cache,
+    max_retries=2,
+    http_client=http_client,
+)
+embedding_batcher = EmbeddingBatcher(
+    embedding_fn.embed_async,
+    window=EMBEDDING_BATCH_WINDOW,
+    max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+)
+if SEARCH_BACKEND == "local":
+    search_path = VECTOR_STORE_PATH
+    search_client_factory = partial(LocalVectorStore, VECTOR_STORE_PATH)
+else:
+    search_path = CHROMA_PATH
+    search_client_factory = partial(new_chroma_client, CHROMA_PATH)
+collection_registry = CollectionRegistry(
+    search_client_factory, search_path, embedding_fn
+)
+query_cache = QueryResultCache(QUERY_CACHE_BYTES, QUERY_CACHE_TTL)
+
+
+async def run_stage(awaitable, timeout: float, stage: str):
     try:
-        collection = chroma_client.get_collection(
-            name="arxiv_" + query.category,
-            embedding_function=embedding_fn,
-        )
-    except ValueError:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
         raise HTTPException(
-            status_code=404,
-            detail="Collection not found, please rebuild the database",
+            status_code=504,
+            detail=f"{stage} timed out, please try again",
         )
 
-    documents: pd.DataFrame = query_chroma_collection(
-        collection=collection,
-        queries=[query.query],
-        top_k=query.top_k,
+
+def run_in_chroma_executor(fn, *args, **kwargs) -> asyncio.Future:
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(chroma_executor, partial(fn, *args, **kwargs))
+
+
+async def watch_collections() -> None:
+    # opens all collections at startup and reopens the ones that were rebuilt since
+    while True:
+        try:
+            reloaded = await run_in_chroma_executor(collection_registry.reload)
+            for name in reloaded:
+                query_cache.invalidate(name.removeprefix("arxiv_"))
+            if reloaded:
+                print(f"Loaded collections: {', '.join(reloaded)}")
+        except Exception as e:
+            print(f"Loading the collections failed: {e}")
+        await asyncio.sleep(RELOAD_INTERVAL)
+
+
+def collection_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=404,
+        detail="Collection not found, please rebuild the database",
     )
 
+
+async def get_collection(category: str) -> chromadb.Collection:
+    collection = await run_stage(
+        run_in_chroma_executor(collection_registry.get, "arxiv_" + category),
+        CHROMA_TIMEOUT,
+        "Loading the collection",
+    )
+    if collection is None:
+        raise collection_not_found()
+    return collection
+
+
+def find_filter_mask(query: Query) -> tuple[FilterIndex, np.ndarray]:
+    filter_index = collection_registry.filter_index("arxiv_" + query.category)
+    if filter_index is None:
+        raise collection_not_found()
+    return filter_index, filter_index.mask(query)
+
+
+def rerank_candidates(query: Query) -> int:
+    if query.rerank_candidates is not None:
+        return query.rerank_candidates
+    return min(max(RERANK_CANDIDATES, query.top_n), query.top_k)
+
+
+async def fetch_candidates(query: Query, timing: ServerTiming) -> CandidateSet:
+    collection = await get_collection(query.category)
+
+    # all top_k hits pass the filters, see query_filtered_collection
+    filter_index = filter_mask = None
+    if has_filters(query):
+        with timing.measure("filter"):
+            filter_index, filter_mask = await run_stage(
+                run_in_chroma_executor(find_filter_mask, query),
+                CHROMA_TIMEOUT,
+                "Filtering the collection",
+            )
+
+    with timing.measure("embed"):
+        query_embedding = await run_stage(
+            embedding_batcher.embed(query.query),
+            EMBEDDING_TIMEOUT,
+            "Embedding the query",
+        )
+
+    search = query_chroma_collection
+    if filter_mask is not None:
+        search = partial(
+            query_filtered_collection,
+            filter_index=filter_index,
+            filter_mask=filter_mask,
+        )
+    with timing.measure("search"):
+        candidates = await run_stage(
+            run_in_chroma_executor(
+                search,
+                collection=collection,
+                queries=[query.query],
+                top_k=query.top_k,
+                query_embeddings=[query_embedding],
+                # without a rerank only the final top_n abstracts are ever needed
+                include_documents=query.use_rerank,
+            ),
+            CHROMA_TIMEOUT,
+            "Searching the collection",
+        )
+
     if query.use_rerank:
-        documents: pd.DataFrame = rerank_results(
-            query=query.query,
-            documents=documents,
-            reranker=reranker,
+        # only the best candidates of the cheap prefilter go to the expensive reranker
+        with timing.measure("prefilter"):
+            candidates = prefilter_candidates(
+                query=query.query,
+                candidates=candidates,
+                max_candidates=rerank_candidates(query),
+                lexical_weight=LEXICAL_WEIGHT,
+            )
+        with timing.measure("rerank"):
+            candidates = await run_stage(
+                rerank_results_async(
+                    query=query.query,
+                    candidates=candidates,
+                    reranker=reranker,
+                    rerank_score_threshold=query.rerank_score_threshold,
+                    stage_size=RERANK_STAGE_SIZE,
+                ),
+                RERANK_TIMEOUT,
+                "Reranking",
+            )
+    return candidates
+
+
+@app.post("/query")
+async def run_query(query: Query, response: Response):
+    timing = ServerTiming()
+    try:
+        return await answer_query(query, timing)
+    finally:
+        # the durations of the stages show up in the network tab of the browser
+        response.headers["Server-Timing"] = timing.header()
+        response.headers["Timing-Allow-Origin"] = FRONTEND_ORIGIN
+
+
+async def answer_query(query: Query, timing: ServerTiming) -> list[Document]:
+    result_key = query_cache.result_key(query)
+    with timing.measure("cache"):
+        results = query_cache.get(result_key)
+    if results is not None:
+        return results
+
+    # read before the candidates are computed, so results of a rebuilt collection are never cached
+    version = query_cache.version(query.category)
+    candidate_key = query_cache.candidate_key(query)
+    candidates = query_cache.get(candidate_key)
+    if candidates is None:
+        candidates = await fetch_candidates(query, timing)
+        query_cache.put(candidate_key, query.category, candidates, version)
+
+    # hits deleted from the collection since the search, e.g. during a rebuild, cannot be hydrated
+    # they are dropped from the candidates and the next best ones take their place
+    for attempt in range(HYDRATE_ATTEMPTS):
+        with timing.measure("select"):
+            idxs, scores = select_results(
+                candidates=candidates,
+                top_n=query.top_n,
+                rerank_score_threshold=query.rerank_score_threshold,
+            )
+        if all(candidates.contents[i] is not None for i in idxs):
+            break
+
+        collection = await get_collection(query.category)
+        with timing.measure("hydrate"):
+            await run_stage(
+                run_in_chroma_executor(
+                    hydrate_candidates, collection, candidates, idxs
+                ),
+                CHROMA_TIMEOUT,
+                "Loading the documents",
+            )
+        # the candidates are hydrated in place, so the cached entry grew
+        query_cache.refresh_size(candidate_key)
+
+        deleted = [i for i in idxs if candidates.contents[i] is None]
+        if not deleted or attempt == HYDRATE_ATTEMPTS - 1:
+            break
+        candidates = candidates.subset(
+            np.setdiff1d(np.arange(len(candidates)), deleted)
         )
+        query_cache.put(candidate_key, query.category, candidates, version)
 
-    documents: pd.DataFrame = process_results(
-        documents=documents,
-        top_n=query.top_n,
-        rerank_score_threshold=query.rerank_score_threshold,
-    )
+    results = build_documents(candidates, idxs, scores)
+    # hits that could still not be loaded are skipped, such a short result is not cached
+    if len(results) == len(idxs):
+        query_cache.put(result_key, query.category, results, version)
+    return results
+
+
+@app.get("/metrics")
+def get_metrics():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "query_cache": query_cache.stats(),
+    }
 
-    return [Document(**doc) for doc in documents.to_dict(orient="records")]
+
+@app.get("/ready")
+def get_ready():
+    # answers with 503 until all collections are opened and warmed
+    status = collection_registry.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
 @app.get("/abstract/{category}/{document_id}")
 def run_query(category: str, document_id: str):
-    try:
-        collection = chroma_client.get_collection(
-            name="arxiv_" + category,
-            embedding_function=embedding_fn,
-        )
-    except ValueError:
-        raise HTTPException(
-            status_code=404,
-            detail="Collection not found, please rebuild the database",
-        )
+    collection = collection_registry.get("arxiv_" + category)
+    if collection is None:
+        raise collection_not_found()
 
     document = collection.get(document_id, include=["documents"])["documents"]
     if len(document) == 0:
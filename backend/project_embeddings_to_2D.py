@@ -2,9 +2,10 @@ import os
 
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import umap
 
+from utils.corpus_store import load_embeddings, load_metadata, save_metadata
+
 SUBSETS = [
     "cond-mat",
     "hep",
@@ -22,16 +23,11 @@ N_EPOCHS = 200
 
 if __name__ == "__main__":
     for subset in SUBSETS:
-        data_path = os.path.join(
-            DATA_ROOT,
-            subset,
-            "arxiv_metadata_with_embeddings.pkl",
-        )
+        corpus_dir = os.path.join(DATA_ROOT, subset, "corpus")
         save_dir = os.path.join(DATA_ROOT, subset, "projections")
         os.makedirs(save_dir, exist_ok=True)
 
-        df = pd.read_pickle(data_path)
-        embeddings = np.array(df["abstract_embedding"].tolist(), dtype=np.float16)
+        embeddings = np.array(load_embeddings(corpus_dir), dtype=np.float16)
         embeddings /= np.linalg.norm(embeddings, axis=1).reshape(-1, 1)
 
         reducer = umap.UMAP(
@@ -63,16 +59,10 @@ if __name__ == "__main__":
             X_transformed,
         )
 
+        df = load_metadata(corpus_dir)
         df["x_umap"] = x_trafo
         df["y_umap"] = y_trafo
-
-        df.to_pickle(
-            os.path.join(
-                DATA_ROOT,
-                subset,
-                "arxiv_metadata_with_embeddings.pkl",
-            ),
-        )
+        save_metadata(df, corpus_dir)
 
         # Plot the UMAP projection for inspection
         plt.scatter(X_transformed[:, 0], X_transformed[:, 1], s=1)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the scripts of the backend import each other from the backend folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_frontend_files import NUM_BEST_SIMS
+
+
+@pytest.fixture
+def build_similarities():
+    def build(
+        num_papers: int = 300, score_dtype=np.float16, idx_dtype=np.int64
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # the first column is the paper itself, like in best_idxs.npy
+        rng = np.random.default_rng(1)
+        idxs = rng.integers(0, max(num_papers, 1), (num_papers, NUM_BEST_SIMS + 1))
+        idxs[:, 0] = np.arange(num_papers)
+        values = rng.uniform(-0.2, 1.0, (num_papers, NUM_BEST_SIMS + 1))
+        values[:, 0] = 1.0
+        # values that round to "-0", halfway cases and the ends of the range
+        values[::7, 1] = -0.0
+        values[::11, 2] = -0.004
+        values[::13, 3] = 0.125
+        values[::17, 4] = 0.005
+        values[::19, 5] = 1.0
+        values[::23, 6] = -1.0
+        return values.astype(score_dtype), idxs.astype(idx_dtype)
+
+    return build
@@ -0,0 +1,19 @@
+# The way the frontend reads the files generate_frontend_files.py writes
+import numpy as np
+
+
+def parse_tsv(path: str) -> dict[str, list[str]]:
+    # parseData
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    header = lines[0].split("\t")
+    rows = [line.split("\t") for line in lines[1:] if line]
+    return {column: [row[i] for row in rows] for i, column in enumerate(header)}
+
+
+def parse_similarities(text: str) -> tuple[np.ndarray, np.ndarray]:
+    # parseConnectivityList
+    pairs = [[pair.split(",") for pair in line.split(";")] for line in text.split("\n")]
+    idxs = np.array([[int(idx) for idx, _ in row] for row in pairs])
+    scores = np.array([[int(score) for _, score in row] for row in pairs])
+    return idxs, scores
@@ -0,0 +1,154 @@
+# The implementations the backend used to have, kept here unchanged as the reference of the tests
+import re
+
+import numpy as np
+import pandas as pd
+
+from generate_frontend_files import NUM_BEST_SIMS
+
+
+def legacy_generate_formatted_data(
+    data: pd.DataFrame,
+    columns: list[str],
+) -> list[list]:
+    # generate_frontend_files.py
+    def format_list(l: list) -> str:
+        return (
+            ";".join(l)
+            .replace(":. :;", "")
+            .replace(" ", "")
+            .replace("\n", " ")
+            .replace("\t", " ")
+        )
+
+    def format_string(s: str | None) -> str:
+        if s is None:
+            return "-"
+        fs = s.replace("\n", " ").replace("\t", " ")
+        if fs == "None" or fs == "nan" or fs == "N/A":
+            fs = "-"
+        return fs
+
+    formatted_data = []
+    for _, data_point in data.iterrows():
+
+        formatted_list = []
+
+        for column in columns:
+            value = data_point[column]
+            if isinstance(value, list):
+                formatted_list.append(format_list(value))
+            elif isinstance(value, str):
+                formatted_list.append(format_string(value))
+            else:
+                formatted_list.append(value)
+
+        formatted_list.append(round(data_point["x_umap"], 5))
+        formatted_list.append(round(data_point["y_umap"], 5))
+
+        formatted_data.append(formatted_list)
+    return formatted_data
+
+
+def legacy_save_data(
+    data: list[list],
+    path: str,
+    columns: list[str],
+) -> None:
+    # generate_frontend_files.py
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\t".join(columns + ["x", "y"]) + "\n")
+        for line in data:
+            write_str = "\t".join(
+                [str(x).replace("\n", " ").replace("\t", " ") for x in line]
+            )
+            file.write(write_str + "\n")
+
+
+def legacy_generate_formatted_similarities(
+    similarity_values: np.ndarray,
+    similarity_idxs: np.ndarray,
+) -> str:
+    # generate_frontend_files.py
+    out_strs = []
+    for node_idx in range(similarity_idxs.shape[0]):
+        node_vals = similarity_values[node_idx][1 : NUM_BEST_SIMS + 1]
+        node_conns = similarity_idxs[node_idx][1 : NUM_BEST_SIMS + 1]
+        out_strs.append(
+            ";".join(
+                [
+                    f"{node_conn},{round(node_val,2) * 100:.0f}"
+                    for node_val, node_conn in zip(node_vals, node_conns)
+                ]
+            )
+        )
+    return "\n".join(out_strs)
+
+
+def legacy_lint_text(string: str) -> str:
+    # lint_text of utils/arxiv_functions.py
+    string = string.replace("\r\n", " ")
+    string = string.replace("\xa0", " ")
+    string = string.replace("\n", " ")
+    string = string.replace("—", "-")
+    string = string.replace("–", "-")
+    string = string.replace("…", "...")
+    string = string.replace("’", "'")
+    string = string.replace("”", "'")
+    string = string.replace("“", "'")
+
+    string = re.sub(r"\b([A-Za-z0-9]+) \{\}", r"{\1}", string)
+    string = string.replace("{}", "")
+    string = string.encode("utf-8", "ignore").decode("utf-8")
+    string = string.replace("\\sim", "~")
+    string = string.replace("\\times", "x")
+    string = string.replace(" .", ".")
+    string = string.replace(" ,", ",")
+
+    string = re.sub(r"\\label{.*?}", "", string)
+    string = re.sub(r"\\begin{equation}", "$", string)
+    string = re.sub(r"\\end{equation}", "$", string)
+    string = re.sub(r"\\begin{equation\*}", "$", string)
+    string = re.sub(r"\\end{equation\*}", "$", string)
+    string = re.sub(r"\\FLP", "", string)
+    string = re.sub(r"\\\\\[.*?]", "", string)
+    string = re.sub(r"\\biggl", " ", string)
+    string = re.sub(r"\\biggr", " ", string)
+    string = re.sub(r"\\Biggl", " ", string)
+    string = re.sub(r"\\Biggr", " ", string)
+    string = re.sub(r"\\tfrac", r"\\frac", string)
+    string = re.sub(r"\\notag", "", string)
+    string = re.sub(r"\\\\", " ", string)
+
+    string = re.sub(r"\\;", " ", string)
+    string = re.sub(r"\\,", " ", string)
+    string = re.sub(r"\\:", " ", string)
+    string = re.sub(r"\\!", " ", string)
+    string = re.sub(r"\\quad", " ", string)
+
+    string = re.sub(r"\\([a-zA-Z])op", r"\\hat{\1}", string)
+    string = re.sub(r"\\([a-zA-Z])dotop", r"\\hat{\\dot{\1}}", string)
+
+    string = re.sub(r"\\expval{(.*?)}", r"\\braket{\1}", string)
+    string = re.sub(r"\\av{(.*?)}", r"\\bar{\1}", string)
+    string = re.sub(r"\\abs{(.*?)}", r"|\1|", string)
+
+    string = re.sub(r"\\ketsl{(.*?)}", r"\\ket{\1}", string)
+    string = re.sub(r"\\barsl{(.*?)}", r"\\bar{\1}", string)
+    string = re.sub(r"\\slOne", "1", string)
+    string = re.sub(r"\\slTwo", "2", string)
+
+    # find all \\ddp{SOMETEXT}{TEXT} and replace them with \\frac{\\partial SOMETEXT}{\\partial TEXT}
+    string = re.sub(
+        r"\\ddp{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
+    )
+    string = re.sub(
+        r"\\ddpl{(.*?)}{(.*?)}", r"\\frac{\\partial \1}{\\partial \2}", string
+    )
+    string = re.sub(r"\\ddt{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
+    string = re.sub(r"\\ddtl{(.*?)}{(.*?)}", r"\\frac{d \1}{d \2}", string)
+
+    # condense all whitespace to a single space
+    string = re.sub(r"\s+", " ", string)
+
+    return string
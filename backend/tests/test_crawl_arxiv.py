@@ -0,0 +1,31 @@
+from crawl_arxiv_api_with_ids import COLUMNS, query_arxiv_with_ids
+from utils.arxiv_functions import parse_arxiv_response
+
+RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom">
+  <entry>
+    <id>http://arxiv.org/abs/2101.00001v2</id>
+    <updated>2021-03-04T17:12:45Z</updated>
+    <published>2021-01-01T00:01:13Z</published>
+    <title>A title</title>
+    <summary>An abstract.</summary>
+    <author><name>Alice Example</name></author>
+    <arxiv:journal_ref>Phys. Rev. B 12, 345 (2021)</arxiv:journal_ref>
+    <arxiv:primary_category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+    <category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>
+</feed>
+"""
+
+
+def test_columns_match_parsed_entries():
+    records = parse_arxiv_response(RESPONSE)
+    assert len(records) == 1
+    assert list(records[0]) == COLUMNS
+
+
+def test_nothing_found(tmp_path):
+    df = query_arxiv_with_ids([], str(tmp_path / "checkpoint.jsonl"))
+    assert list(df.columns) == COLUMNS
+    # the filter of the crawler runs on an empty result as well
+    assert len(df[df["main_category"].str.startswith("cs")]) == 0
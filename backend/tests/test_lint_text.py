@@ -0,0 +1,37 @@
+import json
+import os
+import random
+
+import pytest
+
+from legacy import legacy_lint_text
+from utils.arxiv_functions import lint_text
+
+GOLDEN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "lint_text_golden.jsonl"
+)
+with open(GOLDEN_PATH, "r", encoding="utf-8") as f:
+    GOLDEN = [json.loads(line) for line in f]
+
+# pieces every rule looks for, glued together at random they hit the order in which the rules feed each other
+TOKENS = [
+    " ", "  ", "\n", "\r\n", "\xa0", "\t", ".", ",", " .", " ,", "a", "Z", "9", "word",
+    "{", "}", "{}", "[", "]", "$", "\\", "\\\\", "\\\\[2pt]", "—", "–", "…", "’", "”", "“",
+    "\\sim", "\\times", "\\label{eq:1}", "\\begin{equation}", "\\end{equation}",
+    "\\begin{equation*}", "\\end{equation*}", "\\FLP", "\\biggl", "\\biggr", "\\Biggl",
+    "\\Biggr", "\\tfrac", "\\notag", "\\;", "\\,", "\\:", "\\!", "\\quad", "\\aop",
+    "\\xdotop", "\\expval{", "\\av{", "\\abs{", "\\ketsl{", "\\barsl{", "\\slOne",
+    "\\slTwo", "\\ddp{", "\\ddpl{", "\\ddt{", "\\ddtl{", "\ud800",
+]  # fmt: skip
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=range(len(GOLDEN)))
+def test_golden(case):
+    assert lint_text(case["input"]) == case["output"]
+
+
+def test_random_token_strings():
+    rng = random.Random(0)
+    for _ in range(5000):
+        string = "".join(rng.choices(TOKENS, k=rng.randint(0, 30)))
+        assert lint_text(string) == legacy_lint_text(string), repr(string)
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from frontend import parse_similarities, parse_tsv
+from generate_frontend_files import (
+    BUNDLE_STRING_COLUMNS,
+    COLUMNS,
+    NUM_BEST_SIMS,
+    generate_formatted_data,
+    generate_formatted_similarities,
+    save_data,
+    save_map_bundle,
+    save_similarities,
+)
+from utils.map_bundle import COORDINATE_LEVELS, MapBundle
+
+
+def build_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "arxiv_id": ["2101.00001", "hep-th/9901001", "2101.00003", "2101.00004"],
+            "authors": [
+                ["Ada Lovelace", "Alan Turing"],
+                ["Émile Borel", ":. :"],
+                ["Single Author"],
+                ["José\tNewline\nAuthor", ":. :", "Second Author"],
+            ],
+            "title": [
+                "A study of graphs",
+                "On the vacuum\nwith a line break",
+                "Tabs\tin titles",
+                "Ünïcödé – résumé 数学",
+            ],
+            "main_category": ["cs.LG", "hep-th", None, "cs.LG"],
+            "journal_ref": ["Phys. Rev. B 12, 345 (2020)", None, "nan", "N/A"],
+            "x_umap": [0.1, -3.25, 7.5, 2.0],
+            "y_umap": [1.0, 1.0, 1.0, 1.0],
+        }
+    )
+
+
+def write_files(tmp_path, data, values, idxs) -> tuple[str, str, str]:
+    tsv_path = os.path.join(tmp_path, "subset.tsv")
+    txt_path = os.path.join(tmp_path, "subset.txt")
+    bundle_path = os.path.join(tmp_path, "subset")
+    save_data(generate_formatted_data(data, COLUMNS), tsv_path, COLUMNS)
+    save_similarities(generate_formatted_similarities(values, idxs), txt_path)
+    save_map_bundle(data, values, idxs, bundle_path, BUNDLE_STRING_COLUMNS)
+    return tsv_path, txt_path, bundle_path
+
+
+def test_bundle_matches_tsv_and_similarities(tmp_path, build_similarities):
+    data = build_frame()
+    values, idxs = build_similarities(len(data))
+    tsv_path, txt_path, bundle_path = write_files(tmp_path, data, values, idxs)
+
+    tsv = parse_tsv(tsv_path)
+    bundle = MapBundle(bundle_path)
+    assert len(bundle) == len(data)
+    for column in BUNDLE_STRING_COLUMNS:
+        assert bundle.strings(column) == tsv[column]
+    assert bundle.strings("title", 1, 3) == tsv["title"][1:3]
+    assert bundle.main_categories() == tsv["main_category"]
+
+    with open(txt_path, "r") as f:
+        text_idxs, text_scores = parse_similarities(f.read())
+    bundle_idxs, bundle_scores = bundle.neighbours()
+    np.testing.assert_array_equal(bundle_idxs, text_idxs)
+    np.testing.assert_array_equal(bundle_scores, np.clip(text_scores, 0, 255))
+
+    # within one quantization step of the coordinates, which the TSV rounds to 5 decimals
+    span = np.array(bundle.manifest["coordinate_span"])
+    expected = np.stack(
+        [np.array(tsv["x"], dtype=np.float64), np.array(tsv["y"], dtype=np.float64)],
+        axis=1,
+    )
+    assert np.all(
+        np.abs(bundle.coordinates() - expected) <= span / COORDINATE_LEVELS + 5e-6
+    )
+
+
+def test_empty_subset(tmp_path, build_similarities):
+    data = build_frame().iloc[:0]
+    values, idxs = build_similarities(0)
+    _, _, bundle_path = write_files(tmp_path, data, values, idxs)
+
+    bundle = MapBundle(bundle_path)
+    assert len(bundle) == 0
+    assert bundle.coordinates().shape == (0, 2)
+    assert bundle.main_categories() == []
+    assert bundle.strings("title") == []
+    assert bundle.neighbours()[0].shape == (0, NUM_BEST_SIMS)
+
+
+@pytest.mark.parametrize("main_category", [None, np.nan])
+def test_missing_main_categories(tmp_path, build_similarities, main_category):
+    data = build_frame()
+    data["main_category"] = [main_category] * len(data)
+    values, idxs = build_similarities(len(data))
+    tsv_path, _, bundle_path = write_files(tmp_path, data, values, idxs)
+
+    assert (
+        MapBundle(bundle_path).main_categories() == parse_tsv(tsv_path)["main_category"]
+    )
@@ -0,0 +1,31 @@
+import numpy as np
+
+from utils.map_tiles import load_tile_index, read_tile, write_tiles
+
+
+def test_every_paper_is_in_one_tile(tmp_path):
+    rng = np.random.default_rng(0)
+    coordinates = rng.normal(size=(3000, 2)) * [5.0, 0.5]
+    main_categories = ["cs.LG", None, "hep-th"] * 1000
+    index = write_tiles(str(tmp_path), coordinates, main_categories, 500)
+
+    assert load_tile_index(str(tmp_path)) == index
+    assert index["categories"] == ["None", "cs.LG", "hep-th"]
+    rows, tile_coordinates, codes = zip(
+        *[read_tile(str(tmp_path), index, tile) for tile in index["tiles"]]
+    )
+    rows = np.concatenate(rows)
+    np.testing.assert_array_equal(np.sort(rows), np.arange(len(coordinates)))
+    span = np.array(index["coordinate_span"])
+    assert np.all(
+        np.abs(np.concatenate(tile_coordinates) - coordinates[rows]) <= span / 65535
+    )
+    categories = np.array(index["categories"])[np.concatenate(codes)]
+    assert categories.tolist() == [str(main_categories[row]) for row in rows]
+
+
+def test_empty_subset(tmp_path):
+    index = write_tiles(str(tmp_path / "tiles"), np.zeros((0, 2)), [])
+    assert index["count"] == 0
+    assert index["tiles"] == []
+    assert load_tile_index(str(tmp_path / "tiles")) == index
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+import utils.chroma_functions as chroma_functions
+from utils.app_dataclasses import Query
+from utils.chroma_functions import query_chroma_collection, query_filtered_collection
+from utils.metadata_filter import FilterIndex
+from utils.vector_store import LocalCollection, LocalVectorStore, write_collection
+
+NUM_DOCS = 2000
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    # the local collection searches exactly, without its cheap id filter it is handled like Chroma
+    monkeypatch.setattr(LocalCollection, "cheap_id_filter", False)
+    monkeypatch.setattr(chroma_functions, "MAX_FILTER_IDS", 100)
+    rng = np.random.default_rng(5)
+    embeddings = rng.standard_normal((NUM_DOCS, 16)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ids = [f"{i:07d}" for i in range(NUM_DOCS)]
+    metadatas = [
+        {
+            "title": f"Paper {i}",
+            "year": 2010 + i % 15,
+            "month": 1 + i % 12,
+            "day": 1,
+            "authors": f"Author {i % 300}",
+            "journal_ref": "-",
+            "doi": "-",
+            "categories": "cs.LG;cs.AI" if i % 4 == 0 else "cs.CV",
+            "main_category": "cs.LG" if i % 4 == 0 else "cs.CV",
+        }
+        for i in range(NUM_DOCS)
+    ]
+    documents = [f"abstract {i}" for i in range(NUM_DOCS)]
+    write_collection(
+        str(tmp_path / "arxiv_test"), ids, embeddings, documents, metadatas
+    )
+    collection = LocalVectorStore(str(tmp_path)).get_collection("arxiv_test")
+    return collection, embeddings, FilterIndex(ids, metadatas)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        # over-fetched, a fourth and three quarters of the papers match
+        {"main_category": "cs.LG"},
+        {"main_category": "cs.CV"},
+        # passed as ids
+        {"author": "author 17"},
+    ],
+)
+@pytest.mark.parametrize("include_documents", [False, True])
+def test_same_hits_as_with_ids(collection, filters, include_documents):
+    collection, embeddings, filter_index = collection
+    query = Query(query="", category="test", **filters)
+    mask = filter_index.mask(query)
+    for embedding in embeddings[:20]:
+        expected = query_chroma_collection(
+            [""],
+            collection,
+            50,
+            [embedding.tolist()],
+            include_documents,
+            ids=filter_index.matching_ids(query),
+        )
+        candidates = query_filtered_collection(
+            [""],
+            collection,
+            filter_index,
+            mask,
+            50,
+            [embedding.tolist()],
+            include_documents,
+        )
+        assert candidates.ids == expected.ids
+        np.testing.assert_allclose(candidates.distances, expected.distances)
+        assert candidates.contents == expected.contents
+        assert candidates.metadatas == expected.metadatas
+
+
+def test_falls_back_to_ids(collection, monkeypatch):
+    # too few hits are over-fetched to find top_k matching ones
+    collection, embeddings, filter_index = collection
+    monkeypatch.setattr(chroma_functions, "OVER_FETCH_FACTOR", 0.5)
+    searches = []
+    search = chroma_functions.query_chroma_collection
+    monkeypatch.setattr(
+        chroma_functions,
+        "query_chroma_collection",
+        lambda *args, **kwargs: searches.append(kwargs) or search(*args, **kwargs),
+    )
+
+    query = Query(query="", category="test", main_category="cs.LG")
+    mask = filter_index.mask(query)
+    candidates = query_filtered_collection(
+        [""], collection, filter_index, mask, 50, [embeddings[0].tolist()], False
+    )
+    expected = search(
+        [""],
+        collection,
+        50,
+        [embeddings[0].tolist()],
+        False,
+        ids=filter_index.matching_ids(query),
+    )
+    assert [kwargs.get("ids") is not None for kwargs in searches] == [False, True]
+    assert candidates.ids == expected.ids
@@ -0,0 +1,64 @@
+import asyncio
+
+import numpy as np
+
+from utils.app_dataclasses import CandidateSet
+from utils.query_functions import rerank_results_async, select_results
+
+
+class FakeReranker:
+    def __init__(self, scores: dict[str, float]) -> None:
+        self.scores = scores
+        self.calls: list[list[str]] = []
+
+    async def rerank_async(self, query, documents, doc_ids):
+        self.calls.append(list(doc_ids))
+        return [self.scores[id] for id in doc_ids]
+
+
+def build_candidates(num_candidates: int) -> CandidateSet:
+    ids = [f"2101.{i:05d}" for i in range(num_candidates)]
+    return CandidateSet(
+        ids=ids,
+        distances=np.linspace(0.1, 1.0, num_candidates),
+        contents=[f"abstract {id}" for id in ids],
+        metadatas=[{"title": id} for id in ids],
+    )
+
+
+def test_stops_after_a_stage_without_relevant_candidates():
+    candidates = build_candidates(100)
+    # only the first 30 candidates of the search are relevant
+    reranker = FakeReranker(
+        {id: 0.9 if i < 30 else 0.01 for i, id in enumerate(candidates.ids)}
+    )
+    reranked = asyncio.run(
+        rerank_results_async("query", candidates, reranker, 0.1, stage_size=25)
+    )
+    # the third stage is the first one without a relevant candidate, the fourth is skipped
+    assert [len(ids) for ids in reranker.calls] == [25, 25, 25]
+    assert np.all(np.isnan(reranked.rerank_scores[75:]))
+
+    idxs, _ = select_results(reranked, top_n=5, rerank_score_threshold=0.1)
+    assert list(idxs) == [0, 1, 2, 3, 4]
+
+
+def test_stages_have_about_the_same_size():
+    candidates = build_candidates(26)
+    reranker = FakeReranker({id: 0.9 for id in candidates.ids})
+    reranked = asyncio.run(
+        rerank_results_async("query", candidates, reranker, 0.1, stage_size=25)
+    )
+    assert [len(ids) for ids in reranker.calls] == [13, 13]
+    assert sum(reranker.calls, []) == candidates.ids
+    assert not np.any(np.isnan(reranked.rerank_scores))
+
+
+def test_without_threshold_all_candidates_are_reranked_at_once():
+    candidates = build_candidates(60)
+    reranker = FakeReranker({id: 0.0 for id in candidates.ids})
+    reranked = asyncio.run(
+        rerank_results_async("query", candidates, reranker, stage_size=25)
+    )
+    assert [len(ids) for ids in reranker.calls] == [60]
+    np.testing.assert_array_equal(reranked.rerank_scores, np.zeros(60))
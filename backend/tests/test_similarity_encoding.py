@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from frontend import parse_similarities
+from generate_frontend_files import (
+    NUM_BEST_SIMS,
+    generate_formatted_similarities,
+    similarity_scores,
+)
+from legacy import legacy_generate_formatted_similarities
+from utils.similarity_encoding import (
+    decode_varints,
+    encode_varints,
+    load_neighbours,
+    save_neighbours,
+    similarity_integers,
+    unzigzag,
+    zigzag,
+)
+
+
+@pytest.mark.parametrize("score_dtype", [np.float16, np.float32, np.float64])
+@pytest.mark.parametrize("idx_dtype", [np.int64, np.uint64, np.int32])
+def test_text_matches_legacy(build_similarities, score_dtype, idx_dtype):
+    values, idxs = build_similarities(score_dtype=score_dtype, idx_dtype=idx_dtype)
+    expected = legacy_generate_formatted_similarities(values, idxs)
+    # chunks smaller than the list, so the joints between chunks are covered as well
+    assert "".join(generate_formatted_similarities(values, idxs, 64)) == expected
+
+
+@pytest.mark.parametrize("score_dtype", [np.float16, np.float32, np.float64])
+@pytest.mark.parametrize("idx_dtype", [np.int64, np.uint64, np.int32])
+def test_binary_matches_text(tmp_path, build_similarities, score_dtype, idx_dtype):
+    values, idxs = build_similarities(score_dtype=score_dtype, idx_dtype=idx_dtype)
+    path = str(tmp_path / "subset.neighbours.bin")
+    save_neighbours(
+        path, values[:, 1 : NUM_BEST_SIMS + 1], idxs[:, 1 : NUM_BEST_SIMS + 1], 64
+    )
+
+    text_idxs, text_scores = parse_similarities(
+        legacy_generate_formatted_similarities(values, idxs)
+    )
+    binary_idxs, binary_scores = load_neighbours(path)
+    np.testing.assert_array_equal(binary_idxs, text_idxs)
+    np.testing.assert_array_equal(binary_scores, text_scores)
+
+
+def test_all_float16_values():
+    # every float16 a cosine similarity can be, against the f-string
+    values = np.arange(2**16, dtype=np.uint16).view(np.float16)
+    values = values[np.isfinite(values) & (np.abs(values) <= 2)]
+    integers, negative_zeros = similarity_integers(values)
+    expected = [f"{round(value,2) * 100:.0f}" for value in values]
+    formatted = [
+        "-0" if negative_zero else str(integer)
+        for integer, negative_zero in zip(integers.tolist(), negative_zeros)
+    ]
+    assert formatted == expected
+
+
+def test_non_finite_values(tmp_path, build_similarities):
+    values, idxs = build_similarities(20)
+    values[3, 2] = np.nan
+    values[5, 4] = np.inf
+    values[5, 6] = -np.inf
+    masked = np.where(np.isfinite(values), values, 0).astype(np.float16)
+
+    # every file gets a score of 0 for them
+    with pytest.warns(UserWarning, match="NaN or infinite"):
+        text = "".join(generate_formatted_similarities(values, idxs))
+    assert text == legacy_generate_formatted_similarities(masked, idxs)
+
+    path = str(tmp_path / "subset.neighbours.bin")
+    with pytest.warns(UserWarning, match="NaN or infinite"):
+        save_neighbours(
+            path, values[:, 1 : NUM_BEST_SIMS + 1], idxs[:, 1 : NUM_BEST_SIMS + 1]
+        )
+    text_idxs, text_scores = parse_similarities(text)
+    binary_idxs, binary_scores = load_neighbours(path)
+    np.testing.assert_array_equal(binary_idxs, text_idxs)
+    np.testing.assert_array_equal(binary_scores, text_scores)
+
+    with pytest.warns(UserWarning, match="NaN or infinite"):
+        scores = similarity_scores(values)
+    np.testing.assert_array_equal(scores, similarity_scores(masked))
+
+
+def test_varint_round_trip():
+    values = np.array(
+        [0, 1, 127, 128, 255, 16383, 16384, 2**32 - 1, 2**35, 2**63, 2**64 - 1],
+        dtype=np.uint64,
+    )
+    encoded = encode_varints(values)
+    assert encoded[:4].tolist() == [0, 1, 127, 0x80]
+    np.testing.assert_array_equal(decode_varints(encoded), values)
+    assert len(decode_varints(encode_varints(np.zeros(0, dtype=np.uint64)))) == 0
+
+    deltas = np.array([0, -1, 1, -2, 2, -(2**62), 2**62 - 1], dtype=np.int64)
+    assert zigzag(deltas)[:5].tolist() == [0, 1, 2, 3, 4]
+    np.testing.assert_array_equal(unzigzag(zigzag(deltas)), deltas)
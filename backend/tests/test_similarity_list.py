@@ -0,0 +1,122 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from generate_similarity_list import NEIGHBORS, incremental_similarity_list
+from utils.similarity_functions import merge_new_neighbors, top_k_neighbors
+
+
+def random_embeddings(num_rows: int, ties: bool) -> np.ndarray:
+    rng = np.random.default_rng(3)
+    if ties:
+        # only 64 different vectors, so there are duplicates and many equal scores
+        embeddings = rng.choice([-1.0, 1.0], (num_rows, 6))
+    else:
+        embeddings = rng.normal(size=(num_rows, 16))
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def brute_force_scores(embeddings: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    # the scores of the best k after the first, which top_k_neighbors skips as the row itself
+    scores = embeddings[rows] @ embeddings.T
+    order = np.argsort(-scores, axis=1, kind="stable")[:, 1 : k + 1]
+    return np.take_along_axis(scores, order, axis=1)
+
+
+def assert_neighbours_match(embeddings, rows, idxs, scores, expected_scores):
+    # among equal scores any row may be picked, so only the scores are compared
+    # and every returned index has to have the score it is returned with
+    idxs, scores = idxs.numpy(), scores.numpy()
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+    true_scores = np.einsum("ij,ikj->ik", embeddings[rows], embeddings[idxs])
+    np.testing.assert_allclose(scores, true_scores, atol=1e-5)
+    assert all(len(set(row)) == len(row) for row in idxs.tolist())
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float64])
+def test_top_k_matches_argsort(ties, dtype):
+    embeddings = random_embeddings(300, ties)
+    k = 10
+    # a budget of a few rows per block, so the blocks and their joints are covered
+    idxs, scores = top_k_neighbors(
+        torch.tensor(embeddings, dtype=dtype),
+        k,
+        memory_budget=7 * 2 * 300 * torch.tensor([], dtype=dtype).element_size(),
+        verbose=False,
+    )
+    rows = np.arange(300)
+    assert idxs.shape == scores.shape == (300, k)
+    assert_neighbours_match(
+        embeddings, rows, idxs, scores, brute_force_scores(embeddings, rows, k)
+    )
+
+
+def test_top_k_of_some_rows():
+    embeddings = random_embeddings(200, False)
+    rows = np.array([5, 0, 199, 42])
+    idxs, scores = top_k_neighbors(
+        torch.tensor(embeddings), 5, rows=torch.tensor(rows), verbose=False
+    )
+    assert_neighbours_match(
+        embeddings, rows, idxs, scores, brute_force_scores(embeddings, rows, 5)
+    )
+    # without duplicates the row itself is the skipped best match
+    assert not np.any(idxs.numpy() == rows[:, None])
+
+
+@pytest.mark.parametrize("ties", [False, True])
+def test_merge_matches_full_rebuild(ties):
+    embeddings = random_embeddings(300, ties)
+    tensor = torch.tensor(embeddings)
+    old_idxs, old_scores = top_k_neighbors(tensor[:240], 10, verbose=False)
+
+    merged_idxs, merged_scores = merge_new_neighbors(
+        tensor, old_idxs, old_scores, memory_budget=7 * 2 * 60 * 8, verbose=False
+    )
+    rows = np.arange(240)
+    assert_neighbours_match(
+        embeddings,
+        rows,
+        merged_idxs,
+        merged_scores,
+        brute_force_scores(embeddings, rows, 10),
+    )
+
+
+def test_incremental_list_matches_full_rebuild(tmp_path):
+    # the same steps as generate_similarity_list.py, a full build of the first papers
+    # followed by an incremental one after more papers were appended
+    embeddings = random_embeddings(NEIGHBORS + 200, False)
+    tensor = torch.tensor(embeddings, dtype=torch.float16)
+    arxiv_ids = np.array([f"2101.{i:05d}" for i in range(len(embeddings))])
+    settings = {"backend": "exact", "neighbors": NEIGHBORS}
+    num_old = NEIGHBORS + 120
+
+    best_idxs, best_scores = top_k_neighbors(tensor[:num_old], NEIGHBORS, verbose=False)
+    np.save(tmp_path / "best_idxs.npy", best_idxs.numpy().astype(np.int32))
+    np.save(tmp_path / "best_scores.npy", best_scores.numpy().astype(np.float16))
+    np.save(tmp_path / "best_arxiv_ids.npy", arxiv_ids[:num_old])
+    with open(tmp_path / "best_lists.json", "w") as f:
+        json.dump(settings, f, indent=2)
+
+    idxs, scores = incremental_similarity_list(
+        tensor, arxiv_ids, str(tmp_path), settings
+    )
+    rebuilt_idxs, rebuilt_scores = top_k_neighbors(tensor, NEIGHBORS, verbose=False)
+    assert idxs.shape == rebuilt_idxs.shape
+    # float16 scores, so equal up to the rounding of float16
+    np.testing.assert_allclose(
+        scores.astype(np.float32), rebuilt_scores.numpy().astype(np.float32), atol=2e-3
+    )
+    rows = np.arange(len(embeddings))
+    true_scores = np.einsum("ij,ikj->ik", embeddings[rows], embeddings[idxs])
+    np.testing.assert_allclose(scores.astype(np.float64), true_scores, atol=2e-3)
+    # papers only differ from the rebuilt lists where they tie with the last neighbour in float16
+    rebuilt_idxs = rebuilt_idxs.numpy()
+    for row in rows:
+        for idx in set(idxs[row]) ^ set(rebuilt_idxs[row]):
+            assert abs(embeddings[row] @ embeddings[idx] - scores[row, -1]) <= 2e-3
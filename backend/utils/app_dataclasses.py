@@ -1,5 +1,7 @@
+from dataclasses import dataclass
 from typing import Self
 
+import numpy as np
 from pydantic import BaseModel, ValidationError, model_validator
 
 
@@ -10,6 +12,19 @@ class Query(BaseModel):
     top_n: int = 5
     rerank_score_threshold: float = 0.1
     use_rerank: bool = False
+    # how many candidates of the prefilter are sent to the reranker, None uses the server default
+    rerank_candidates: int | None = None
+    # optional filters, applied inside the vector search
+    # papers published from (year_from, month_from) up to and including (year_to, month_to)
+    year_from: int | None = None
+    month_from: int | None = None
+    year_to: int | None = None
+    month_to: int | None = None
+    main_category: str | None = None
+    # papers listed in at least one of these categories, e.g. ["cs.LG", "stat.ML"]
+    categories: list[str] | None = None
+    # papers with an author whose name contains this text, ignoring case
+    author: str | None = None
 
     @model_validator(mode="after")
     def custom_validation(self) -> Self:
@@ -23,9 +38,39 @@ class Query(BaseModel):
         if self.top_k > 400:
             raise ValueError("top_k must be less than or equal to 400")
 
+        if self.rerank_candidates is not None and not (
+            self.top_n <= self.rerank_candidates <= self.top_k
+        ):
+            raise ValueError("rerank_candidates must be between top_n and top_k")
+
         if self.top_n > 10:
             raise ValueError("top_n must be less than or equal to 10")
 
+        for month in [self.month_from, self.month_to]:
+            if month is not None and not 1 <= month <= 12:
+                raise ValueError("month_from and month_to must be between 1 and 12")
+
+        if (self.month_from is not None and self.year_from is None) or (
+            self.month_to is not None and self.year_to is None
+        ):
+            raise ValueError("month_from and month_to need year_from and year_to")
+
+        if (
+            self.year_from is not None
+            and self.year_to is not None
+            and (self.year_from, self.month_from or 1)
+            > (self.year_to, self.month_to or 12)
+        ):
+            raise ValueError(
+                "year_from and month_from must not be after year_to and month_to"
+            )
+
+        if self.categories is not None and len(self.categories) == 0:
+            raise ValueError("categories must not be empty")
+
+        if self.author is not None and len(self.author.strip()) < 2:
+            raise ValueError("author must be at least 2 characters long")
+
         return self
 
 
@@ -43,3 +88,31 @@ class Document(BaseModel):
     year: int
     doi: str = "-"
     journal_ref: str = "-"
+
+
+@dataclass
+class CandidateSet:
+    """The hits of a vector search as parallel arrays, in the order returned by the search.
+
+    contents and metadatas are None for hits that were not loaded yet.
+    """
+
+    ids: list[str]
+    distances: np.ndarray
+    contents: list[str | None]
+    metadatas: list[dict | None]
+    rerank_scores: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def subset(self, idxs: np.ndarray) -> "CandidateSet":
+        return CandidateSet(
+            ids=[self.ids[i] for i in idxs],
+            distances=self.distances[idxs],
+            contents=[self.contents[i] for i in idxs],
+            metadatas=[self.metadatas[i] for i in idxs],
+            rerank_scores=(
+                self.rerank_scores[idxs] if self.rerank_scores is not None else None
+            ),
+        )
@@ -0,0 +1,186 @@
+import datetime
+import io
+import re
+import xml.etree.ElementTree as ET
+from typing import Iterable, Iterator
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+# Single characters that are replaced, applied in one pass with str.translate
+CHARACTER_TABLE = str.maketrans(
+    {
+        "\xa0": " ",
+        "\n": " ",
+        "—": "-",
+        "–": "-",
+        "…": "...",
+        "’": "'",
+        "”": "'",
+        "“": "'",
+    }
+)
+EMPTY_BRACES_PATTERN = re.compile(r"\b([A-Za-z0-9]+) \{\}")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# The LaTeX rules are applied in order, as some rules create input for later ones.
+# Each rule is only run if its literal is part of the string, this can not change
+# the result as every match of the pattern contains the literal.
+# Rules are only merged into one alternation where the order can not matter,
+# i.e. the alternatives can not overlap and the replacement can not create a new match.
+LATEX_RULES = [
+    ("\\label{", re.compile(r"\\label{.*?}"), ""),
+    ("{equation", re.compile(r"\\(?:begin|end){equation\*?}"), "$"),
+    ("\\FLP", re.compile(r"\\FLP"), ""),
+    ("\\\\[", re.compile(r"\\\\\[.*?]"), ""),
+    ("igg", re.compile(r"\\[bB]igg[lr]"), " "),
+    ("\\tfrac", re.compile(r"\\tfrac"), r"\\frac"),
+    ("\\notag", re.compile(r"\\notag"), ""),
+    ("\\", re.compile(r"\\\\|\\[;,:!]|\\quad"), " "),
+    ("op", re.compile(r"\\([a-zA-Z])op"), r"\\hat{\1}"),
+    ("dotop", re.compile(r"\\([a-zA-Z])dotop"), r"\\hat{\\dot{\1}}"),
+    ("\\expval{", re.compile(r"\\expval{(.*?)}"), r"\\braket{\1}"),
+    ("\\av{", re.compile(r"\\av{(.*?)}"), r"\\bar{\1}"),
+    ("\\abs{", re.compile(r"\\abs{(.*?)}"), r"|\1|"),
+    ("\\ketsl{", re.compile(r"\\ketsl{(.*?)}"), r"\\ket{\1}"),
+    ("\\barsl{", re.compile(r"\\barsl{(.*?)}"), r"\\bar{\1}"),
+    ("\\slOne", re.compile(r"\\slOne"), "1"),
+    ("\\slTwo", re.compile(r"\\slTwo"), "2"),
+    # find all \\ddp{SOMETEXT}{TEXT} and replace them with \\frac{\\partial SOMETEXT}{\\partial TEXT}
+    (
+        "\\ddp{",
+        re.compile(r"\\ddp{(.*?)}{(.*?)}"),
+        r"\\frac{\\partial \1}{\\partial \2}",
+    ),
+    (
+        "\\ddpl{",
+        re.compile(r"\\ddpl{(.*?)}{(.*?)}"),
+        r"\\frac{\\partial \1}{\\partial \2}",
+    ),
+    ("\\ddt{", re.compile(r"\\ddt{(.*?)}{(.*?)}"), r"\\frac{d \1}{d \2}"),
+    ("\\ddtl{", re.compile(r"\\ddtl{(.*?)}{(.*?)}"), r"\\frac{d \1}{d \2}"),
+]
+
+
+def lint_text(string: str) -> str:
+    string = string.replace("\r\n", " ").translate(CHARACTER_TABLE)
+
+    if "{}" in string:
+        string = EMPTY_BRACES_PATTERN.sub(r"{\1}", string)
+        string = string.replace("{}", "")
+    if not string.isascii():
+        string = string.encode("utf-8", "ignore").decode("utf-8")
+    string = string.replace("\\sim", "~")
+    string = string.replace("\\times", "x")
+    string = string.replace(" .", ".")
+    string = string.replace(" ,", ",")
+
+    # most abstracts contain no LaTeX commands at all
+    if "\\" in string:
+        for literal, pattern, replacement in LATEX_RULES:
+            if literal in string:
+                string = pattern.sub(replacement, string)
+
+    # condense all whitespace to a single space
+    string = WHITESPACE_PATTERN.sub(" ", string)
+
+    return string
+
+
+def format_entry(entry: ET.Element) -> dict:
+    # each entry is formatted into the following record
+    # title: The title of the paper.
+    # arxiv_id: The arXiv ID of the paper. without the version number.
+    # abstract: The abstract of the paper.
+    # main_category: The main category of the paper.
+    # revision: The version number of the paper.
+    # published: The date the paper was published.
+    # updated: The date the paper was last updated.
+    # categories: The categories of the paper.
+    # authors: a list of authors of the paper as First Letter of the first name. Last name
+    # journal_ref: The journal reference of the paper if available.
+    # doi: The DOI of the paper if available.
+    # arxiv_comment: The comment of the paper if available.
+    # arxiv_DOI: The DOI used by DataCite if available.
+    fields = {}
+    categories = []
+    authors = []
+    main_category = None
+
+    # walk the children once instead of searching the entry for every field
+    # this also covers single and multiple authors or categories the same way
+    for child in entry:
+        tag = child.tag
+        if tag == ATOM + "author":
+            name = child.findtext(ATOM + "name").strip()
+            authors.append(name.split(" ")[0][0] + ". " + name.split(" ")[-1])
+        elif tag == ATOM + "category":
+            categories.append(child.attrib["term"])
+        elif tag == ARXIV + "primary_category":
+            main_category = child.attrib["term"]
+        elif child.text is not None:
+            fields[tag] = child.text.strip()
+
+    if main_category is None:
+        # error entries of the API have no category
+        raise KeyError("arxiv:primary_category")
+
+    # strip the version number from the id
+    # TODO: Handle revision over 9
+    id_str = fields[ATOM + "id"].split("/")[-1]
+    doi = fields.get(ARXIV + "doi", None)
+
+    return {
+        "title": lint_text(fields[ATOM + "title"]),
+        "arxiv_id": id_str.split("v")[0],
+        "abstract": lint_text(fields[ATOM + "summary"]),
+        "main_category": main_category,
+        "revision": int(id_str.split("v")[-1]),
+        "published": datetime.datetime.strptime(
+            fields[ATOM + "published"], DATE_FORMAT
+        ),
+        "updated": datetime.datetime.strptime(fields[ATOM + "updated"], DATE_FORMAT),
+        "categories": categories,
+        "authors": authors,
+        "journal_ref": fields.get(ARXIV + "journal_ref", None),
+        "doi": doi,
+        "arxiv_comment": fields.get(ARXIV + "comment", None),
+        "arxiv_DOI": doi,
+    }
+
+
+def iter_arxiv_entries(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """Yields the formatted entries of an arXiv API response given as chunks of bytes.
+
+    Each entry is formatted as soon as it is complete and then freed again,
+    so the full response never has to be held as a tree.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != ATOM + "entry":
+                continue
+
+            try:
+                yield format_entry(elem)
+            except Exception as e:
+                print(e)
+            finally:
+                root.remove(elem)
+    parser.close()
+
+
+def parse_arxiv_response(
+    response: bytes,
+    chunk_size: int = 2**16,
+) -> list[dict]:
+    stream = io.BytesIO(response)
+    return list(iter_arxiv_entries(iter(lambda: stream.read(chunk_size), b"")))
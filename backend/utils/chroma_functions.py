@@ -1,44 +1,345 @@
-from typing import List
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, List
 
 import chromadb
+import chromadb.errors
+import numpy as np
 import pandas as pd
+from chromadb.api.shared_system_client import SharedSystemClient
+
+from utils.app_dataclasses import CandidateSet
+from utils.metadata_filter import FilterIndex, build_filter_index
+
+
+def build_metadatas(df: pd.DataFrame) -> list[dict]:
+    """The metadata of every paper in a collection, shared by Chroma and the local vector store."""
+    metadatas = []
+    for i, row in df.iterrows():
+        metadatas.append(
+            {
+                "title": row["title"],
+                "year": row["published"].year,
+                "month": row["published"].month,
+                "day": row["published"].day,
+                "authors": ";".join(row["authors"]),
+                "journal_ref": (
+                    row["journal_ref"] if str(row["journal_ref"]) != "<NA>" else "-"
+                ),
+                "doi": row["doi"] if str(row["doi"]) != "<NA>" else "-",
+                "categories": ";".join(row["categories"]),
+                "main_category": row["main_category"],
+            }
+        )
+    return metadatas
 
 
 def query_chroma_collection(
     queries: List[str],
     collection: chromadb.Collection,
     top_k: int = 25,
-) -> pd.DataFrame:
+    query_embeddings: chromadb.Embeddings | None = None,
+    include_documents: bool = True,
+    ids: List[str] | None = None,
+) -> CandidateSet:
+    """Searches the collection for the top_k hits of every query.
 
-    rows = []
+    Without include_documents only the ids and distances are fetched,
+    the abstracts and metadata of the final hits are loaded later with hydrate_candidates.
+    The search is restricted to the papers in ids, if given.
+    """
+    if ids is not None and len(ids) == 0:
+        return CandidateSet(ids=[], distances=np.zeros(0), contents=[], metadatas=[])
+
+    # precomputed embeddings skip the embedding function of the collection
+    if query_embeddings is not None:
+        query_kwargs = {"query_embeddings": query_embeddings}
+    else:
+        query_kwargs = {"query_texts": queries}
 
     results = collection.query(
-        query_texts=queries,
+        **query_kwargs,
         n_results=top_k,
-        include=["distances", "metadatas", "documents"],
+        ids=ids,
+        include=(
+            ["distances", "metadatas", "documents"]
+            if include_documents
+            else ["distances"]
+        ),
     )
 
-    for (
-        query_ids,
-        query_metadatas,
-        query_documents,
-        query_distances,
-    ) in zip(
-        results["ids"],
-        results["metadatas"],
-        results["documents"],
-        results["distances"],
+    # the hits of all queries are concatenated, a paper found by several queries is kept once
+    ids = [id for query_ids in results["ids"] for id in query_ids]
+    _, first_idxs = np.unique(ids, return_index=True)
+    keep = np.sort(first_idxs)
+
+    distances = np.concatenate(
+        [np.asarray(d, dtype=np.float64) for d in results["distances"]]
+    )[keep]
+    if not include_documents:
+        return CandidateSet(
+            ids=[ids[i] for i in keep],
+            distances=distances,
+            contents=[None] * len(keep),
+            metadatas=[None] * len(keep),
+        )
+
+    contents = [doc for query_docs in results["documents"] for doc in query_docs]
+    metadatas = [meta for query_metas in results["metadatas"] for meta in query_metas]
+    return CandidateSet(
+        ids=[ids[i] for i in keep],
+        distances=distances,
+        contents=[contents[i] for i in keep],
+        metadatas=[metadatas[i] for i in keep],
+    )
+
+
+# filters matching up to MAX_FILTER_IDS papers are passed to a Chroma search as a list of ids,
+# for more papers the list costs more than over-fetching hits and dropping the ones that do not match
+MAX_FILTER_IDS = 5000
+# the over-fetched hits are OVER_FETCH_FACTOR times the expected number needed for top_k matching hits
+OVER_FETCH_FACTOR = 2
+MAX_OVER_FETCH = 4000
+
+
+def query_filtered_collection(
+    queries: List[str],
+    collection: chromadb.Collection,
+    filter_index: FilterIndex,
+    filter_mask: np.ndarray,
+    top_k: int = 25,
+    query_embeddings: chromadb.Embeddings | None = None,
+    include_documents: bool = True,
+) -> CandidateSet:
+    """Searches the top_k hits among the papers in filter_mask, a mask over the rows of filter_index.
+
+    Chroma looks up every id of a filter in its database, so a broad filter is not passed to its search:
+    it over-fetches hits in proportion to the share of papers that match and drops the others.
+    If that finds fewer than top_k matching hits, the search is repeated with the ids of all matching papers,
+    so the hits are always the same as with the ids. A local collection always gets the ids.
+    """
+    num_matching = int(np.count_nonzero(filter_mask))
+    fetch_k = math.ceil(
+        top_k * OVER_FETCH_FACTOR * len(filter_mask) / max(num_matching, 1)
+    )
+    if (
+        num_matching > MAX_FILTER_IDS
+        and fetch_k <= MAX_OVER_FETCH
+        and not getattr(collection, "cheap_id_filter", False)
     ):
-        for result_idx in range(top_k):
-            row = {
-                "id": query_ids[result_idx],
-                "score": query_distances[result_idx],
-                "content": query_documents[result_idx],
-            }
-            ## Merge the metadata directly into the row dictionary
-            row.update(query_metadatas[result_idx])
-            rows.append(row)
+        candidates = query_chroma_collection(
+            queries,
+            collection,
+            min(fetch_k, len(filter_mask)),
+            query_embeddings,
+            include_documents=False,
+        )
+        keep = np.flatnonzero(filter_index.passes(candidates.ids, filter_mask))
+        if len(keep) >= min(top_k, num_matching):
+            candidates = candidates.subset(keep[:top_k])
+            if include_documents:
+                hydrate_candidates(collection, candidates, np.arange(len(candidates)))
+                # papers deleted since the search cannot be loaded
+                candidates = candidates.subset(
+                    np.flatnonzero([c is not None for c in candidates.contents])
+                )
+            return candidates
+
+    return query_chroma_collection(
+        queries,
+        collection,
+        top_k,
+        query_embeddings,
+        include_documents,
+        ids=filter_index.ids_of(filter_mask),
+    )
+
+
+def hydrate_candidates(
+    collection: chromadb.Collection,
+    candidates: CandidateSet,
+    idxs: np.ndarray,
+) -> None:
+    """Loads the abstracts and metadata of the given candidates with one batched get."""
+    missing = [i for i in idxs if candidates.contents[i] is None]
+    if not missing:
+        return
+
+    results = collection.get(
+        ids=[candidates.ids[i] for i in missing],
+        include=["documents", "metadatas"],
+    )
+    # get does not keep the order of the requested ids
+    rows = {
+        id: (doc, meta)
+        for id, doc, meta in zip(
+            results["ids"], results["documents"], results["metadatas"]
+        )
+    }
+    for i in missing:
+        if candidates.ids[i] in rows:
+            candidates.contents[i], candidates.metadatas[i] = rows[candidates.ids[i]]
 
-    final_df = pd.DataFrame(rows)
-    final_df = final_df.drop_duplicates(subset=["id"])
-    return final_df
+
+# create_chroma_collection.py stores the time every collection was last rebuilt in this file
+# the server compares these generations to reload collections that changed
+GENERATIONS_FILE = "generations.json"
+
+
+def read_generations(chroma_path: str) -> dict[str, float]:
+    path = os.path.join(chroma_path, GENERATIONS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def mark_collection_rebuilt(chroma_path: str, name: str) -> None:
+    generations = read_generations(chroma_path)
+    generations[name] = time.time()
+    # write to a temporary file first, so the server never reads a half written file
+    tmp_path = os.path.join(chroma_path, GENERATIONS_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(generations, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(chroma_path, GENERATIONS_FILE))
+
+
+def new_chroma_client(chroma_path: str) -> chromadb.ClientAPI:
+    """Returns a client that reads the collections as they are on disk now.
+
+    Chroma shares one system per path within a process and that system keeps answering queries
+    from the index it loaded first, even after another process rebuilt the collection.
+    Dropping the shared systems makes the new client load everything again,
+    handles of the old client keep working until they are released.
+    """
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(chroma_path)
+
+
+class CollectionRegistry:
+    """Opens every collection starting with `prefix` once and keeps the handles.
+
+    Every collection is warmed with a dummy query when it is opened, so its index is in memory
+    before the first real query arrives, and its FilterIndex is built. reload reopens the collections whose generation
+    changed since they were opened and drops the ones that no longer exist.
+    A rebuilt collection is only visible to a new client, so then a new client is made with client_factory
+    and all collections are reopened with it.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], chromadb.ClientAPI],
+        chroma_path: str,
+        embedding_function: chromadb.EmbeddingFunction,
+        prefix: str = "arxiv_",
+    ) -> None:
+        self.client_factory = client_factory
+        self.chroma_client = client_factory()
+        self.chroma_path = chroma_path
+        self.embedding_function = embedding_function
+        self.prefix = prefix
+        self.collections: dict[str, chromadb.Collection] = {}
+        self.generations: dict[str, float | None] = {}
+        self.load_times: dict[str, float] = {}
+        self.filter_indexes: dict[str, FilterIndex] = {}
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def open(self, name: str, generation: float | None) -> chromadb.Collection:
+        start = time.perf_counter()
+        collection = self.chroma_client.get_collection(
+            name=name,
+            embedding_function=self.embedding_function,
+        )
+        # a single nearest neighbour query loads the whole index of the collection
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        if sample is not None and len(sample) > 0:
+            collection.query(
+                query_embeddings=[[0.0] * len(sample[0])],
+                n_results=1,
+                include=[],
+            )
+        # reading all metadata takes seconds for the large subsets, too long for the first query
+        filter_index = build_filter_index(collection)
+
+        with self.lock:
+            self.collections[name] = collection
+            self.filter_indexes[name] = filter_index
+            self.generations[name] = generation
+            self.load_times[name] = time.perf_counter() - start
+        return collection
+
+    def reload(self) -> list[str]:
+        """Opens all new and rebuilt collections, returns the names of the ones that were opened.
+
+        A collection that fails to open is skipped and tried again on the next reload,
+        the others are still opened and the registry becomes ready either way.
+        """
+        generations = read_generations(self.chroma_path)
+        names = [
+            getattr(collection, "name", collection)
+            for collection in self.chroma_client.list_collections()
+        ]
+        names = [name for name in names if name.startswith(self.prefix)]
+
+        with self.lock:
+            for name in set(self.collections) - set(names):
+                del self.collections[name]
+                del self.generations[name]
+                del self.load_times[name]
+                del self.filter_indexes[name]
+            changed = [
+                name
+                for name in names
+                if name not in self.collections
+                or self.generations[name] != generations.get(name)
+            ]
+
+            rebuilt = [name for name in changed if name in self.collections]
+        if rebuilt:
+            self.chroma_client = self.client_factory()
+            changed = names
+
+        opened = []
+        for name in changed:
+            try:
+                self.open(name, generations.get(name))
+                opened.append(name)
+            except Exception as e:
+                print(f"Opening {name} failed: {e}")
+        self.ready = True
+        return opened
+
+    def get(self, name: str) -> chromadb.Collection | None:
+        with self.lock:
+            collection = self.collections.get(name)
+        if collection is not None or self.ready:
+            return collection
+
+        # during startup a collection that is not loaded yet is opened on demand
+        try:
+            return self.open(name, read_generations(self.chroma_path).get(name))
+        except (ValueError, chromadb.errors.NotFoundError):
+            return None
+
+    def filter_index(self, name: str) -> FilterIndex | None:
+        if self.get(name) is None:
+            return None
+        with self.lock:
+            return self.filter_indexes.get(name)
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "collections": {
+                    name: {
+                        "generation": self.generations[name],
+                        "load_time": self.load_times[name],
+                    }
+                    for name in sorted(self.collections)
+                },
+            }
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import brotli
+import zstandard
+
+# Precompressed variants of the frontend files, the web server picks one by Accept-Encoding
+# Every file is read once in chunks and every chunk is fed to all compressors,
+# so neither a whole file nor its compressed variants are held in memory
+CHUNK_SIZE = 2**20
+ENCODINGS = ["br", "gz", "zst"]
+# quality 11 gives ~15% smaller files, but takes about 20 times as long, which is minutes for cs.tsv
+# the largest window keeps the repeated author names of a large TSV in reach
+BROTLI_QUALITY = 9
+BROTLI_WINDOW = 24
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+MANIFEST_NAME = "compression_manifest.json"
+
+
+def file_hash(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def make_compressor(encoding: str, brotli_quality: int):
+    # every compressor as a pair of functions, one for each chunk and one for the end of the file
+    if encoding == "br":
+        compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT, quality=brotli_quality, lgwin=BROTLI_WINDOW
+        )
+        return compressor.process, compressor.finish
+    if encoding == "gz":
+        # wbits 31 writes a gzip header, which has no timestamp, so the output is reproducible
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress, compressor.flush
+    if encoding == "zst":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        return compressor.compress, compressor.flush
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def compress_file(
+    path: str,
+    encodings: list[str] = ENCODINGS,
+    brotli_quality: int = BROTLI_QUALITY,
+) -> dict[str, int]:
+    """Writes path.<encoding> for every encoding in one pass over path and returns their sizes.
+
+    The variants are written to temporary files and moved into place at the end,
+    so an interrupted run never leaves a truncated variant behind.
+    """
+    compressors = {
+        encoding: make_compressor(encoding, brotli_quality) for encoding in encodings
+    }
+    files = {encoding: open(f"{path}.{encoding}.tmp", "wb") for encoding in encodings}
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                for encoding, (process, _) in compressors.items():
+                    files[encoding].write(process(chunk))
+        for encoding, (_, finish) in compressors.items():
+            files[encoding].write(finish())
+    finally:
+        for file in files.values():
+            file.close()
+
+    sizes = {}
+    for encoding in encodings:
+        os.replace(f"{path}.{encoding}.tmp", f"{path}.{encoding}")
+        sizes[encoding] = os.path.getsize(f"{path}.{encoding}")
+    return sizes
+
+
+def compress_if_changed(
+    path: str,
+    previous: dict | None,
+    encodings: list[str],
+    brotli_quality: int,
+) -> tuple[dict, bool]:
+    # runs in a worker process, the hash is computed there as well
+    entry = {
+        "sha256": file_hash(path),
+        "encodings": encodings,
+        "brotli_quality": brotli_quality,
+    }
+    if (
+        previous is not None
+        and all(previous.get(key) == value for key, value in entry.items())
+        and all(os.path.exists(f"{path}.{encoding}") for encoding in encodings)
+    ):
+        return previous, False
+    entry["sizes"] = compress_file(path, encodings, brotli_quality)
+    return entry, True
+
+
+def compress_files(
+    paths: list[str],
+    manifest_dir: str,
+    encodings: list[str] = ENCODINGS,
+    brotli_quality: int = BROTLI_QUALITY,
+    workers: int | None = None,
+) -> list[str]:
+    """Compresses all files in a process pool and returns the ones that were compressed.
+
+    manifest_dir/compression_manifest.json records the hash of every compressed file,
+    a file whose content and settings did not change since the last run is skipped.
+    """
+    manifest_path = os.path.join(manifest_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    keys = [os.path.relpath(path, manifest_dir) for path in paths]
+    # the largest files first, so they do not end up alone at the end of the pool
+    order = sorted(range(len(paths)), key=lambda i: -os.path.getsize(paths[i]))
+    compressed = []
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {
+            i: executor.submit(
+                compress_if_changed,
+                paths[i],
+                manifest.get(keys[i]),
+                encodings,
+                brotli_quality,
+            )
+            for i in order
+        }
+        for i in order:
+            manifest[keys[i]], changed = futures[i].result()
+            if changed:
+                compressed.append(paths[i])
+
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return compressed
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# A corpus is stored as a folder with two files
+# metadata.parquet: one row per paper, every column except the embeddings
+# abstract_embeddings.npy: a contiguous (N x dim) float16 matrix in the same row order
+METADATA_FILE = "metadata.parquet"
+EMBEDDINGS_FILE = "abstract_embeddings.npy"
+EMBEDDING_COLUMN = "abstract_embedding"
+
+# Parquet returns list columns as numpy arrays, the rest of the pipeline expects lists
+LIST_COLUMNS = ["authors", "categories"]
+
+
+def save_metadata(
+    df: pd.DataFrame,
+    corpus_dir: str,
+) -> None:
+    os.makedirs(corpus_dir, exist_ok=True)
+    df = df.drop(columns=[EMBEDDING_COLUMN], errors="ignore")
+    df.reset_index(drop=True).to_parquet(
+        os.path.join(corpus_dir, METADATA_FILE),
+        index=False,
+    )
+
+
+def save_embeddings(
+    embeddings: np.ndarray,
+    corpus_dir: str,
+) -> None:
+    os.makedirs(corpus_dir, exist_ok=True)
+    np.save(
+        os.path.join(corpus_dir, EMBEDDINGS_FILE),
+        np.ascontiguousarray(embeddings, dtype=np.float16),
+    )
+
+
+def save_corpus(
+    df: pd.DataFrame,
+    corpus_dir: str,
+    embeddings: np.ndarray | None = None,
+) -> None:
+    """Saves a DataFrame and its embeddings to corpus_dir.
+
+    If no embeddings are given, they are taken from the abstract_embedding column.
+    """
+    if embeddings is None:
+        embeddings = np.array(df[EMBEDDING_COLUMN].tolist(), dtype=np.float16)
+
+    if len(embeddings) != len(df):
+        raise ValueError(
+            f"Got {len(embeddings)} embeddings for {len(df)} rows, they need to match"
+        )
+
+    save_metadata(df, corpus_dir)
+    save_embeddings(embeddings, corpus_dir)
+
+
+def load_metadata(
+    corpus_dir: str,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """Loads the metadata of a corpus, only reading the given columns if specified."""
+    df = pd.read_parquet(os.path.join(corpus_dir, METADATA_FILE), columns=columns)
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].map(list)
+    return df
+
+
+def load_embeddings(
+    corpus_dir: str,
+    mmap: bool = True,
+) -> np.ndarray:
+    """Loads the float16 embedding matrix of a corpus.
+
+    With mmap the matrix is memory mapped read-only, so nothing is read until it is used.
+    """
+    return np.load(
+        os.path.join(corpus_dir, EMBEDDINGS_FILE),
+        mmap_mode="r" if mmap else None,
+    )
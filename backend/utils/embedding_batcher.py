@@ -0,0 +1,112 @@
+import asyncio
+from typing import Awaitable, Callable
+
+import chromadb
+
+
+class Histogram:
+    """Counts observations in buckets with the given upper bounds, like a Prometheus histogram."""
+
+    def __init__(self, bounds: list[float]) -> None:
+        self.bounds = sorted(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def stats(self) -> dict:
+        labels = [str(bound) for bound in self.bounds] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class EmbeddingBatcher:
+    """Collects the texts of concurrent requests and embeds them with a single call.
+
+    The first text starts a window of `window` seconds, everything that arrives
+    until then is sent together. A batch is sent right away once it holds max_batch_size texts.
+    Every caller only waits for the embedding of its own text.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[list[str]], Awaitable[chromadb.Embeddings]],
+        window: float = 0.005,
+        max_batch_size: int = 64,
+    ) -> None:
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending: list[tuple[str, asyncio.Future]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        # running flushes are referenced here, so they are not garbage collected
+        self.flushes: set[asyncio.Task] = set()
+
+        bounds = [2**i for i in range(max_batch_size.bit_length())]
+        self.queue_depth = Histogram(bounds)
+        self.batch_size = Histogram(bounds)
+
+    async def embed(self, text: str) -> list[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue_depth.observe(len(self.pending))
+        self.pending.append((text, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch = self.pending[: self.max_batch_size]
+        self.pending = self.pending[self.max_batch_size :]
+        if self.pending:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        task = asyncio.create_task(self._embed_batch(batch))
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+
+    async def _embed_batch(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        # requests whose stage timed out in the meantime are skipped
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        # identical texts of a burst are only embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batch_size.observe(len(texts))
+
+        try:
+            embeddings = dict(zip(texts, await self.embed_fn(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[text])
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "queue_depth": self.queue_depth.stats(),
+            "batch_size": self.batch_size.stats(),
+        }
@@ -0,0 +1,195 @@
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # texts that only differ in their whitespace share one embedding
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """A persistent embedding cache keyed by (model, dim, hash of the normalized text).
+
+    The vectors are appended to a float32 blob that is read through a memory map,
+    SQLite only maps every key to its row in that blob.
+    An optional in-process LRU tier keeps the most recently used vectors in memory.
+    Several processes can share a cache, writes are serialized by a file lock
+    and rows appended by another process are mapped when a lookup first finds them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        memory_size: int = 0,
+    ) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vector_path = os.path.join(cache_dir, "vectors.bin")
+        self.lock_path = os.path.join(cache_dir, "write.lock")
+        self.memory_size = memory_size
+        self.memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"),
+            check_same_thread=False,
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, row INTEGER)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self.db.commit()
+
+        dim = self.db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim = dim[0] if dim is not None else None
+        self.num_rows = self._rows_on_disk()
+        self.vectors = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, dim: int, text: str) -> str:
+        text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{dim}:{text_hash}"
+
+    def _rows_on_disk(self) -> int:
+        if self.dim is None or not os.path.exists(self.vector_path):
+            return 0
+        return os.path.getsize(self.vector_path) // (4 * self.dim)
+
+    def _refresh(self) -> None:
+        # another process may have set the size of the vectors or appended rows
+        if self.dim is None:
+            dim = self.db.execute(
+                "SELECT value FROM meta WHERE name = 'dim'"
+            ).fetchone()
+            self.dim = dim[0] if dim is not None else None
+        self.num_rows = self._rows_on_disk()
+
+    def _map_vectors(self) -> None:
+        # the memory map is only recreated once rows were appended behind its end
+        if self.vectors is None or len(self.vectors) < self.num_rows:
+            self.vectors = np.memmap(
+                self.vector_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self.num_rows, self.dim),
+            )
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.memory_size <= 0:
+            return
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        with self.lock:
+            vectors: list[np.ndarray | None] = [None] * len(keys)
+            disk_keys = {}
+            for i, key in enumerate(keys):
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    vectors[i] = self.memory[key]
+                    self.memory_hits += 1
+                else:
+                    disk_keys.setdefault(key, []).append(i)
+
+            if disk_keys:
+                found = []
+                key_list = list(disk_keys)
+                # SQLite limits the number of parameters per statement
+                for start in range(0, len(key_list), 500):
+                    batch = key_list[start : start + 500]
+                    found += self.db.execute(
+                        "SELECT key, row FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                # rows are written before they are committed, so a row behind the map is on disk
+                if found and max(row for _, row in found) >= self.num_rows:
+                    self._refresh()
+                if found:
+                    self._map_vectors()
+                for key, row in found:
+                    vector = np.array(self.vectors[row])
+                    self._remember(key, vector)
+                    for i in disk_keys[key]:
+                        vectors[i] = vector
+                    self.disk_hits += len(disk_keys[key])
+
+            self.misses += sum(vector is None for vector in vectors)
+            return vectors
+
+    def put_many(self, keys: list[str], vectors: list) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # the file lock keeps other processes from appending rows or adding keys in between
+        with self.lock, open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self.db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,)
+                )
+                self.db.commit()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Cache holds vectors of size {self.dim}, got {vectors.shape[1]}"
+                )
+
+            new_keys = dict(zip(keys, vectors))
+            existing = set()
+            key_list = list(new_keys)
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start : start + 500]
+                existing.update(
+                    row[0]
+                    for row in self.db.execute(
+                        "SELECT key FROM embeddings WHERE key IN "
+                        f"({','.join('?' * len(batch))})",
+                        batch,
+                    )
+                )
+            # a cached text keeps its first embedding, so all tiers always agree
+            key_list = [key for key in key_list if key not in existing]
+            if not key_list:
+                return
+            for key in key_list:
+                self._remember(key, new_keys[key])
+
+            # append the vectors first, so every key in the index points to written data
+            # rows of an interrupted write are never referenced and simply skipped
+            first_row = self._rows_on_disk()
+            with open(self.vector_path, "ab") as f:
+                f.seek(first_row * 4 * self.dim)
+                f.truncate()
+                f.write(np.stack([new_keys[key] for key in key_list]).tobytes())
+            self.db.executemany(
+                "INSERT INTO embeddings VALUES (?, ?)",
+                [(key, first_row + i) for i, key in enumerate(key_list)],
+            )
+            self.db.commit()
+            self.num_rows = first_row + len(key_list)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            ),
+            "entries": self.num_rows,
+        }
@@ -1,4 +1,6 @@
 import os
+import time
+from contextlib import contextmanager
 
 
 def load_env_vars() -> None:
@@ -15,3 +17,26 @@ def load_env_vars() -> None:
             value = "=".join(arr[1:])
             value = value.strip('"')
             os.environ[key] = value
+
+
+class ServerTiming:
+    """Collects the durations of the stages of a request for the Server-Timing header."""
+
+    def __init__(self) -> None:
+        self.durations: dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[stage] = (
+                self.durations.get(stage, 0.0) + time.perf_counter() - start
+            )
+
+    def header(self) -> str:
+        return ", ".join(
+            f"{stage};dur={duration * 1000:.1f}"
+            for stage, duration in self.durations.items()
+        )
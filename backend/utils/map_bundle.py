@@ -0,0 +1,192 @@
+import json
+import os
+
+import numpy as np
+
+# A map bundle is the binary version of <subset>.tsv and <subset>.txt for the frontend
+# <subset>.bin: all sections back to back, little endian, every section aligned to 8 bytes
+# <subset>.manifest.json: the byte offset, length, dtype and shape of every section
+# The sections are ordered by when the map needs them:
+# the coordinates and categories for the first render, then the neighbours
+# and last the string columns, which can be fetched lazily by range for the visible papers
+MANIFEST_VERSION = 1
+ALIGNMENT = 8
+COORDINATE_LEVELS = 2**16 - 1
+
+
+def bundle_paths(path_prefix: str) -> tuple[str, str]:
+    return path_prefix + ".bin", path_prefix + ".manifest.json"
+
+
+def normalize_coordinates(
+    coordinates: np.ndarray,
+) -> tuple[np.ndarray, list[float], list[float]]:
+    """Maps (N x 2) coordinates to [0, 1] within their bounding box and returns its low corner and span."""
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(coordinates) == 0:
+        # an empty subset has no bounding box, the unit square stands in for it
+        low, high = np.zeros(2), np.ones(2)
+    else:
+        low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    span = np.where(high > low, high - low, 1.0)
+    return (coordinates - low) / span, low.tolist(), span.tolist()
+
+
+def quantize_unit(normalized: np.ndarray) -> np.ndarray:
+    # coordinates in [0, 1] to uint16, the map tiles use it for the coordinates within a tile
+    return np.rint(normalized * COORDINATE_LEVELS).astype("<u2")
+
+
+def quantize_coordinates(
+    coordinates: np.ndarray,
+) -> tuple[np.ndarray, list[float], list[float]]:
+    """Maps (N x 2) coordinates to uint16 on a grid spanning their bounding box."""
+    normalized, low, span = normalize_coordinates(coordinates)
+    return quantize_unit(normalized), low, span
+
+
+def dequantize_coordinates(
+    quantized: np.ndarray,
+    low: list[float],
+    span: list[float],
+) -> np.ndarray:
+    return np.asarray(low) + quantized.astype(
+        np.float64
+    ) / COORDINATE_LEVELS * np.asarray(span)
+
+
+def encode_categories(main_categories: list) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the sorted category names and the uint16 code of every paper.
+
+    Missing categories are stored as they are printed in the TSV, e.g. "None".
+    """
+    names = np.array([str(category) for category in main_categories], dtype=str)
+    categories, codes = np.unique(names, return_inverse=True)
+    if len(categories) > 2**16:
+        raise ValueError("A map bundle holds at most 65536 main categories")
+    return categories, codes.reshape(-1).astype("<u2")
+
+
+def encode_strings(strings: list[str]) -> tuple[np.ndarray, bytes]:
+    # the utf-8 strings back to back and their N + 1 byte offsets
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded])
+    if offsets[-1] >= 2**32:
+        raise ValueError("A string column of a map bundle must be smaller than 4 GiB")
+    return offsets.astype("<u4"), b"".join(encoded)
+
+
+def write_map_bundle(
+    path_prefix: str,
+    coordinates: np.ndarray,
+    main_categories: list[str],
+    neighbour_idxs: np.ndarray,
+    neighbour_scores: np.ndarray,
+    string_columns: dict[str, list[str]],
+) -> None:
+    """Writes a map bundle to path_prefix.bin and path_prefix.manifest.json.
+
+    The coordinates are quantized to uint16, the main categories are stored as uint16 codes
+    into the category list of the manifest, the neighbours as uint32 row indices with uint8 scores
+    and every string column as utf-8 bytes with uint32 offsets.
+    """
+    bin_path, manifest_path = bundle_paths(path_prefix)
+    quantized, low, span = quantize_coordinates(coordinates)
+    categories, category_codes = encode_categories(main_categories)
+
+    sections = [
+        ("coordinates", quantized),
+        ("main_category", category_codes),
+        ("neighbour_idxs", np.asarray(neighbour_idxs, dtype="<u4")),
+        ("neighbour_scores", np.asarray(neighbour_scores, dtype=np.uint8)),
+    ]
+    encoded_columns = {
+        column: encode_strings(strings) for column, strings in string_columns.items()
+    }
+    # all offsets come before the strings, so one request fetches the offsets of every column
+    for column, (offsets, _) in encoded_columns.items():
+        sections.append((f"{column}.offsets", offsets))
+    for column, (_, data) in encoded_columns.items():
+        sections.append((f"{column}.strings", np.frombuffer(data, dtype=np.uint8)))
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "count": len(quantized),
+        "coordinate_low": low,
+        "coordinate_span": span,
+        "coordinate_levels": COORDINATE_LEVELS,
+        "categories": categories.tolist(),
+        "string_columns": list(string_columns),
+        "sections": {},
+    }
+    with open(bin_path, "wb") as f:
+        for name, array in sections:
+            padding = -f.tell() % ALIGNMENT
+            f.write(b"\0" * padding)
+            manifest["sections"][name] = {
+                "offset": f.tell(),
+                "length": array.nbytes,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+            }
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+class MapBundle:
+    """Reads a map bundle, the binary file is memory mapped and sections are read on demand."""
+
+    def __init__(self, path_prefix: str) -> None:
+        bin_path, manifest_path = bundle_paths(path_prefix)
+        with open(manifest_path, "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported map bundle version {self.manifest['version']}"
+            )
+        self.data = (
+            np.memmap(bin_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(bin_path) > 0
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def section(self, name: str) -> np.ndarray:
+        info = self.manifest["sections"][name]
+        raw = self.data[info["offset"] : info["offset"] + info["length"]]
+        return raw.view(np.dtype(info["dtype"])).reshape(info["shape"])
+
+    def coordinates(self) -> np.ndarray:
+        return dequantize_coordinates(
+            self.section("coordinates"),
+            self.manifest["coordinate_low"],
+            self.manifest["coordinate_span"],
+        )
+
+    def main_categories(self) -> list[str]:
+        categories = self.manifest["categories"]
+        return [categories[code] for code in self.section("main_category")]
+
+    def neighbours(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.section("neighbour_idxs"), self.section("neighbour_scores")
+
+    def strings(
+        self,
+        column: str,
+        start: int = 0,
+        stop: int | None = None,
+    ) -> list[str]:
+        """Decodes the rows start to stop of a string column, like a range request of the client."""
+        offsets = self.section(f"{column}.offsets")
+        stop = len(self) if stop is None else stop
+        data = self.section(f"{column}.strings")[offsets[start] : offsets[stop]]
+        text = data.tobytes()
+        local = offsets[start : stop + 1].astype(np.int64) - offsets[start]
+        return [
+            text[begin:end].decode("utf-8") for begin, end in zip(local[:-1], local[1:])
+        ]
@@ -0,0 +1,181 @@
+import json
+import os
+import shutil
+
+import brotli
+import numpy as np
+
+from utils.map_bundle import (
+    COORDINATE_LEVELS,
+    encode_categories,
+    normalize_coordinates,
+    quantize_unit,
+)
+
+# A tile pyramid splits the map of a subset into a quadtree, level z has 2^z x 2^z tiles
+# Every paper is stored exactly once, in the tile of the coarsest level it is shown at,
+# so the client draws the tiles of the levels 0 to z that cover the viewport
+# A tile <z>/<x>/<y>.bin.br holds the rows of its papers in the TSV and the map bundle,
+# their coordinates quantized to uint16 within the tile and their main category codes
+POINTS_PER_TILE = 4096
+MAX_LEVEL = 12
+TILE_QUALITY = 11
+
+
+def tile_indices(normalized: np.ndarray, level: int) -> np.ndarray:
+    # the (x, y) tile of every point, points on the upper border belong to the last tile
+    return np.minimum((normalized * 2**level).astype(np.int64), 2**level - 1)
+
+
+def within_tile_ranks(tiles: np.ndarray, priorities: np.ndarray) -> np.ndarray:
+    # the rank of every point by priority among the points of its tile
+    tile_ids = tiles[:, 0] * (tiles[:, 1].max(initial=0) + 1) + tiles[:, 1]
+    order = np.lexsort((priorities, tile_ids))
+    sorted_ids = tile_ids[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(order)])
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+    return ranks
+
+
+def assign_levels(
+    normalized: np.ndarray,
+    points_per_tile: int = POINTS_PER_TILE,
+    max_level: int = MAX_LEVEL,
+    seed: int = 42,
+) -> tuple[np.ndarray, int]:
+    """Returns the coarsest level every point is shown at and the finest level of the pyramid.
+
+    A point is shown at level z if it is among the points_per_tile points of its tile with the
+    highest random priority. Dense tiles are thinned out uniformly, so the sample follows the density,
+    while sparse tiles keep all of their points. The sets are nested, a point shown at level z
+    is shown at all finer levels. The pyramid ends at the first level where no tile is full.
+    """
+    priorities = np.random.default_rng(seed).random(len(normalized))
+    levels = np.full(len(normalized), -1, dtype=np.int64)
+    for level in range(max_level + 1):
+        ranks = within_tile_ranks(tile_indices(normalized, level), priorities)
+        levels[(levels == -1) & (ranks < points_per_tile)] = level
+        if np.all(levels != -1):
+            return levels, level
+    levels[levels == -1] = max_level
+    return levels, max_level
+
+
+def encode_tile(
+    rows: np.ndarray,
+    local_coordinates: np.ndarray,
+    category_codes: np.ndarray,
+) -> bytes:
+    # the rows as uint32, then x and y as uint16 pairs, then the category codes as uint16
+    return b"".join(
+        [
+            rows.astype("<u4").tobytes(),
+            quantize_unit(local_coordinates).tobytes(),
+            category_codes.astype("<u2").tobytes(),
+        ]
+    )
+
+
+def decode_tile(data: bytes, count: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rows = np.frombuffer(data, dtype="<u4", count=count)
+    coordinates = np.frombuffer(data, dtype="<u2", count=2 * count, offset=4 * count)
+    category_codes = np.frombuffer(data, dtype="<u2", count=count, offset=8 * count)
+    return rows, coordinates.reshape(count, 2) / COORDINATE_LEVELS, category_codes
+
+
+def tile_path(tile_dir: str, level: int, x: int, y: int) -> str:
+    return os.path.join(tile_dir, str(level), str(x), f"{y}.bin.br")
+
+
+def write_tiles(
+    tile_dir: str,
+    coordinates: np.ndarray,
+    main_categories: list[str],
+    points_per_tile: int = POINTS_PER_TILE,
+    max_level: int = MAX_LEVEL,
+) -> dict:
+    """Writes the tile pyramid of the (N x 2) coordinates to tile_dir and returns its index.
+
+    Every tile is compressed on its own, index.json lists the tiles with their number of papers
+    and compressed size, the bounds to map tile coordinates back and the category names.
+    The category codes are the same as in the map bundle.
+    """
+    normalized, low, span = normalize_coordinates(coordinates)
+    categories, category_codes = encode_categories(main_categories)
+    levels, finest_level = assign_levels(normalized, points_per_tile, max_level)
+
+    # old tiles are removed, a level may not exist anymore
+    if os.path.exists(tile_dir):
+        shutil.rmtree(tile_dir)
+    os.makedirs(tile_dir)
+
+    tiles = []
+    for level in range(finest_level + 1):
+        rows = np.flatnonzero(levels == level)
+        if len(rows) == 0:
+            continue
+        indices = tile_indices(normalized[rows], level)
+        # grouped by tile, the rows of a tile stay in ascending order
+        order = np.lexsort((rows, indices[:, 1], indices[:, 0]))
+        rows, indices = rows[order], indices[order]
+        starts = np.flatnonzero(
+            np.r_[True, np.any(indices[1:] != indices[:-1], axis=1)]
+        )
+        for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+            x, y = indices[start].tolist()
+            tile_rows = rows[start:end]
+            local = normalized[tile_rows] * 2**level - indices[start]
+            data = brotli.compress(
+                encode_tile(tile_rows, local, category_codes[tile_rows]),
+                quality=TILE_QUALITY,
+            )
+            path = tile_path(tile_dir, level, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            tiles.append(
+                {
+                    "z": level,
+                    "x": x,
+                    "y": y,
+                    "count": len(tile_rows),
+                    "bytes": len(data),
+                }
+            )
+
+    index = {
+        "count": len(normalized),
+        "levels": finest_level + 1,
+        "points_per_tile": points_per_tile,
+        "coordinate_low": low,
+        "coordinate_span": span,
+        "categories": categories.tolist(),
+        "tiles": tiles,
+    }
+    with open(os.path.join(tile_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def load_tile_index(tile_dir: str) -> dict:
+    with open(os.path.join(tile_dir, "index.json"), "r") as f:
+        return json.load(f)
+
+
+def read_tile(
+    tile_dir: str,
+    index: dict,
+    tile: dict,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reads a tile of the index, the coordinates are mapped back to the ones of the subset."""
+    with open(tile_path(tile_dir, tile["z"], tile["x"], tile["y"]), "rb") as f:
+        rows, local, category_codes = decode_tile(
+            brotli.decompress(f.read()), tile["count"]
+        )
+    normalized = (local + [tile["x"], tile["y"]]) / 2 ** tile["z"]
+    coordinates = np.asarray(index["coordinate_low"]) + normalized * np.asarray(
+        index["coordinate_span"]
+    )
+    return rows, coordinates, category_codes
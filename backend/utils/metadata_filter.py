@@ -0,0 +1,133 @@
+import numpy as np
+
+from utils.app_dataclasses import Query
+
+# metadatas are read in pages of this size when a FilterIndex is built
+PAGE_SIZE = 10000
+
+
+def month_number(year: int, month: int) -> int:
+    # the months since year 0, so a (year, month) range is a single integer range
+    return year * 12 + month - 1
+
+
+def has_filters(query: Query) -> bool:
+    return (
+        query.year_from is not None
+        or query.year_to is not None
+        or query.main_category is not None
+        or query.categories is not None
+        or query.author is not None
+    )
+
+
+class FilterIndex:
+    """Bitmaps over the filterable metadata of a collection, built once per collection.
+
+    The dates and main categories are held as integer arrays, every category as a packed bitmap
+    and the authors as an inverted index from their lowercased names to the rows.
+    mask evaluates all filters of a query at once, without touching a single metadata dict.
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        metadatas: list[dict],
+    ) -> None:
+        self.ids = ids
+        self.rows = {id: row for row, id in enumerate(ids)}
+        self.dates = np.array(
+            [month_number(meta["year"], meta["month"]) for meta in metadatas],
+            dtype=np.int32,
+        )
+        main_categories, self.main_category_codes = np.unique(
+            np.array([meta["main_category"] for meta in metadatas], dtype=object),
+            return_inverse=True,
+        )
+        self.main_categories = {name: code for code, name in enumerate(main_categories)}
+
+        category_rows: dict[str, list[int]] = {}
+        author_rows: dict[str, list[int]] = {}
+        for row, meta in enumerate(metadatas):
+            for category in meta["categories"].split(";"):
+                category_rows.setdefault(category, []).append(row)
+            for author in meta["authors"].split(";"):
+                author_rows.setdefault(author.strip().lower(), []).append(row)
+
+        self.categories = {}
+        for category, rows in category_rows.items():
+            bitmap = np.zeros(len(ids), dtype=bool)
+            bitmap[rows] = True
+            self.categories[category] = np.packbits(bitmap)
+
+        # all names are joined by newlines, so a substring search is one str.find per match
+        names = sorted(author_rows)
+        self.author_names = "\n".join(names)
+        self.author_starts = np.zeros(len(names), dtype=np.int64)
+        self.author_starts[1:] = np.cumsum([len(name) + 1 for name in names[:-1]])
+        self.author_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        self.author_offsets[1:] = np.cumsum([len(author_rows[name]) for name in names])
+        self.author_rows = np.array(
+            [row for name in names for row in author_rows[name]], dtype=np.int32
+        )
+
+    def author_mask(self, author: str) -> np.ndarray:
+        needle = author.strip().lower()
+        mask = np.zeros(len(self.ids), dtype=bool)
+        position = self.author_names.find(needle)
+        while position != -1:
+            name = np.searchsorted(self.author_starts, position, side="right") - 1
+            start, end = self.author_offsets[name], self.author_offsets[name + 1]
+            mask[self.author_rows[start:end]] = True
+            # continue after this name, every name is counted once
+            next_start = (
+                self.author_starts[name + 1]
+                if name + 1 < len(self.author_starts)
+                else len(self.author_names)
+            )
+            position = self.author_names.find(needle, next_start)
+        return mask
+
+    def mask(self, query: Query) -> np.ndarray:
+        """Returns the rows that pass all filters of the query."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if query.year_from is not None:
+            mask &= self.dates >= month_number(query.year_from, query.month_from or 1)
+        if query.year_to is not None:
+            mask &= self.dates <= month_number(query.year_to, query.month_to or 12)
+        if query.main_category is not None:
+            # an unknown main category matches no paper
+            code = self.main_categories.get(query.main_category, -1)
+            mask &= self.main_category_codes == code
+        if query.categories is not None:
+            bitmap = np.zeros((len(self.ids) + 7) // 8, dtype=np.uint8)
+            for category in query.categories:
+                if category in self.categories:
+                    bitmap |= self.categories[category]
+            mask &= np.unpackbits(bitmap, count=len(self.ids)).astype(bool)
+        if query.author is not None:
+            mask &= self.author_mask(query.author)
+        return mask
+
+    def ids_of(self, mask: np.ndarray) -> list[str]:
+        return [self.ids[row] for row in np.flatnonzero(mask)]
+
+    def matching_ids(self, query: Query) -> list[str]:
+        return self.ids_of(self.mask(query))
+
+    def passes(self, ids: list[str], mask: np.ndarray) -> np.ndarray:
+        """Returns which of the given papers are in the mask, papers unknown to the index are not."""
+        rows = np.array([self.rows.get(id, -1) for id in ids], dtype=np.int64)
+        return (rows >= 0) & mask[rows]
+
+
+def build_filter_index(collection) -> FilterIndex:
+    """Reads the metadata of all papers of a Chroma or local collection in pages."""
+    ids, metadatas = [], []
+    while True:
+        page = collection.get(include=["metadatas"], limit=PAGE_SIZE, offset=len(ids))
+        ids.extend(page["ids"])
+        metadatas.extend(page["metadatas"])
+        if len(page["ids"]) < PAGE_SIZE:
+            break
+    return FilterIndex(ids, metadatas)
@@ -0,0 +1,186 @@
+import dataclasses
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from pydantic import BaseModel
+
+from utils.app_dataclasses import Query
+from utils.embedding_cache import normalize_text
+
+
+def estimate_size(value) -> int:
+    # a rough estimate of the bytes held by a cached value, good enough to bound the cache
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if dataclasses.is_dataclass(value):
+        return sum(
+            estimate_size(getattr(value, field.name))
+            for field in dataclasses.fields(value)
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(item) for item in value.values()
+        )
+    if isinstance(value, BaseModel):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(field) for field in value.__dict__.values()
+        )
+    return sys.getsizeof(value)
+
+
+class QueryResultCache:
+    """An LRU cache for the results of /query, bounded by the estimated size of its values.
+
+    It holds two kinds of entries:
+    the final documents of a query, keyed by every parameter of the query,
+    and the candidate set before process_results, keyed only by the parameters
+    that change the candidates, so a different top_n or rerank_score_threshold is served
+    from the cache as well.
+    Entries expire after `ttl` seconds and all entries of a category are dropped with invalidate.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (expiry time, category, size, value)
+        self.entries: OrderedDict[tuple, tuple[float, str, int, object]] = OrderedDict()
+        self.num_bytes = 0
+        # bumped on every invalidation, results computed before that are not stored
+        self.versions: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.candidate_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def filter_key(query: Query) -> tuple:
+        return (
+            query.year_from,
+            query.month_from,
+            query.year_to,
+            query.month_to,
+            query.main_category,
+            tuple(sorted(set(query.categories))) if query.categories else None,
+            query.author.strip().lower() if query.author else None,
+        )
+
+    @staticmethod
+    def result_key(query: Query) -> tuple:
+        return (
+            "results",
+            normalize_text(query.query),
+            query.category,
+            query.top_k,
+            query.top_n,
+            query.use_rerank,
+            query.rerank_candidates,
+            query.rerank_score_threshold,
+            QueryResultCache.filter_key(query),
+        )
+
+    @staticmethod
+    def candidate_key(query: Query) -> tuple:
+        return (
+            "candidates",
+            normalize_text(query.query),
+            query.category,
+            query.top_k,
+            query.use_rerank,
+            query.rerank_candidates,
+            # the threshold decides how many candidates are reranked
+            query.rerank_score_threshold if query.use_rerank else None,
+            QueryResultCache.filter_key(query),
+        )
+
+    def _drop(self, key: tuple) -> None:
+        _, _, size, _ = self.entries.pop(key)
+        self.num_bytes -= size
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                if key[0] == "results":
+                    self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            if key[0] == "results":
+                self.hits += 1
+            else:
+                self.candidate_hits += 1
+            return entry[3]
+
+    def version(self, category: str) -> int:
+        with self.lock:
+            return self.versions.get(category, 0)
+
+    def put(
+        self,
+        key: tuple,
+        category: str,
+        value,
+        version: int,
+    ) -> None:
+        """Stores value, unless its category was invalidated since version was read."""
+        size = estimate_size(value)
+        with self.lock:
+            if version != self.versions.get(category, 0) or size > self.max_bytes:
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl, category, size, value)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def refresh_size(self, key: tuple) -> None:
+        """Re-estimates the size of an entry whose value was filled in after put, like hydrated candidates."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            expiry, category, old_size, value = entry
+            size = estimate_size(value)
+            self.entries[key] = (expiry, category, size, value)
+            self.num_bytes += size - old_size
+            while self.num_bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, category: str) -> None:
+        with self.lock:
+            self.versions[category] = self.versions.get(category, 0) + 1
+            for key in [
+                key for key, entry in self.entries.items() if entry[1] == category
+            ]:
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "candidate_hits": self.candidate_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.num_bytes,
+            }
@@ -1,49 +1,171 @@
-import pandas as pd
+import re
+from dataclasses import replace
+
+import numpy as np
+
+from utils.app_dataclasses import CandidateSet, Document
+
+TERM_PATTERN = re.compile(r"\w{3,}")
 
 
 def rerank_results(
     query: str,
-    documents: pd.DataFrame,
+    candidates: CandidateSet,
     reranker,
-) -> pd.DataFrame:
-    contents = documents["content"].tolist()
-    scores = reranker(query, contents)
-    documents["rerank_score"] = scores
-    return documents
+) -> CandidateSet:
+    # a filter can leave no candidates, the reranker is not called for nothing
+    if len(candidates) == 0:
+        return replace(candidates, rerank_scores=np.zeros(0))
+    scores = reranker(query, candidates.contents, candidates.ids)
+    return replace(candidates, rerank_scores=np.asarray(scores, dtype=np.float64))
 
 
-def process_results(
-    documents: pd.DataFrame,
-    top_n: int = 5,
-    rerank_score_threshold: float = 0.0,
-) -> pd.DataFrame:
-
-    # rename the score column to distance, as the "score" is typically the return value of the vector search
-    # this is often the L2 or cosine distance
-    documents = documents.rename(columns={"score": "distance"})
-
-    if "rerank_score" in documents.columns:
-        documents = (
-            documents.sort_values(by=["rerank_score"], ascending=False)
-            .query(f"rerank_score > {rerank_score_threshold}")
-            .reset_index(drop=True)
-            .head(top_n)
+async def rerank_results_async(
+    query: str,
+    candidates: CandidateSet,
+    reranker,
+    rerank_score_threshold: float | None = None,
+    stage_size: int | None = None,
+) -> CandidateSet:
+    """Reranks the candidates, with a stage_size in stages of about stage_size candidates in their order.
+
+    Reranking stops after a stage in which no candidate scores above rerank_score_threshold,
+    as the candidates after it rank even lower in the search. They keep a score of nan and are never selected.
+    """
+    if len(candidates) == 0:
+        return replace(candidates, rerank_scores=np.zeros(0))
+    if stage_size is None or rerank_score_threshold is None:
+        stage_size = len(candidates)
+
+    # stages of equal size, so the last one is never a single candidate
+    num_stages = -(-len(candidates) // stage_size)
+    scores = np.full(len(candidates), np.nan)
+    for stage in np.array_split(np.arange(len(candidates)), num_stages):
+        start, end = stage[0], stage[-1] + 1
+        scores[start:end] = await reranker.rerank_async(
+            query, candidates.contents[start:end], candidates.ids[start:end]
         )
-        # rename the rerank_score column to score as this is the actual score we want to return
-        # the score should always be a value between 0 and 1 and a high score indicates a high relevance
-        documents = documents.rename(columns={"rerank_score": "score"})
+        if num_stages > 1 and not np.any(scores[start:end] > rerank_score_threshold):
+            break
+    return replace(candidates, rerank_scores=scores)
+
+
+def lexical_scores(
+    query: str,
+    candidates: CandidateSet,
+) -> np.ndarray:
+    """Scores every candidate between 0 and 1 by the query terms found in its title and abstract.
+
+    A term counts twice if it is in the title and is weighted by its rarity among the candidates.
+    """
+    terms = list(dict.fromkeys(TERM_PATTERN.findall(query.lower())))
+    if not terms or len(candidates) == 0:
+        return np.zeros(len(candidates))
+
+    # substring tests are much cheaper than tokenizing every abstract
+    titles = [metadata["title"].lower() for metadata in candidates.metadatas]
+    contents = [content.lower() for content in candidates.contents]
+    hits = np.array(
+        [
+            [(term in title) + (term in content) for term in terms]
+            for title, content in zip(titles, contents)
+        ],
+        dtype=np.float64,
+    )
+    document_frequency = (hits > 0).sum(axis=0)
+    idf = np.log1p(len(candidates) / (1 + document_frequency))
+    return (hits @ idf) / (2 * idf.sum())
+
+
+def prefilter_candidates(
+    query: str,
+    candidates: CandidateSet,
+    max_candidates: int,
+    lexical_weight: float = 0.3,
+) -> CandidateSet:
+    """Keeps the max_candidates best candidates by vector distance and lexical score.
 
+    This is the cheap first stage of the cascade, only its survivors are sent to the reranker.
+    """
+    if len(candidates) <= max_candidates:
+        return candidates
+
+    # distances are scaled to [0, 1] within the candidates, as their range depends on the metric
+    distances = candidates.distances
+    spread = distances.max() - distances.min()
+    similarity = (distances.max() - distances) / spread if spread > 0 else 1.0
+    combined = (1 - lexical_weight) * similarity + lexical_weight * lexical_scores(
+        query, candidates
+    )
+    # the survivors stay in the order of the search
+    idxs = np.sort(top_n_indices(-combined, max_candidates))
+    return candidates.subset(idxs)
+
+
+def top_n_indices(
+    keys: np.ndarray,
+    top_n: int,
+) -> np.ndarray:
+    # indices of the top_n smallest keys in ascending order, ties keep the search order
+    if len(keys) > top_n:
+        # the top_n-th smallest key and everything below it, without sorting all candidates
+        cutoff = np.partition(keys, top_n - 1)[top_n - 1]
+        idxs = np.flatnonzero(keys <= cutoff)
     else:
-        documents = (
-            documents.sort_values(by=["distance"], ascending=True)
-            .reset_index(drop=True)
-            .sort_values(by=["distance"], ascending=True)
-            .head(top_n)
-        )
+        idxs = np.arange(len(keys))
+    return idxs[np.argsort(keys[idxs], kind="stable")][:top_n]
+
 
+def select_results(
+    candidates: CandidateSet,
+    top_n: int = 5,
+    rerank_score_threshold: float = 0.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the indices of the final hits in ranked order and the scores of all candidates."""
+    # the "score" of the vector search is a distance, typically the L2 or cosine distance
+    distances = candidates.distances
+
+    if candidates.rerank_scores is not None:
+        # the rerank score is the actual score we want to return
+        # the score should always be a value between 0 and 1 and a high score indicates a high relevance
+        above = np.flatnonzero(candidates.rerank_scores > rerank_score_threshold)
+        scores = candidates.rerank_scores
+        idxs = above[top_n_indices(-scores[above], top_n)]
+    else:
         # if the documents do not have a rerank_score, we can use the similarity score as the score
         # distance can be between 0 and infinity, so we need to normalize it to a score between 0 and 1
         # if distance is 0, the score will be 1, if distance is infinity, the score will be 0
-        documents["score"] = documents["distance"].apply(lambda x: 1 / (1 + x))
+        idxs = top_n_indices(distances, top_n)
+        scores = 1 / (1 + distances)
+
+    return idxs, scores
+
+
+def build_documents(
+    candidates: CandidateSet,
+    idxs: np.ndarray,
+    scores: np.ndarray,
+) -> list[Document]:
+    distances = candidates.distances
+    # hits that could not be loaded, e.g. because the collection was rebuilt, are skipped
+    return [
+        Document(
+            id=candidates.ids[i],
+            content=candidates.contents[i],
+            distance=distances[i],
+            score=scores[i],
+            **candidates.metadatas[i],
+        )
+        for i in idxs
+        if candidates.contents[i] is not None
+    ]
 
-    return documents
+
+def process_results(
+    candidates: CandidateSet,
+    top_n: int = 5,
+    rerank_score_threshold: float = 0.0,
+) -> list[Document]:
+    # Documents are only built for the hits that are returned
+    idxs, scores = select_results(candidates, top_n, rerank_score_threshold)
+    return build_documents(candidates, idxs, scores)
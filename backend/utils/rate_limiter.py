@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """A token bucket that refills with `rate` tokens per second up to `capacity`.
+
+    Callers reserve tokens up front and then wait until the reservation is covered,
+    so concurrent callers are queued in the order they asked.
+    Works from threads with acquire and from asyncio with acquire_async.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be > 0, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        # returns how long the caller has to wait until its tokens are available
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.last_refill) * self.rate,
+            )
+            self.last_refill = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        wait_time = self._reserve(tokens)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    async def acquire_async(self, tokens: float = 1.0) -> None:
+        wait_time = self._reserve(tokens)
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+
+class HostRateLimiter:
+    """Keeps a separate token bucket for every host, so one slow host does not throttle the others."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        return self.buckets[host]
+
+    def acquire(self, url: str, tokens: float = 1.0) -> None:
+        self.bucket(url).acquire(tokens)
+
+    async def acquire_async(self, url: str, tokens: float = 1.0) -> None:
+        await self.bucket(url).acquire_async(tokens)
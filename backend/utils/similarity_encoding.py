@@ -0,0 +1,133 @@
+import struct
+import warnings
+
+import numpy as np
+
+# The binary version of the similarity list <subset>.txt
+# A header of MAGIC, the version as uint8 and the number of rows and neighbours as uint32,
+# followed by two varints per neighbour, the row index and the score, both zigzag delta encoded:
+# the first index of a row relative to the row itself and the first score relative to 0,
+# every further one relative to the previous neighbour of the row
+MAGIC = b"ASIM"
+VERSION = 1
+HEADER = struct.Struct("<4sBII")
+CHUNK_ROWS = 50000
+
+
+def similarity_integers(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the integers f"{round(value,2) * 100:.0f}" prints for every value and where it prints "-0".
+
+    The rounding and the multiplication are done in the dtype of the values, like for numpy scalars,
+    .0f rounds the exact value half to even, which is what np.rint does.
+    NaN and infinite values have no integer, they are written as 0 with a warning,
+    the same in every file the similarities are written to.
+    """
+    non_finite = ~np.isfinite(values)
+    if non_finite.any():
+        warnings.warn(
+            f"{np.count_nonzero(non_finite)} similarity values are NaN or infinite, they are written as 0"
+        )
+        values = np.where(non_finite, 0, values)
+    scaled = np.round(values, 2) * 100
+    integers = np.rint(scaled.astype(np.float64)).astype(np.int64)
+    return integers, np.signbit(scaled) & (integers == 0)
+
+
+def zigzag(values: np.ndarray) -> np.ndarray:
+    # maps 0, -1, 1, -2, ... to 0, 1, 2, 3, ..., so small negative deltas stay small
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(
+        np.int64
+    )
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """Encodes unsigned integers as LEB128 varints, 7 bits per byte with the high bit set on all but the last."""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    starts = np.zeros(len(values), dtype=np.int64)
+    starts[1:] = np.cumsum(lengths[:-1])
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for byte in range(int(lengths.max(initial=0))):
+        mask = lengths > byte
+        chunk = (values[mask] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        chunk |= np.where(lengths[mask] > byte + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[mask] + byte] = chunk
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    ends = np.flatnonzero((data & 0x80) == 0)
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    starts = np.r_[0, ends[:-1] + 1]
+    value_of_byte = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[value_of_byte]) * 7
+    shifted = (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.bitwise_or.reduceat(shifted, starts)
+
+
+def encode_neighbours(
+    idxs: np.ndarray,
+    scores: np.ndarray,
+    first_row: int,
+) -> bytes:
+    """Encodes the (rows x neighbours) indices and integer scores of the rows starting at first_row."""
+    rows = np.arange(first_row, first_row + len(idxs), dtype=np.int64)
+    idx_deltas = np.diff(idxs.astype(np.int64), axis=1, prepend=rows[:, None])
+    score_deltas = np.diff(scores.astype(np.int64), axis=1, prepend=0)
+    deltas = np.stack([idx_deltas, score_deltas], axis=2).reshape(-1)
+    return encode_varints(zigzag(deltas)).tobytes()
+
+
+def decode_neighbours(
+    data: bytes,
+    num_rows: int,
+    num_neighbours: int,
+    first_row: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    deltas = unzigzag(decode_varints(np.frombuffer(data, dtype=np.uint8)))
+    deltas = deltas.reshape(num_rows, num_neighbours, 2)
+    rows = np.arange(first_row, first_row + num_rows, dtype=np.int64)
+    idxs = rows[:, None] + np.cumsum(deltas[:, :, 0], axis=1)
+    scores = np.cumsum(deltas[:, :, 1], axis=1)
+    return idxs, scores
+
+
+def save_neighbours(
+    path: str,
+    similarity_values: np.ndarray,
+    similarity_idxs: np.ndarray,
+    chunk_rows: int = CHUNK_ROWS,
+) -> None:
+    """Writes the (rows x neighbours) similarities in the binary format, chunk by chunk.
+
+    The scores are the integers of the text format, where it prints "-0" the binary format holds 0.
+    """
+    num_rows, num_neighbours = similarity_idxs.shape
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, num_rows, num_neighbours))
+        for start in range(0, num_rows, chunk_rows):
+            scores, _ = similarity_integers(
+                similarity_values[start : start + chunk_rows]
+            )
+            f.write(
+                encode_neighbours(
+                    similarity_idxs[start : start + chunk_rows], scores, start
+                )
+            )
+
+
+def load_neighbours(path: str) -> tuple[np.ndarray, np.ndarray]:
+    with open(path, "rb") as f:
+        magic, version, num_rows, num_neighbours = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} neighbour file")
+        return decode_neighbours(f.read(), num_rows, num_neighbours)
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+import torch
+
+# 1 GiB for the score block, this is plenty for the largest subsets while
+# still leaving enough headroom on a typical GPU or workstation
+DEFAULT_MEMORY_BUDGET = 2**30
+
+
+def compute_block_size(
+    num_corpus_rows: int,
+    element_size: int,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+) -> int:
+    # each row of a block needs one score per corpus entry
+    # topk needs roughly the same amount of scratch space again, hence the factor 2
+    bytes_per_row = 2 * num_corpus_rows * element_size
+    return max(1, memory_budget // bytes_per_row)
+
+
+def top_k_neighbors(
+    embeddings: torch.Tensor,
+    k: int,
+    rows: torch.Tensor | None = None,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    verbose: bool = True,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Returns the indices and scores of the k most similar rows for the given rows.
+
+    The embeddings need to be normalized, so the dot product is the cosine similarity.
+    The best match of each row is assumed to be the row itself and is skipped.
+    If no rows are given, the neighbours of all rows are computed.
+    """
+    if rows is None:
+        rows = torch.arange(embeddings.shape[0], device=embeddings.device)
+
+    num_queries = rows.shape[0]
+    block_size = compute_block_size(
+        embeddings.shape[0],
+        embeddings.element_size(),
+        memory_budget,
+    )
+
+    best_idxs = torch.zeros(
+        (num_queries, k),
+        dtype=torch.int32,
+        device=embeddings.device,
+    )
+    best_scores = torch.zeros(
+        (num_queries, k),
+        dtype=embeddings.dtype,
+        device=embeddings.device,
+    )
+
+    start_time = time.time()
+    for block_start in range(0, num_queries, block_size):
+        block_end = min(block_start + block_size, num_queries)
+        if verbose:
+            print(f"{block_start / num_queries:.4%}", end="\r")
+
+        # score a whole block of rows against the corpus with a single matmul
+        # the memory budget keeps the (block_size x N) score matrix bounded
+        block_rows = rows[block_start:block_end]
+        scores = torch.matmul(embeddings[block_rows], embeddings.T)
+        block_scores, block_idxs = torch.topk(scores, k + 1, dim=1, sorted=True)
+
+        best_idxs[block_start:block_end] = block_idxs[:, 1:]
+        best_scores[block_start:block_end] = block_scores[:, 1:]
+
+    if verbose:
+        print(f"Time taken: {time.time() - start_time:.2f}s")
+
+    return best_idxs, best_scores
+
+
+def merge_new_neighbors(
+    embeddings: torch.Tensor,
+    best_idxs: torch.Tensor,
+    best_scores: torch.Tensor,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    verbose: bool = True,
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Merges the rows appended after the existing neighbour lists into these lists.
+
+    best_idxs and best_scores hold the neighbours of the first rows of the embeddings.
+    Only the scores between these rows and the appended rows are computed.
+    """
+    num_old, k = best_idxs.shape
+    new_embeddings = embeddings[num_old:]
+    num_new = new_embeddings.shape[0]
+    block_size = compute_block_size(num_new, embeddings.element_size(), memory_budget)
+
+    merged_idxs = best_idxs.clone()
+    merged_scores = best_scores.clone()
+
+    start_time = time.time()
+    for block_start in range(0, num_old, block_size):
+        block_end = min(block_start + block_size, num_old)
+        if verbose:
+            print(f"{block_start / num_old:.4%}", end="\r")
+
+        scores = torch.matmul(embeddings[block_start:block_end], new_embeddings.T)
+        new_scores, new_idxs = torch.topk(scores, min(k, num_new), dim=1)
+
+        # a new row only ends up in the list if it beats the current worst neighbour
+        candidate_scores = torch.cat(
+            [best_scores[block_start:block_end], new_scores], 1
+        )
+        candidate_idxs = torch.cat(
+            [best_idxs[block_start:block_end], new_idxs.to(torch.int32) + num_old], 1
+        )
+        top_scores, top_positions = torch.topk(candidate_scores, k, dim=1, sorted=True)
+
+        merged_scores[block_start:block_end] = top_scores
+        merged_idxs[block_start:block_end] = torch.gather(
+            candidate_idxs, 1, top_positions
+        )
+
+    if verbose:
+        print(f"Time taken: {time.time() - start_time:.2f}s")
+
+    return merged_idxs, merged_scores
+
+
+def hnsw_parameters(recall_target: float) -> tuple[int, int]:
+    # (M, ef_construction) of the HNSW graph
+    # a denser graph reaches a higher recall, but takes longer to build
+    if recall_target <= 0.9:
+        return 16, 100
+    if recall_target <= 0.95:
+        return 24, 200
+    return 32, 400
+
+
+def embeddings_fingerprint(embeddings: np.ndarray, chunk_rows: int = 65536) -> str:
+    # a hash of the vectors, read in chunks so a memory mapped matrix is never copied as a whole
+    sha1 = hashlib.sha1(f"{embeddings.dtype.str}{embeddings.shape}".encode())
+    for start in range(0, embeddings.shape[0], chunk_rows):
+        sha1.update(np.ascontiguousarray(embeddings[start : start + chunk_rows]).data)
+    return sha1.hexdigest()[:16]
+
+
+def build_hnsw_index(
+    embeddings: np.ndarray,
+    index_dir: str,
+    recall_target: float = 0.95,
+    verbose: bool = True,
+):
+    """Builds a HNSW index over the normalized embeddings or loads it from index_dir.
+
+    The file name holds a fingerprint of the embeddings, an index built from other vectors
+    is never loaded, even if it has the same number of rows.
+    """
+    # hnswlib is only needed for the ANN backend
+    import hnswlib
+
+    num_elements, dim = embeddings.shape
+    m, ef_construction = hnsw_parameters(recall_target)
+    prefix = f"hnsw_M{m}_ef{ef_construction}_"
+    index_path = os.path.join(
+        index_dir, f"{prefix}{embeddings_fingerprint(embeddings)}.bin"
+    )
+    index = hnswlib.Index(space="ip", dim=dim)
+
+    if os.path.exists(index_path):
+        index.load_index(index_path, max_elements=num_elements)
+        if index.get_current_count() == num_elements:
+            if verbose:
+                print(f"Loaded HNSW index from {index_path}")
+            return index
+        index = hnswlib.Index(space="ip", dim=dim)
+
+    if verbose:
+        print(f"Building HNSW index (M={m}, ef_construction={ef_construction})...")
+
+    start_time = time.time()
+    index.init_index(
+        max_elements=num_elements,
+        M=m,
+        ef_construction=ef_construction,
+        random_seed=42,
+    )
+    index.add_items(embeddings.astype(np.float32), np.arange(num_elements))
+    # indices of older embeddings, also the ones named without a fingerprint, are never loaded again
+    for fname in os.listdir(index_dir):
+        if (
+            fname.startswith(prefix) and fname.endswith(".bin")
+        ) or fname == f"hnsw_M{m}_ef{ef_construction}.bin":
+            os.remove(os.path.join(index_dir, fname))
+    index.save_index(index_path)
+
+    if verbose:
+        print(f"Built HNSW index in {time.time() - start_time:.2f}s")
+
+    return index
+
+
+def hnsw_top_k_neighbors(
+    index,
+    embeddings: np.ndarray,
+    k: int,
+    rows: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the approximate indices and scores of the k most similar rows for the given rows."""
+    if rows is None:
+        rows = np.arange(embeddings.shape[0])
+
+    labels, distances = index.knn_query(embeddings[rows].astype(np.float32), k=k + 1)
+
+    # unlike the exact search, the row itself is not guaranteed to be returned first
+    # drop it where it was found and the worst match everywhere else
+    drop = labels == rows[:, None]
+    drop[~drop.any(axis=1), -1] = True
+
+    best_idxs = labels[~drop].reshape(-1, k).astype(np.int32)
+    # the "ip" space of hnswlib returns 1 - dot product as the distance
+    best_scores = (1 - distances[~drop].reshape(-1, k)).astype(np.float16)
+    return best_idxs, best_scores
+
+
+def recall_at_k(
+    approx_idxs: np.ndarray,
+    exact_idxs: np.ndarray,
+    k: int = 10,
+) -> float:
+    hits = [
+        len(np.intersect1d(approx_row[:k], exact_row[:k]))
+        for approx_row, exact_row in zip(approx_idxs, exact_idxs)
+    ]
+    return float(np.mean(hits)) / k
+
+
+def tune_hnsw_ef(
+    index,
+    embeddings: np.ndarray,
+    exact_idxs: np.ndarray,
+    sample_rows: np.ndarray,
+    k: int,
+    recall_target: float,
+    max_ef: int = 2048,
+    verbose: bool = True,
+) -> tuple[int, float]:
+    """Raises ef until the recall@10 on the sample reaches the recall target."""
+    ef = k + 1
+    while True:
+        index.set_ef(ef)
+        approx_idxs, _ = hnsw_top_k_neighbors(index, embeddings, k, sample_rows)
+        recall = recall_at_k(approx_idxs, exact_idxs)
+        if verbose:
+            print(f"ef={ef}: recall@10={recall:.4f}")
+        if recall >= recall_target or ef >= max_ef:
+            return ef, recall
+        ef = min(ef * 2, max_ef)
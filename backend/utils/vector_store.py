@@ -0,0 +1,415 @@
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# A local collection is stored as a folder with these files
+# embeddings.npy: the normalized (N x dim) embeddings as float16 like in the corpus, every block is
+# converted to float32 when it is searched, float32 files take twice the memory but skip the conversion
+# half_norms.npy: half the squared norm of every row, which is only roughly 0.5 after the rounding
+# documents.bin + document_offsets.npy: the utf-8 abstracts back to back and their N + 1 offsets
+# metadata.parquet: the id and the Chroma metadata of every row
+# ivf.npz: an optional inverted file index, see train_ivf
+# with an index the embeddings and half norms are stored grouped by their list,
+# so every list is one contiguous slice and its rows are the original row of every position
+EMBEDDINGS_FILE = "embeddings.npy"
+HALF_NORMS_FILE = "half_norms.npy"
+DOCUMENTS_FILE = "documents.bin"
+OFFSETS_FILE = "document_offsets.npy"
+METADATA_FILE = "metadata.parquet"
+IVF_FILE = "ivf.npz"
+INFO_FILE = "info.json"
+# a collection is written to <name>.staging first
+STAGING_SUFFIX = ".staging"
+
+# rows per block of the exact search, 32k x 256 float16 values are 16 MiB
+BLOCK_ROWS = 2**15
+
+
+def top_k_rows(
+    scores: np.ndarray,
+    rows: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # scores and rows are (Q x n), keeps the k highest scores of every query in descending order
+    # ties are broken by the lower row
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        rows = np.take_along_axis(rows, part, axis=1)
+    order = np.lexsort((rows, -scores), axis=1)
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(
+        scores, order, axis=1
+    )
+
+
+def exact_search(
+    embeddings: np.ndarray,
+    half_norms: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    allowed: np.ndarray | None = None,
+    block_rows: int = BLOCK_ROWS,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the rows and scores q.x - |x|^2 / 2 of the k nearest rows of every query.
+
+    Ranking by this score is ranking by the L2 distance |q - x|^2 = |q|^2 - 2 * score.
+    The matrix is scanned in blocks, every block is converted to float32 for a single BLAS matrix product
+    and only one block of the memory map is touched at a time.
+    Rows outside of the boolean mask `allowed` are never returned, k must not exceed their number.
+    """
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(embeddings), block_rows):
+        block = np.asarray(embeddings[start : start + block_rows], dtype=np.float32)
+        scores = queries @ block.T - half_norms[start : start + len(block)]
+        if allowed is not None:
+            scores[:, ~allowed[start : start + len(block)]] = -np.inf
+        rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        block_rows_k, block_scores_k = top_k_rows(scores, rows, k)
+        best_rows, best_scores = top_k_rows(
+            np.concatenate([best_scores, block_scores_k], axis=1),
+            np.concatenate([best_rows, block_rows_k], axis=1),
+            k,
+        )
+    return best_rows, best_scores
+
+
+def train_ivf(
+    embeddings: np.ndarray,
+    num_lists: int,
+    sample_size: int = 100_000,
+    iterations: int = 10,
+    seed: int = 42,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Clusters the rows with spherical k-means into num_lists inverted lists.
+
+    Returns the normalized centroids, the offsets of the lists
+    and the rows sorted by their list, so list i holds rows[offsets[i]:offsets[i + 1]].
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(
+        len(embeddings), min(sample_size, len(embeddings)), replace=False
+    )
+    sample = np.asarray(embeddings[np.sort(sample)], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)]
+
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=num_lists)
+        # empty lists are restarted from a random sample
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), empty.sum(), replace=False)]
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+    assignment = np.concatenate(
+        [
+            np.argmax(
+                np.asarray(embeddings[start : start + BLOCK_ROWS], dtype=np.float32)
+                @ centroids.T,
+                axis=1,
+            )
+            for start in range(0, len(embeddings), BLOCK_ROWS)
+        ]
+    )
+    rows = np.argsort(assignment, kind="stable")
+    offsets = np.zeros(num_lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignment, minlength=num_lists))
+    return centroids, offsets, rows
+
+
+def write_collection(
+    collection_dir: str,
+    ids: list[str],
+    embeddings: np.ndarray,
+    documents: list[str],
+    metadatas: list[dict],
+    num_lists: int | None = None,
+    dtype: np.dtype = np.float16,
+) -> None:
+    """Writes a local collection, with an IVF index of num_lists lists if given.
+
+    The embeddings are rounded to float16 in any case, dtype only sets how they are stored.
+
+    The files are written to a staging folder first and then moved over the old ones,
+    so a server that still has the old files memory mapped keeps reading consistent data.
+    """
+    staging_dir = collection_dir + STAGING_SUFFIX
+    os.makedirs(staging_dir, exist_ok=True)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings.astype(np.float16).astype(dtype)
+
+    if num_lists is not None:
+        centroids, list_offsets, list_rows = train_ivf(embeddings, num_lists)
+        np.savez(
+            os.path.join(staging_dir, IVF_FILE),
+            centroids=centroids,
+            offsets=list_offsets,
+            rows=list_rows,
+        )
+        embeddings = embeddings[list_rows]
+
+    np.save(os.path.join(staging_dir, EMBEDDINGS_FILE), embeddings)
+    half_norms = 0.5 * np.square(embeddings.astype(np.float32)).sum(axis=1)
+    np.save(os.path.join(staging_dir, HALF_NORMS_FILE), half_norms)
+
+    encoded = [document.encode("utf-8") for document in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(document) for document in encoded])
+    with open(os.path.join(staging_dir, DOCUMENTS_FILE), "wb") as f:
+        f.writelines(encoded)
+    np.save(os.path.join(staging_dir, OFFSETS_FILE), offsets)
+
+    table = pa.Table.from_pylist(metadatas)
+    table = table.add_column(0, "id", pa.array(ids, type=pa.string()))
+    pq.write_table(table, os.path.join(staging_dir, METADATA_FILE))
+
+    with open(os.path.join(staging_dir, INFO_FILE), "w") as f:
+        json.dump({"count": len(ids), "dim": embeddings.shape[1]}, f)
+
+    os.makedirs(collection_dir, exist_ok=True)
+    ivf_path = os.path.join(collection_dir, IVF_FILE)
+    if num_lists is None and os.path.exists(ivf_path):
+        os.remove(ivf_path)
+    # info.json is moved last, a collection without it is not listed
+    for fname in sorted(os.listdir(staging_dir), key=lambda f: f == INFO_FILE):
+        os.replace(
+            os.path.join(staging_dir, fname), os.path.join(collection_dir, fname)
+        )
+    os.rmdir(staging_dir)
+
+
+class LocalCollection:
+    """A read-only collection that answers the query and get calls of a Chroma collection.
+
+    The embeddings and abstracts are memory mapped, only the ids and the metadata table
+    are held in memory. Distances are squared L2 distances like in Chroma.
+    With an IVF index only the nprobe lists closest to the query are searched,
+    probing all lists gives the exact results.
+    query_texts are embedded with the embedding_function, like in Chroma.
+    """
+
+    # the ids of a query only select the rows that are scored, a long list costs less than a search of all rows
+    cheap_id_filter = True
+
+    def __init__(
+        self,
+        name: str,
+        collection_dir: str,
+        nprobe: int = 16,
+        embedding_function=None,
+    ) -> None:
+        self.name = name
+        self.nprobe = nprobe
+        self.embedding_function = embedding_function
+        self.embeddings = np.load(
+            os.path.join(collection_dir, EMBEDDINGS_FILE), mmap_mode="r"
+        )
+        documents_path = os.path.join(collection_dir, DOCUMENTS_FILE)
+        # an empty file can not be memory mapped
+        self.documents = (
+            np.memmap(documents_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(documents_path) > 0
+            else np.zeros(0, dtype=np.uint8)
+        )
+        self.offsets = np.load(os.path.join(collection_dir, OFFSETS_FILE))
+        self.half_norms = np.load(os.path.join(collection_dir, HALF_NORMS_FILE))
+        self.metadata = pq.read_table(os.path.join(collection_dir, METADATA_FILE))
+        self.ids = self.metadata.column("id").to_pylist()
+        self.metadata = self.metadata.drop(["id"])
+        self.rows = {id: row for row, id in enumerate(self.ids)}
+
+        self.ivf = None
+        # the row of every stored embedding and the inverse, the stored position of every row
+        self.order = None
+        self.positions = None
+        ivf_path = os.path.join(collection_dir, IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self.ivf = {key: ivf[key] for key in ivf.files}
+            self.order = self.ivf["rows"]
+            self.positions = np.argsort(self.order)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        allowed_rows: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the rows and scores of the k nearest rows of every query, see exact_search.
+
+        With the boolean mask allowed_rows only these rows are searched. A selective filter
+        is answered by scoring its rows directly, which is exact and faster than any index.
+        """
+        allowed = allowed_rows
+        if allowed is not None and self.order is not None:
+            allowed = allowed[self.order]
+        num_allowed = len(self.ids) if allowed is None else int(allowed.sum())
+        k = min(k, num_allowed)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty
+
+        if num_allowed <= BLOCK_ROWS and allowed is not None:
+            positions = np.flatnonzero(allowed)
+            block = np.asarray(self.embeddings[positions], dtype=np.float32)
+            scores = queries @ block.T - self.half_norms[positions]
+            best_positions, best_scores = top_k_rows(
+                scores, np.broadcast_to(positions, scores.shape), k
+            )
+        elif self.ivf is None:
+            best_positions, best_scores = exact_search(
+                self.embeddings, self.half_norms, queries, k, allowed
+            )
+        else:
+            return self.ivf_search(queries, k, allowed)
+
+        if self.order is not None:
+            return self.order[best_positions], best_scores
+        return best_positions, best_scores
+
+    def ivf_search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        allowed: np.ndarray | None = None,
+    ) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        # a query can get less than k rows if the probed lists hold less allowed rows
+        centroids, offsets = self.ivf["centroids"], self.ivf["offsets"]
+        nprobe = min(self.nprobe, len(centroids))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)
+        best_rows, best_scores = [], []
+        for query, query_probes in zip(queries, probes[:, :nprobe]):
+            lists = [slice(offsets[p], offsets[p + 1]) for p in query_probes]
+            scores = np.concatenate(
+                [
+                    np.asarray(self.embeddings[s], dtype=np.float32) @ query
+                    - self.half_norms[s]
+                    for s in lists
+                ]
+            )
+            positions = np.concatenate([np.arange(s.start, s.stop) for s in lists])
+            if allowed is not None:
+                keep = allowed[positions]
+                scores, positions = scores[keep], positions[keep]
+            query_rows, query_scores = top_k_rows(
+                scores[None, :], self.order[positions][None, :], k
+            )
+            best_rows.append(query_rows[0])
+            best_scores.append(query_scores[0])
+        return best_rows, best_scores
+
+    def document(self, row: int) -> str:
+        return bytes(self.documents[self.offsets[row] : self.offsets[row + 1]]).decode(
+            "utf-8"
+        )
+
+    def _rows_include(self, rows, include: list[str]) -> dict:
+        rows = list(rows)
+        results = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            results["documents"] = [self.document(row) for row in rows]
+        if "metadatas" in include:
+            results["metadatas"] = self.metadata.take(
+                pa.array(rows, type=pa.int64())
+            ).to_pylist()
+        if "embeddings" in include:
+            positions = rows if self.positions is None else self.positions[rows]
+            results["embeddings"] = np.asarray(
+                self.embeddings[positions], dtype=np.float32
+            )
+        return results
+
+    def query(
+        self,
+        query_embeddings=None,
+        query_texts: list[str] | None = None,
+        n_results: int = 10,
+        include: list[str] = ["metadatas", "documents", "distances"],
+        ids: list[str] | None = None,
+        **kwargs,
+    ) -> dict:
+        """Like in Chroma, only the rows in ids are searched if given."""
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("Either query_embeddings or query_texts is needed")
+            if self.embedding_function is None:
+                raise ValueError(
+                    f"Collection {self.name} has no embedding function for query_texts"
+                )
+            query_embeddings = self.embedding_function(query_texts)
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(
+            len(query_embeddings), -1
+        )
+        allowed_rows = None
+        if ids is not None:
+            allowed_rows = np.zeros(len(self.ids), dtype=bool)
+            allowed_rows[[self.rows[id] for id in ids if id in self.rows]] = True
+        best_rows, best_scores = self.search(queries, n_results, allowed_rows)
+
+        results = {key: [] for key in ["ids", *include]}
+        for query, rows, scores in zip(queries, best_rows, best_scores):
+            for key, value in self._rows_include(rows, include).items():
+                results[key].append(value)
+            if "distances" in include:
+                scores = np.asarray(scores, dtype=np.float64)
+                results["distances"].append(
+                    (float(query @ query) - 2 * scores).tolist()
+                )
+        return results
+
+    def get(
+        self,
+        ids: str | list[str] | None = None,
+        include: list[str] = ["metadatas", "documents"],
+        limit: int | None = None,
+        offset: int = 0,
+        **kwargs,
+    ) -> dict:
+        if ids is None:
+            end = len(self.ids) if limit is None else offset + limit
+            rows = range(min(offset, len(self.ids)), min(end, len(self.ids)))
+        else:
+            ids = [ids] if isinstance(ids, str) else ids
+            rows = [self.rows[id] for id in ids if id in self.rows]
+        return self._rows_include(rows, include)
+
+
+class LocalVectorStore:
+    """Serves the collections in the subfolders of store_dir with the client API of Chroma."""
+
+    def __init__(
+        self,
+        store_dir: str,
+        nprobe: int = 16,
+    ) -> None:
+        self.store_dir = store_dir
+        self.nprobe = nprobe
+        os.makedirs(store_dir, exist_ok=True)
+
+    def list_collections(self) -> list[str]:
+        return sorted(
+            name
+            for name in os.listdir(self.store_dir)
+            if not name.endswith(STAGING_SUFFIX)
+            and os.path.exists(os.path.join(self.store_dir, name, INFO_FILE))
+        )
+
+    def get_collection(
+        self,
+        name: str,
+        embedding_function=None,
+        **kwargs,
+    ) -> LocalCollection:
+        collection_dir = os.path.join(self.store_dir, name)
+        if not os.path.exists(os.path.join(collection_dir, INFO_FILE)):
+            raise ValueError(f"Collection {name} does not exist.")
+        return LocalCollection(name, collection_dir, self.nprobe, embedding_function)
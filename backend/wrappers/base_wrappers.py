@@ -0,0 +1,29 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class Reranker(ABC):
+    """Scores documents by their relevance to a query, higher is more relevant.
+
+    doc_ids are optional and only used by rerankers that cache their scores.
+    """
+
+    @abstractmethod
+    def __call__(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]: ...
+
+    async def rerank_async(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]:
+        # rerankers without an async client score in a worker thread
+        return await asyncio.to_thread(self, query, documents, doc_ids)
+
+    def close(self) -> None:
+        pass
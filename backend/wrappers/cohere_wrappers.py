@@ -2,9 +2,12 @@ import os
 from typing import Literal
 
 import cohere
+import httpx
 
+from wrappers.base_wrappers import Reranker
 
-class Cohere_Reranker:
+
+class Cohere_Reranker(Reranker):
     def __init__(
         self,
         api_key: str | None = None,
@@ -14,6 +17,7 @@ class Cohere_Reranker:
             "rerank-multilingual-v2.0",
             "rerank-multilingual-v3.0",
         ] = "rerank-multilingual-v3.0",
+        http_client: httpx.AsyncClient | None = None,
     ) -> None:
         if api_key is None:
             api_key = os.environ.get("COHERE_API_KEY", None)
@@ -23,12 +27,18 @@ class Cohere_Reranker:
                 "api_key must be provided as an argument or in the environment variable COHERE_API_KEY"
             )
         self.client = cohere.Client(api_key=api_key)
+        # the async client reuses the connections of a shared pool if one is given
+        self.async_client = cohere.AsyncClient(
+            api_key=api_key,
+            httpx_client=http_client,
+        )
         self.rerank_model = rerank_model
 
     def __call__(
         self,
         query: str,
         documents: list[str],
+        doc_ids: list[str] | None = None,
     ) -> list[float]:
         if len(documents) < 2:
             return [1.0 for _ in documents]
@@ -39,7 +49,28 @@ class Cohere_Reranker:
             documents=documents,
             return_documents=False,
         )
-        scores = [0.0] * len(documents)
+        return self.scores(response, len(documents))
+
+    async def rerank_async(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]:
+        if len(documents) < 2:
+            return [1.0 for _ in documents]
+
+        response = await self.async_client.rerank(
+            model=self.rerank_model,
+            query=query,
+            documents=documents,
+            return_documents=False,
+        )
+        return self.scores(response, len(documents))
+
+    @staticmethod
+    def scores(response, num_documents: int) -> list[float]:
+        scores = [0.0] * num_documents
         for res in response.results:
             scores[res.index] = res.relevance_score
 
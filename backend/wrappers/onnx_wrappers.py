@@ -0,0 +1,226 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from utils.embedding_cache import normalize_text
+from wrappers.base_wrappers import Reranker
+
+# every worker process holds its own session and tokenizer
+_session = None
+_tokenizer = None
+
+
+def _init_worker(model_dir: str, max_tokens: int, num_threads: int) -> None:
+    # onnxruntime and tokenizers are only needed for the local reranker
+    import onnxruntime
+    from tokenizers import Tokenizer
+
+    global _session, _tokenizer
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = num_threads
+    _session = onnxruntime.InferenceSession(
+        os.path.join(model_dir, "model.onnx"),
+        options,
+        providers=["CPUExecutionProvider"],
+    )
+    _tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    # only the document is cut, so the query is always seen completely
+    _tokenizer.enable_truncation(max_length=max_tokens, strategy="only_second")
+    _tokenizer.enable_padding()
+
+
+def _score_pairs(query: str, documents: list[str]) -> np.ndarray:
+    encodings = _tokenizer.encode_batch([(query, document) for document in documents])
+    features = {
+        "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+        "attention_mask": np.array(
+            [e.attention_mask for e in encodings], dtype=np.int64
+        ),
+        "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+    }
+    inputs = {
+        node.name: features[node.name]
+        for node in _session.get_inputs()
+        if node.name in features
+    }
+    logits = _session.run(None, inputs)[0].reshape(len(documents), -1)[:, -1]
+    # the logits are mapped to (0, 1), like the relevance scores of Cohere
+    return 1 / (1 + np.exp(-logits.astype(np.float64)))
+
+
+class CrossEncoder_Reranker(Reranker):
+    """Reranks with a cross-encoder exported to ONNX, running on the CPU in a pool of processes.
+
+    model_dir has to contain a model.onnx and the matching tokenizer.json,
+    e.g. an export of cross-encoder/ms-marco-MiniLM-L-6-v2.
+    The documents of a query are split into batches of similar length that are scored in parallel.
+    Scores are cached by (model, query, doc_id) if the caller passes doc_ids.
+    A pool whose worker died, e.g. killed for its memory, is replaced and the query is scored again once.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_tokens: int = 256,
+        batch_size: int = 32,
+        num_workers: int = 2,
+        threads_per_worker: int = 1,
+        cache_size: int = 100_000,
+    ) -> None:
+        for fname in ["model.onnx", "tokenizer.json"]:
+            if not os.path.exists(os.path.join(model_dir, fname)):
+                raise FileNotFoundError(f"{fname} not found in {model_dir}")
+
+        self.model_dir = model_dir
+        self.max_tokens = max_tokens
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool, self.model_key = self._new_pool()
+
+    def _new_pool(self) -> tuple[ProcessPoolExecutor, str]:
+        # a new export in model_dir is picked up by new workers, so it must not hit the scores of the old one
+        stat = os.stat(os.path.join(self.model_dir, "model.onnx"))
+        model_key = (
+            f"{os.path.realpath(self.model_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+        )
+        # spawned workers do not inherit the threads and sockets of the server
+        pool = ProcessPoolExecutor(
+            self.num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_dir, self.max_tokens, self.threads_per_worker),
+        )
+        return pool, model_key
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self.lock:
+            # concurrent queries see the same broken pool, only the first one replaces it
+            if self.pool is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool, self.model_key = self._new_pool()
+
+    def _current(self) -> tuple[ProcessPoolExecutor, str]:
+        # the pool and the key of its model, read together as _replace_pool swaps both
+        with self.lock:
+            return self.pool, self.model_key
+
+    def _split(
+        self,
+        model_key: str,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None,
+    ) -> tuple[np.ndarray, list[int], list[list[int]]]:
+        # returns the scores found in the cache and the batches of the missing documents
+        scores = np.zeros(len(documents))
+        missing = list(range(len(documents)))
+        if doc_ids is not None and self.cache_size > 0:
+            query = normalize_text(query)
+            missing = []
+            with self.lock:
+                for i, doc_id in enumerate(doc_ids):
+                    key = (model_key, query, doc_id)
+                    score = self.cache.get(key)
+                    if score is None:
+                        missing.append(i)
+                    else:
+                        self.cache.move_to_end(key)
+                        scores[i] = score
+
+        # documents of similar length share a batch, which keeps the padding small
+        missing.sort(key=lambda i: len(documents[i]))
+        batches = [
+            missing[start : start + self.batch_size]
+            for start in range(0, len(missing), self.batch_size)
+        ]
+        return scores, missing, batches
+
+    def _remember(
+        self,
+        model_key: str,
+        query: str,
+        doc_ids: list[str] | None,
+        scores: np.ndarray,
+        missing: list[int],
+    ) -> None:
+        if doc_ids is None or self.cache_size <= 0:
+            return
+        query = normalize_text(query)
+        with self.lock:
+            for i in missing:
+                self.cache[(model_key, query, doc_ids[i])] = float(scores[i])
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def __call__(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]:
+        for attempt in range(2):
+            # a replaced pool may run a new model, so its scores are looked up again
+            pool, model_key = self._current()
+            scores, missing, batches = self._split(model_key, query, documents, doc_ids)
+            try:
+                futures = [
+                    (
+                        batch,
+                        pool.submit(_score_pairs, query, [documents[i] for i in batch]),
+                    )
+                    for batch in batches
+                ]
+                for batch, future in futures:
+                    scores[batch] = future.result()
+                break
+            except BrokenProcessPool:
+                if attempt == 1:
+                    raise
+                self._replace_pool(pool)
+        self._remember(model_key, query, doc_ids, scores, missing)
+        return scores.tolist()
+
+    async def rerank_async(
+        self,
+        query: str,
+        documents: list[str],
+        doc_ids: list[str] | None = None,
+    ) -> list[float]:
+        for attempt in range(2):
+            # a replaced pool may run a new model, so its scores are looked up again
+            pool, model_key = self._current()
+            scores, missing, batches = self._split(model_key, query, documents, doc_ids)
+            try:
+                batch_scores = await asyncio.gather(
+                    *[
+                        asyncio.wrap_future(
+                            pool.submit(
+                                _score_pairs, query, [documents[i] for i in batch]
+                            )
+                        )
+                        for batch in batches
+                    ]
+                )
+                break
+            except BrokenProcessPool:
+                if attempt == 1:
+                    raise
+                self._replace_pool(pool)
+        for batch, result in zip(batches, batch_scores):
+            scores[batch] = result
+        self._remember(model_key, query, doc_ids, scores, missing)
+        return scores.tolist()
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,24 @@
+import asyncio
 import os
+import random
 import time
-from typing import Literal
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Literal
 
 import chromadb
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+from utils.embedding_cache import EmbeddingCache
+from utils.rate_limiter import TokenBucket
+
+# rate limits, server errors and dropped connections are worth another try
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
 
 
 class OpenAI_Embedding(chromadb.EmbeddingFunction):
@@ -17,6 +32,11 @@ class OpenAI_Embedding(chromadb.EmbeddingFunction):
         max_chunks_per_call: int = 2048,
         dim: int = -1,
         verbose: bool = True,
+        cache: EmbeddingCache | None = None,
+        max_concurrent_requests: int = 1,
+        tokens_per_minute: int | None = None,
+        max_retries: int = 5,
+        http_client: httpx.AsyncClient | None = None,
     ):
         if api_key is None:
             api_key = os.environ.get("OPENAI_API_KEY", None)
@@ -26,10 +46,27 @@ class OpenAI_Embedding(chromadb.EmbeddingFunction):
                 "api_key must be provided as an argument or in the environment variable OPENAI_API_KEY"
             )
 
-        self.client = OpenAI(api_key=api_key)
+        # retries are handled per chunk in embed_chunk
+        self.client = OpenAI(api_key=api_key, max_retries=0)
+        # the async client reuses the connections of a shared pool if one is given
+        self.async_client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=http_client,
+        )
         self.embedding_model = embedding_model
         self.dim = dim
         self.verbose = verbose
+        self.cache = cache
+        self.max_concurrent_requests = max_concurrent_requests
+        self.max_retries = max_retries
+        self.token_bucket = None
+        if tokens_per_minute is not None:
+            # allow a burst of up to one minute of tokens
+            self.token_bucket = TokenBucket(
+                rate=tokens_per_minute / 60,
+                capacity=tokens_per_minute,
+            )
         if max_chunks_per_call > 2048:
             raise ValueError(
                 f"max_chunks_per_call must be <= 2048, got {max_chunks_per_call}, OpenAI will only accept up to 2048 inputs per chunk."
@@ -41,32 +78,204 @@ class OpenAI_Embedding(chromadb.EmbeddingFunction):
         input_list: list[str],
         sleep_time: int = 0,
     ) -> chromadb.Embeddings:
+        if self.cache is None:
+            return self.embed(input_list, sleep_time)
+
+        keys = [
+            EmbeddingCache.make_key(self.embedding_model, self.dim, text)
+            for text in input_list
+        ]
+        embeddings = self.cache.get_many(keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if self.verbose:
+            print(
+                f"Found {len(input_list) - len(missing)} of {len(input_list)} embeddings in the cache"
+            )
+
+        # only the texts that are not cached are sent to the API
+        # every finished chunk is written to the cache right away,
+        # so a failed run only has to redo the chunks that did not finish
+        def cache_chunk(start: int, chunk_embeddings: chromadb.Embeddings) -> None:
+            chunk_keys = [
+                keys[i] for i in missing[start : start + len(chunk_embeddings)]
+            ]
+            self.cache.put_many(chunk_keys, chunk_embeddings)
+
+        if missing:
+            new_embeddings = self.embed(
+                [input_list[i] for i in missing],
+                sleep_time,
+                on_chunk_done=cache_chunk,
+            )
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+
+        return [
+            embedding if isinstance(embedding, list) else embedding.tolist()
+            for embedding in embeddings
+        ]
+
+    async def embed_async(
+        self,
+        input_list: list[str],
+    ) -> chromadb.Embeddings:
+        """Embeds the input list without blocking the event loop, going through the cache if set.
+
+        Meant for short request-time inputs, all chunks are sent at once.
+        """
+        keys = [
+            EmbeddingCache.make_key(self.embedding_model, self.dim, text)
+            for text in input_list
+        ]
+        embeddings = [None] * len(input_list)
+        # the cache reads and appends files and waits for the lock of other writers, so it runs on a thread
+        if self.cache is not None:
+            embeddings = await asyncio.to_thread(self.cache.get_many, keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            missing_texts = [input_list[i] for i in missing]
+            chunks = await asyncio.gather(
+                *[
+                    self.embed_chunk_async(missing_texts, i)
+                    for i in range(0, len(missing_texts), self.max_chunks_per_call)
+                ]
+            )
+            new_embeddings = [embedding for chunk in chunks for embedding in chunk]
+            if self.cache is not None:
+                await asyncio.to_thread(
+                    self.cache.put_many, [keys[i] for i in missing], new_embeddings
+                )
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+
+        return [
+            embedding if isinstance(embedding, list) else embedding.tolist()
+            for embedding in embeddings
+        ]
+
+    def embed(
+        self,
+        input_list: list[str],
+        sleep_time: int = 0,
+        on_chunk_done: Callable[[int, chromadb.Embeddings], None] | None = None,
+    ) -> chromadb.Embeddings:
+        """Embeds the input list chunk by chunk.
+
+        on_chunk_done is called with the start index and the embeddings of every finished chunk,
+        so callers can persist them before the remaining chunks are done.
+        With max_concurrent_requests > 1 several chunks are in flight at once and a failed chunk
+        does not stop the others, the error is raised once all chunks are done.
+        """
+        chunk_starts = list(range(0, len(input_list), self.max_chunks_per_call))
+        chunk_embeddings = {}
+
+        if self.max_concurrent_requests == 1:
+            for i in chunk_starts:
+                chunk_embeddings[i] = self.embed_chunk(input_list, i)
+                if on_chunk_done is not None:
+                    on_chunk_done(i, chunk_embeddings[i])
+                if i + self.max_chunks_per_call < len(input_list):
+                    time.sleep(sleep_time)
+        else:
+            failed_chunks = []
+            with ThreadPoolExecutor(self.max_concurrent_requests) as executor:
+                futures = {
+                    executor.submit(self.embed_chunk, input_list, i): i
+                    for i in chunk_starts
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        chunk_embeddings[i] = future.result()
+                    except Exception as e:
+                        print(f"Chunk {i} failed: {e}")
+                        failed_chunks.append(i)
+                        continue
+                    if on_chunk_done is not None:
+                        on_chunk_done(i, chunk_embeddings[i])
+
+            if failed_chunks:
+                raise RuntimeError(
+                    f"{len(failed_chunks)} of {len(chunk_starts)} chunks failed, starting at {sorted(failed_chunks)}"
+                )
+
         embeddings = []
-        for i in range(0, len(input_list), self.max_chunks_per_call):
-            if i + self.max_chunks_per_call > len(input_list):
-                if self.verbose:
-                    print(f"Processing chunk {i} to {len(input_list)} (last chunk)")
-                chunk = input_list[i:]
-            else:
+        for i in chunk_starts:
+            embeddings.extend(chunk_embeddings[i])
+        return embeddings
+
+    def embed_chunk(
+        self,
+        input_list: list[str],
+        i: int,
+    ) -> chromadb.Embeddings:
+        if i + self.max_chunks_per_call > len(input_list):
+            if self.verbose:
+                print(f"Processing chunk {i} to {len(input_list)} (last chunk)")
+            chunk = input_list[i:]
+        else:
+            if self.verbose:
+                print(
+                    f"Processing chunk {i} to {i + self.max_chunks_per_call} of {len(input_list)}"
+                )
+            chunk = input_list[i : i + self.max_chunks_per_call]
+
+        if self.token_bucket is not None:
+            # roughly 4 characters per token for English text
+            self.token_bucket.acquire(sum(len(text) for text in chunk) / 4)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                embedding = self.client.embeddings.create(
+                    input=chunk,
+                    model=self.embedding_model,
+                )
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                # exponential backoff with jitter, so parallel chunks do not retry in lockstep
+                wait_time = min(60, 2**attempt) * random.uniform(0.5, 1.5)
                 if self.verbose:
                     print(
-                        f"Processing chunk {i} to {i + self.max_chunks_per_call} of {len(input_list)}"
-                    )
-                chunk = input_list[i : i + self.max_chunks_per_call]
-            embedding = self.client.embeddings.create(
-                input=chunk,
-                model=self.embedding_model,
-            )
-            embeddings.extend(
-                [
-                    (
-                        embedding.data[i].embedding[: self.dim]
-                        if self.dim > 0
-                        else embedding.data[i].embedding
+                        f"Chunk {i}: {type(e).__name__}, retrying in {wait_time:.1f}s"
                     )
-                    for i in range(len(embedding.data))
-                ]
+                time.sleep(wait_time)
+
+        return self.truncate(embedding)
+
+    async def embed_chunk_async(
+        self,
+        input_list: list[str],
+        i: int,
+    ) -> chromadb.Embeddings:
+        chunk = input_list[i : i + self.max_chunks_per_call]
+
+        if self.token_bucket is not None:
+            await self.token_bucket.acquire_async(sum(len(text) for text in chunk) / 4)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                embedding = await self.async_client.embeddings.create(
+                    input=chunk,
+                    model=self.embedding_model,
+                )
+                break
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                wait_time = min(60, 2**attempt) * random.uniform(0.5, 1.5)
+                await asyncio.sleep(wait_time)
+
+        return self.truncate(embedding)
+
+    def truncate(self, embedding) -> chromadb.Embeddings:
+        return [
+            (
+                embedding.data[i].embedding[: self.dim]
+                if self.dim > 0
+                else embedding.data[i].embedding
             )
-            if i + self.max_chunks_per_call < len(input_list):
-                time.sleep(sleep_time)
-        return embeddings
+            for i in range(len(embedding.data))
+        ]